@@ -0,0 +1,51 @@
+import argparse
+import joblib
+import numpy as np
+
+# The API modules use flat imports, so run this with PYTHONPATH=src/api.
+from encoder import canary_laps, compile_preprocessor
+from predictors import build_native_predictor, time_predictor, TreeEnsemblePredictor
+from tree_ensemble import compile_tree_ensemble
+
+# --- Configuration ---
+BATCH_SIZES = [1, 60, 10000]
+
+def run_benchmark(model_path: str, preprocessor_path: str, repeats: int):
+    """
+    Compares the compiled tree-ensemble evaluator with the model's native predict
+    for single laps, a full race and a large optimizer-sized batch.
+    """
+    print(f"Loading artifacts: {model_path}, {preprocessor_path}")
+    model = joblib.load(model_path)
+    preprocessor = joblib.load(preprocessor_path)
+
+    encoder = compile_preprocessor(preprocessor)
+    if encoder is None:
+        raise RuntimeError("The preprocessor could not be compiled; benchmark needs the fast encoder.")
+
+    ensemble = compile_tree_ensemble(model)
+    if ensemble is None:
+        raise RuntimeError(f"{type(model).__name__} cannot be compiled into a tree ensemble.")
+
+    native = build_native_predictor(model, n_threads=0)
+    compiled = TreeEnsemblePredictor(ensemble)
+    print(f"Model: {type(model).__name__} with {ensemble.n_trees} trees, max depth {ensemble.max_depth}")
+
+    sample_laps = canary_laps(encoder)
+    print(f"\n{'batch':>8} {native.name + ' (ms)':>32} {compiled.name + ' (ms)':>32} {'speedup':>8} {'max abs diff':>13}")
+    for batch_size in BATCH_SIZES:
+        laps = (sample_laps * (batch_size // len(sample_laps) + 1))[:batch_size]
+        features = encoder.transform(laps)
+
+        max_diff = float(np.max(np.abs(native.predict(features) - compiled.predict(features))))
+        native_ms = time_predictor(native, features, repeats)
+        compiled_ms = time_predictor(compiled, features, repeats)
+        print(f"{batch_size:>8} {native_ms:>32.4f} {compiled_ms:>32.4f} {native_ms / compiled_ms:>7.2f}x {max_diff:>13.2e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark native vs compiled tree-ensemble prediction.")
+    parser.add_argument("--model", default="model.joblib", help="Path to the joblib model artifact.")
+    parser.add_argument("--preprocessor", default="preprocessor.joblib", help="Path to the joblib preprocessor artifact.")
+    parser.add_argument("--repeats", type=int, default=10, help="Timed repetitions per batch size (best is reported).")
+    args = parser.parse_args()
+    run_benchmark(args.model, args.preprocessor, args.repeats)
@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+import yaml
+
+# The API modules use flat imports, so run this with PYTHONPATH=src/api from the repository
+# root. The table is predicted through the API's own simulator code, so it holds exactly
+# what the API would serve for the model (track shards included).
+from lap_table import LAP_TABLE_FORMAT, LapTimeTable
+from model_loader import LAP_TABLE_DIR, _mlflow_client, model_loader
+from simulator import ModelBundle, simulator
+from track_config import TRACK_CONFIG, get_track_settings
+from track_shards import load_track_shards
+
+# --- Configuration ---
+PARAMS_FILE = "params.yaml"
+DEFAULT_CHECK_SAMPLES = 20000
+# Seconds; the 99th percentile table error that fails the build (the curves' default bound, too).
+DEFAULT_MAX_ERROR = 0.5
+
+def load_table_spec(params_path: str) -> dict:
+    """
+    Reads the 'lookup_table' section of params.yaml and adds the tracks and race distances
+    of the API's track config.
+    """
+    with open(params_path) as f:
+        spec = dict(yaml.safe_load(f)["lookup_table"])
+    if len(spec["air_temps"]) < 2 or len(spec["track_temps"]) < 2:
+        raise ValueError("'air_temps' and 'track_temps' need at least two points each to interpolate between.")
+    spec["air_temps"] = sorted(float(temp) for temp in spec["air_temps"])
+    spec["track_temps"] = sorted(float(temp) for temp in spec["track_temps"])
+    spec["max_lapnumbers"] = {
+        track: int(get_track_settings(track)["total_laps"]) + int(spec.get("extra_laps", 0))
+        for track in sorted(TRACK_CONFIG.get("tracks", {}))
+    }
+    return spec
+
+def load_bundle(args) -> ModelBundle:
+    """
+    Loads the model the table is built for: a registered version, or local artifacts.
+    """
+    if args.model and args.preprocessor:
+        import joblib
+        bundle = ModelBundle(joblib.load(args.model), joblib.load(args.preprocessor),
+                             model_version=os.path.basename(args.model), source="file")
+    else:
+        artifacts = model_loader.fetch_model(args.reference)
+        bundle = ModelBundle(
+            artifacts["model"], artifacts["preprocessor"], artifacts["model_version"],
+            run_id=artifacts["run_id"], source="registry",
+            shards=load_track_shards(model_loader, artifacts["run_id"], artifacts["model_version"])
+        )
+    if bundle.shards is not None:
+        bundle.shards.max_loaded = len(bundle.shards.shards) # Every track is visited; keep them all
+    bundle.warm_up()
+    return bundle
+
+def build_table(bundle: ModelBundle, spec: dict, output_dir: str) -> dict:
+    """
+    Predicts every (track, driver, compound) on the temperature grid, for each whole tyre
+    life up to max_tyrelife and lap number up to the track's race distance, into
+    output_dir/times.npy. Returns the table's index (written by the caller).
+
+    times.npy has shape (races, air temps, track temps, max_tyrelife + 1, laps + 1) and is
+    indexed with 1-based tyre life and lap numbers; cells that no race reaches are NaN.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    slabs = [(track, driver, compound) for track in spec["max_lapnumbers"] for driver in spec["drivers"]
+             for compound in spec["compounds"]]
+    max_tyrelife = int(spec["max_tyrelife"])
+    shape = (len(slabs), len(spec["air_temps"]), len(spec["track_temps"]), max_tyrelife + 1,
+             max(spec["max_lapnumbers"].values()) + 1)
+    print(f"Building a {shape} table ({np.prod(shape) * 4 / 1e6:.1f} MB) for model version {bundle.model_version}...")
+    times = np.lib.format.open_memmap(os.path.join(output_dir, "times.npy"), mode="w+", dtype=np.float32, shape=shape)
+    times[:] = np.nan
+
+    started = time.perf_counter()
+    # One predict call per track and driver: every compound, weather and lap of their race.
+    for first_slab in range(0, len(slabs), len(spec["compounds"])):
+        track, driver, _ = slabs[first_slab]
+        laps, index = [], []
+        for slab in range(first_slab, first_slab + len(spec["compounds"])):
+            for air, airtemp in enumerate(spec["air_temps"]):
+                for track_index, tracktemp in enumerate(spec["track_temps"]):
+                    for lap_number in range(1, spec["max_lapnumbers"][track] + 1):
+                        for tyre_life in range(1, min(lap_number, max_tyrelife) + 1):
+                            laps.append({
+                                "track": track, "driver": driver, "year": spec["year"], "compound": slabs[slab][2],
+                                "tyrelife": float(tyre_life), "lapnumber": float(lap_number),
+                                "airtemp": airtemp, "tracktemp": tracktemp,
+                            })
+                            index.append((slab, air, track_index, tyre_life, lap_number))
+        slab_idx, air_idx, track_idx, tyre_idx, lap_idx = np.array(index).T
+        times[slab_idx, air_idx, track_idx, tyre_idx, lap_idx] = simulator._predict_rows(bundle, laps)
+    times.flush()
+    print(f"Predicted {np.isfinite(times).sum()} cells in {time.perf_counter() - started:.1f}s.")
+
+    return {
+        "format": LAP_TABLE_FORMAT,
+        "model_version": bundle.model_version,
+        "run_id": bundle.run_id,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "year": int(spec["year"]),
+        "air_temps": spec["air_temps"],
+        "track_temps": spec["track_temps"],
+        "max_tyrelife": max_tyrelife,
+        "max_lapnumbers": spec["max_lapnumbers"],
+        "slabs": {"|".join(key): slab for slab, key in enumerate(slabs)},
+        "track_shards": bundle.shards is not None,
+    }
+
+def check_accuracy(bundle: ModelBundle, index: dict, output_dir: str, samples: int, seed: int) -> dict:
+    """
+    Compares table lookups with direct predictions on random laps at random temperatures
+    between the grid points (the slider's 0.1 degree steps), through the API's LapTimeTable.
+    """
+    table = LapTimeTable(index, np.load(os.path.join(output_dir, "times.npy"), mmap_mode="r"))
+    rng = np.random.default_rng(seed)
+    keys = list(table.slabs)
+    laps, looked_up = [], np.empty(samples)
+    for sample in range(samples):
+        track, driver, compound = keys[int(rng.integers(len(keys)))]
+        lap_number = int(rng.integers(1, table.max_lapnumbers[track] + 1))
+        lap = {
+            "track": track, "driver": driver, "year": table.year, "compound": compound,
+            "tyrelife": float(rng.integers(1, min(lap_number, table.max_tyrelife) + 1)), "lapnumber": float(lap_number),
+            "airtemp": round(float(rng.uniform(table.air_temps[0], table.air_temps[-1])), 1),
+            "tracktemp": round(float(rng.uniform(table.track_temps[0], table.track_temps[-1])), 1),
+        }
+        slab = table.find(lap, compound)
+        looked_up[sample] = table.evaluate(slab, [lap["tyrelife"]], [lap["lapnumber"]], lap["airtemp"], lap["tracktemp"])[0]
+        laps.append(lap)
+
+    differences = looked_up - simulator._predict_rows(bundle, laps)
+    errors = np.abs(differences)
+    return {
+        "samples": samples,
+        "mean_error": round(float(differences.mean()), 4), # A bias adds up over a race
+        "mean_abs_error": round(float(errors.mean()), 4),
+        "p99_abs_error": round(float(np.percentile(errors, 99)), 4),
+        "max_abs_error": round(float(errors.max()), 4),
+    }
+
+def build(args) -> int:
+    spec = load_table_spec(args.params)
+    bundle = load_bundle(args)
+    index = build_table(bundle, spec, args.output_dir)
+
+    index["accuracy"] = check_accuracy(bundle, index, args.output_dir, args.check_samples, args.seed)
+    with open(os.path.join(args.output_dir, "index.json"), "w") as f:
+        json.dump(index, f, indent=2)
+    print(f"Table error against the model: {index['accuracy']}")
+    if index["accuracy"]["p99_abs_error"] > args.max_error:
+        print(f"The 99th percentile error is above {args.max_error}s. Add temperature points or raise --max-error.")
+        return 1
+
+    if args.no_log or bundle.run_id is None:
+        print(f"Table written to {args.output_dir} (not logged).")
+        return 0
+    # Logged into the model's own run, so the table is versioned (and cached) with the model.
+    _mlflow_client().log_artifacts(bundle.run_id, args.output_dir, artifact_path=LAP_TABLE_DIR)
+    print(f"Table logged to run {bundle.run_id} under {LAP_TABLE_DIR}/.")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute a registered model's lap times into a memory-mappable table.")
+    parser.add_argument("--reference", default="production", help="Registry alias or version number of the model.")
+    parser.add_argument("--model", help="Joblib model artifact to use instead of the registry (implies --no-log).")
+    parser.add_argument("--preprocessor", help="Joblib preprocessor artifact to use with --model.")
+    parser.add_argument("--params", default=PARAMS_FILE, help="params.yaml with the 'lookup_table' section.")
+    parser.add_argument("--output-dir", default=LAP_TABLE_DIR, help="Where to write times.npy and index.json.")
+    parser.add_argument("--check-samples", type=int, default=DEFAULT_CHECK_SAMPLES,
+                        help="Random laps compared against direct predictions.")
+    parser.add_argument("--max-error", type=float, default=DEFAULT_MAX_ERROR,
+                        help="99th percentile absolute error (seconds) above which the table is not logged.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the accuracy check.")
+    parser.add_argument("--no-log", action="store_true", help="Only write the table locally.")
+    raise SystemExit(build(parser.parse_args()))
@@ -0,0 +1,376 @@
+import argparse
+import hashlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# The API modules use flat imports and the stub model is built with the training code,
+# so run this with PYTHONPATH=src/api:src. The API itself is imported only after the
+# environment below is set, because importing it starts the model load.
+
+# --- Configuration ---
+DEFAULT_CORPUS_PATH = "benchmarks/simulate_corpus.jsonl"
+DEFAULT_CONCURRENCY = "1,4,16"
+STUB_DRIVERS = ["VER", "PIA", "NOR", "LEC", "HAM", "RUS", "ALO", "SAI"]
+STUB_YEARS = [2019, 2021, 2023, 2024, 2025]
+STUB_TRAINING_ROWS = 20000
+STUB_MODEL_PARAMS = {
+    "ridge": {},
+    "random_forest": {"n_estimators": 30},
+    "xgboost": {"n_estimators": 200, "early_stopping_rounds": 20},
+}
+COMPOUNDS = ["soft", "medium", "hard"]
+
+def generate_corpus(path: str, n_requests: int, seed: int) -> None:
+    """
+    Writes a deterministic synthetic /simulate corpus, for when no captured traffic is at hand.
+    One to three stops per race over every configured track, with some weather overrides.
+    """
+    from track_config import TRACK_CONFIG, get_track_settings
+
+    rng = np.random.default_rng(seed)
+    tracks = sorted(TRACK_CONFIG.get("tracks", {}))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(n_requests):
+            track = tracks[int(rng.integers(len(tracks)))]
+            total_laps = int(get_track_settings(track)["total_laps"])
+            n_stints = int(rng.integers(2, 5))
+            cuts = np.sort(rng.choice(np.arange(5, total_laps - 4), n_stints - 1, replace=False))
+            lengths = np.diff(np.concatenate([[0], cuts, [total_laps]]))
+            payload = {
+                "track": track,
+                "driver": STUB_DRIVERS[int(rng.integers(len(STUB_DRIVERS)))],
+                "stints": [
+                    {"compound": COMPOUNDS[int(rng.integers(len(COMPOUNDS)))], "laps": int(laps)}
+                    for laps in lengths
+                ],
+            }
+            if rng.random() < 0.3:
+                payload["air_temp"] = round(float(rng.uniform(15, 35)), 1)
+                payload["track_temp"] = round(float(rng.uniform(20, 55)), 1)
+            f.write(json.dumps({"endpoint": "/simulate", "args": {}, "accept": None, "payload": payload},
+                               sort_keys=True) + "\n")
+    print(f"Wrote {n_requests} synthetic requests to {path}")
+
+def load_corpus(path: str, limit: int = None) -> list:
+    """
+    Reads a capture corpus (see src/api/request_capture.py) in file order.
+    """
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                records.append(json.loads(line))
+            if limit and len(records) >= limit:
+                break
+    if not records:
+        raise ValueError(f"The corpus at {path} is empty. Capture traffic or use --generate first.")
+    return records
+
+def build_stub_bundle(model_kind: str, seed: int):
+    """
+    Trains a small model of the production type on synthetic laps with the training
+    pipeline's preprocessor, so the benchmark needs no MLflow registry.
+    """
+    import pandas as pd
+    from model.models import MODEL_GETTERS
+    from model.preprocessing import create_preprocessor
+    from simulator import ModelBundle
+    from track_config import TRACK_CONFIG
+
+    rng = np.random.default_rng(seed)
+    tracks = sorted(TRACK_CONFIG.get("tracks", {}))
+    n = STUB_TRAINING_ROWS
+    laps = pd.DataFrame({
+        "compound": rng.choice(COMPOUNDS, n),
+        "track": rng.choice(tracks, n),
+        "year": rng.choice(STUB_YEARS, n),
+        "driver": rng.choice(STUB_DRIVERS, n),
+        "tyrelife": rng.integers(1, 45, n).astype(float),
+        "lapnumber": rng.integers(1, 70, n).astype(float),
+        "airtemp": rng.uniform(15, 35, n).round(1),
+        "tracktemp": rng.uniform(20, 55, n).round(1),
+    })
+    degradation = laps["compound"].map({"soft": 0.08, "medium": 0.05, "hard": 0.03})
+    offset = laps["compound"].map({"soft": 0.0, "medium": 0.4, "hard": 0.8})
+    track_offset = laps["track"].map({track: index * 0.5 for index, track in enumerate(tracks)})
+    lap_times = (90 + offset + track_offset + degradation * laps["tyrelife"] + 0.002 * laps["tyrelife"] ** 2
+                 - 0.03 * laps["lapnumber"] + 0.02 * laps["tracktemp"] + rng.normal(0, 0.3, n))
+
+    preprocessor = create_preprocessor(
+        laps, ["compound", "track", "year", "driver"], ["tyrelife", "lapnumber", "airtemp", "tracktemp"]
+    ).fit(laps)
+    features = preprocessor.transform(laps)
+    model = MODEL_GETTERS[model_kind](STUB_MODEL_PARAMS[model_kind])
+    if model_kind == "xgboost":
+        model.fit(features, lap_times, eval_set=[(features[:2000], lap_times[:2000])], verbose=False)
+    else:
+        model.fit(features, lap_times)
+    return ModelBundle(model, preprocessor, model_version=f"stub-{model_kind}", source="stub")
+
+def load_app(args):
+    """
+    Imports the Flask app on the stub model (or on the given joblib artifacts).
+    """
+    if not args.with_caches:
+        os.environ["PREDICTION_CACHE_SIZE"] = "0"
+        os.environ["RESPONSE_CACHE_TTL_SECONDS"] = "0"
+    from startup import startup
+    from simulator import ModelBundle
+
+    started = time.perf_counter()
+    if args.model and args.preprocessor:
+        import joblib
+        bundle = ModelBundle(joblib.load(args.model), joblib.load(args.preprocessor),
+                             model_version=os.path.basename(args.model), source="file")
+    else:
+        bundle = build_stub_bundle(args.stub_model, args.seed)
+    startup.start_with_bundle(bundle)
+    print(f"Model ready in {time.perf_counter() - started:.1f}s: {bundle.model_version} "
+          f"({type(bundle.model).__name__}, predictor {bundle.predictor.name})")
+
+    from app import app
+    return app
+
+def _status_kb(pid, field: str):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def read_rss_mb(pid) -> dict:
+    """
+    Returns the current and peak resident set size of a process ("self" for this one).
+    """
+    if pid is None:
+        return {"current": None, "peak": None}
+    rss_kb = _status_kb(pid, "VmRSS")
+    peak_kb = _status_kb(pid, "VmHWM")
+    if peak_kb is None and pid == "self":
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss # KB on Linux
+    return {
+        "current": round(rss_kb / 1024.0, 1) if rss_kb is not None else None,
+        "peak": round(peak_kb / 1024.0, 1) if peak_kb is not None else None,
+    }
+
+class InProcessClient:
+    """
+    Sends corpus requests to the app through Flask's test client, one client per thread.
+    """
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def send(self, record: dict):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client(use_cookies=False)
+        headers = {"Accept": record["accept"]} if record.get("accept") else {}
+        response = client.post(record["endpoint"], json=record["payload"],
+                               query_string=record.get("args") or {}, headers=headers)
+        return response.status_code, response.get_data()
+
+class HttpClient:
+    """
+    Sends corpus requests to a running server (gunicorn, uvicorn or the Flask dev server).
+    """
+    def __init__(self, base_url: str, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def send(self, record: dict):
+        url = self.base_url + record["endpoint"]
+        if record.get("args"):
+            url += "?" + urllib.parse.urlencode(record["args"])
+        headers = {"Content-Type": "application/json"}
+        if record.get("accept"):
+            headers["Accept"] = record["accept"]
+        request = urllib.request.Request(url, data=json.dumps(record["payload"]).encode(), headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+def replay(client, corpus: list, concurrency: int, rss_pid="self") -> dict:
+    """
+    Replays the whole corpus in file order with the given number of concurrent senders.
+    """
+    latencies = np.zeros(len(corpus))
+    statuses = [0] * len(corpus)
+    digests = [b""] * len(corpus)
+
+    def send(index: int) -> None:
+        started = time.perf_counter()
+        try:
+            status, body = client.send(corpus[index])
+        except Exception as e:
+            status, body = 0, repr(e).encode()
+        latencies[index] = time.perf_counter() - started
+        statuses[index] = status
+        digests[index] = hashlib.sha256(body).digest()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(len(corpus))))
+    duration = time.perf_counter() - started
+
+    latencies_ms = latencies * 1000.0
+    return {
+        "concurrency": concurrency,
+        "requests": len(corpus),
+        "errors": sum(1 for status in statuses if status >= 400 or status == 0),
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(corpus) / duration, 2),
+        "latency_ms": {
+            "mean": round(float(latencies_ms.mean()), 3),
+            "p50": round(float(np.percentile(latencies_ms, 50)), 3),
+            "p95": round(float(np.percentile(latencies_ms, 95)), 3),
+            "p99": round(float(np.percentile(latencies_ms, 99)), 3),
+            "max": round(float(latencies_ms.max()), 3),
+        },
+        "rss_mb": read_rss_mb(rss_pid),
+        # Same corpus, code and model => same digest, so output changes show up in a compare.
+        "responses_sha256": hashlib.sha256(b"".join(digests)).hexdigest(),
+    }
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_results(baseline: dict, current: dict, max_regression: float) -> list:
+    """
+    Prints the change of each concurrency level against a baseline results file and
+    returns the regressions beyond max_regression (a fraction).
+    """
+    regressions = []
+    baseline_runs = {run["concurrency"]: run for run in baseline["runs"]}
+    print(f"\nCompared with {baseline.get('git_commit')} ({baseline.get('model')}):")
+    print(f"{'conc':>5} {'rps':>16} {'p50 ms':>16} {'p95 ms':>16} {'p99 ms':>16} {'peak rss':>16}")
+    for run in current["runs"]:
+        base = baseline_runs.get(run["concurrency"])
+        if base is None:
+            continue
+        checks = [
+            ("throughput_rps", base["throughput_rps"], run["throughput_rps"], False),
+            ("p50", base["latency_ms"]["p50"], run["latency_ms"]["p50"], True),
+            ("p95", base["latency_ms"]["p95"], run["latency_ms"]["p95"], True),
+            ("p99", base["latency_ms"]["p99"], run["latency_ms"]["p99"], True),
+            ("peak_rss_mb", base["rss_mb"]["peak"], run["rss_mb"]["peak"], True),
+        ]
+        cells = []
+        for name, before, after, higher_is_worse in checks:
+            if not before or after is None:
+                cells.append(f"{'n/a':>16}")
+                continue
+            change = (after - before) / before
+            cells.append(f"{after:>9.2f} {change:>+6.1%}")
+            if (change if higher_is_worse else -change) > max_regression:
+                regressions.append(f"concurrency {run['concurrency']}: {name} {before} -> {after} ({change:+.1%})")
+        print(f"{run['concurrency']:>5} " + " ".join(cells))
+        if base.get("responses_sha256") != run["responses_sha256"]:
+            print(f"      responses changed at concurrency {run['concurrency']} (different outputs, model or corpus)")
+    return regressions
+
+def run_benchmark(args) -> int:
+    corpus = load_corpus(args.corpus, args.limit)
+    if args.url:
+        client = HttpClient(args.url, args.timeout)
+        model = args.url
+        rss_pid = args.server_pid # The server's memory, not this client's
+    else:
+        app = load_app(args)
+        client = InProcessClient(app)
+        rss_pid = "self"
+        model = os.path.basename(args.model) if args.model else f"stub-{args.stub_model}"
+
+    print(f"Replaying {len(corpus)} requests from {args.corpus}")
+    if args.warmup:
+        replay(client, corpus[:args.warmup], 1, rss_pid)
+
+    runs = []
+    print(f"\n{'conc':>5} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7} {'rss MB':>8} {'peak MB':>8}")
+    for concurrency in [int(value) for value in args.concurrency.split(",")]:
+        run = None
+        for _ in range(args.repeats):
+            attempt = replay(client, corpus, concurrency, rss_pid)
+            if run is None or attempt["throughput_rps"] > run["throughput_rps"]:
+                run = attempt # Best of the repeats, to damp scheduler noise
+        runs.append(run)
+        latency, rss = run["latency_ms"], run["rss_mb"]
+        print(f"{concurrency:>5} {run['throughput_rps']:>9.1f} {latency['p50']:>9.2f} {latency['p95']:>9.2f} "
+              f"{latency['p99']:>9.2f} {run['errors']:>7} {rss['current'] or 0:>8.1f} {rss['peak'] or 0:>8.1f}")
+
+    with open(args.corpus, "rb") as f:
+        corpus_sha256 = hashlib.sha256(f.read()).hexdigest()
+    results = {
+        "git_commit": _git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "model": model,
+        "caches": bool(args.with_caches),
+        "corpus": {"path": args.corpus, "requests": len(corpus), "sha256": corpus_sha256},
+        "runs": runs,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare_results(json.load(f), results, args.max_regression)
+        if regressions:
+            print("\nRegressions beyond the threshold:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\nNo regressions beyond the threshold.")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay captured /simulate requests against the API and report latency.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS_PATH, help="JSONL corpus written by REQUEST_CAPTURE_PATH or --generate.")
+    parser.add_argument("--generate", type=int, metavar="N", help="Write a synthetic corpus of N requests to --corpus and exit.")
+    parser.add_argument("--limit", type=int, help="Replay only the first N requests of the corpus.")
+    parser.add_argument("--concurrency", default=DEFAULT_CONCURRENCY, help="Comma-separated concurrent senders per run.")
+    parser.add_argument("--repeats", type=int, default=1, help="Replays per concurrency level (the fastest is kept).")
+    parser.add_argument("--warmup", type=int, default=20, help="Requests sent once before the timed runs.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic corpus and the stub model.")
+    parser.add_argument("--stub-model", default="xgboost", choices=sorted(STUB_MODEL_PARAMS), help="Model type of the stub.")
+    parser.add_argument("--model", help="Joblib model artifact to use instead of the stub.")
+    parser.add_argument("--preprocessor", help="Joblib preprocessor artifact to use with --model.")
+    parser.add_argument("--with-caches", action="store_true", help="Keep the prediction and response caches on.")
+    parser.add_argument("--url", help="Replay against a running server at this base URL instead of in-process.")
+    parser.add_argument("--server-pid", type=int, help="With --url, the server process whose RSS is reported.")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout with --url, in seconds.")
+    parser.add_argument("--output", help="Where to save the results JSON.")
+    parser.add_argument("--compare", help="A results JSON from an earlier commit to compare against.")
+    parser.add_argument("--max-regression", type=float, default=0.10,
+                        help="Fractional slowdown (or RSS growth) that fails the compare.")
+    args = parser.parse_args()
+
+    if args.generate:
+        generate_corpus(args.corpus, args.generate, args.seed)
+    else:
+        raise SystemExit(run_benchmark(args))
@@ -1,29 +1,164 @@
-from flask import Flask, jsonify, request
+import time
+_import_started = time.perf_counter()
+from flask import Flask, Response, g, jsonify, request
+import hmac
 import os
 from simulator import simulator # Import the simulator instance
+from micro_batcher import InferenceTimeout
+from optimizer import optimizer
+from solver import solver
+from pit_window import pit_window_analyzer
+from response_cache import response_cache
+from model_reloader import model_reloader
+from startup import startup
+from request_capture import request_capture
+from served_models import UnknownModel, served_models
+from shadow_scorer import shadow_scorer
+from streaming import NDJSON_MIMETYPE, ndjson_lines, wants_ndjson
+from response_formats import FORMAT_MIMETYPES, RECORDS, UnsupportedFormat, encode_body, negotiate_format
+import metrics
+from metrics import stage
 # Create the Flask application object
 app = Flask(__name__)
 
+# Shared secret for the /admin endpoints (sent as the X-Admin-Token header). They are
+# disabled unless it is set.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# Load the model (and then watch the registry for new production models).
+startup.record("import", (time.perf_counter() - _import_started) * 1000.0)
+startup.start()
+
+@app.before_request
+def pin_model_version():
+    """
+    Pins the active model (or the one chosen with ?model=<alias or version>) for the whole
+    request, so a hot swap never changes the model halfway through a request.
+    """
+    g.request_started = time.perf_counter()
+    g.metrics_token = metrics.start_request()
+    try:
+        bundle = served_models.get(request.args.get("model"))
+    except UnknownModel as e:
+        return jsonify({"error": e.args[0]}), 404
+    g.model_pin = simulator.pin(bundle)
+
+@app.after_request
+def add_model_version_header(response):
+    response.headers["X-Model-Version"] = str(simulator.model_version)
+    if "request_started" in g:
+        elapsed = time.perf_counter() - g.request_started
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.record_request(endpoint, response.status_code, elapsed)
+        if metrics.SERVER_TIMING_ENABLED:
+            response.headers["Server-Timing"] = metrics.server_timing_header(metrics.current_stages(), elapsed)
+    return response
+
+@app.teardown_request
+def unpin_model_version(exc=None):
+    token = g.pop("model_pin", None)
+    if token is not None:
+        simulator.unpin(token)
+    metrics_token = g.pop("metrics_token", None)
+    if metrics_token is not None:
+        metrics.end_request(metrics_token)
+
+def _wants_stream() -> bool:
+    return wants_ndjson(request.headers.get("Accept"), request.args.get("stream"))
+
+def _response_format() -> str:
+    return negotiate_format(request.headers.get("Accept"), request.args.get("format"))
+
+def _vary_on_accept(response):
+    """
+    Marks a response whose format was negotiated from the Accept header, so caches in
+    between do not hand it to a client that asked for another format.
+    """
+    response.vary.add("Accept")
+    return response
+
+def _formatted_response(results, response_format: str):
+    """
+    Encodes results in the negotiated format; the default records format is plain jsonify.
+    """
+    if response_format == RECORDS:
+        return _vary_on_accept(jsonify(results))
+    return _vary_on_accept(Response(encode_body(results, response_format), mimetype=FORMAT_MIMETYPES[response_format]))
+
 @app.route("/health", methods=["GET"])
 def health_check():
     """
     A simple endpoint to confirm that the API is running and the model is loaded.
     """
     if simulator.model and simulator.preprocessor:
-        return jsonify({"status": "ok", "message": "API is healthy and model is loaded."})
+        return jsonify({
+            "status": "ok",
+            "message": "API is healthy and model is loaded.",
+            "model_version": simulator.model_version,
+            "model_source": simulator.bundle.source,
+            "registry_model_version": model_reloader.loader.latest_registry_version,
+            "model_reloader": model_reloader.stats(),
+            "startup": startup.stats(),
+            "encoder": "compiled" if simulator.encoder is not None else "sklearn",
+            "predictor": simulator.predictor.name,
+            "predictor_benchmark_ms": getattr(simulator.predictor, "load_benchmark_ms", None),
+            "track_shards": simulator.bundle.shards.stats() if simulator.bundle.shards is not None else None,
+            "degradation_curves": simulator.bundle.curves.stats() if simulator.bundle.curves is not None else None,
+            "lap_table": simulator.bundle.lap_table.stats() if simulator.bundle.lap_table is not None else None,
+            "prediction_cache": simulator.cache.stats(),
+            "micro_batching": simulator.batcher.stats(),
+            "response_cache": response_cache.stats(),
+            "request_capture": request_capture.stats(),
+            "served_models": served_models.stats(),
+            "shadow": shadow_scorer.stats(),
+        })
     else:
         return jsonify({"status": "error", "message": "API is running, but model failed to load."}), 500
 
+@app.route("/health/live", methods=["GET"])
+def liveness_check():
+    """
+    Liveness probe: the process is up and serving HTTP, whether or not a model is loaded.
+    """
+    return jsonify({"status": "alive"})
+
+@app.route("/health/ready", methods=["GET"])
+def readiness_check():
+    """
+    Readiness probe: a warmed-up model is loaded and predictions can be served.
+    """
+    if startup.ready:
+        return jsonify({"status": "ready", "model_version": simulator.model_version, "startup": startup.stats()})
+    status = "starting" if not startup.finished else "not_ready"
+    return jsonify({"status": status, "startup": startup.stats()}), 503
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """
+    Request, stage, batch and cache metrics in the Prometheus text format.
+    """
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/models", methods=["GET"])
+def list_models():
+    """
+    Lists the models that can be picked with ?model=<name> on any prediction endpoint.
+    """
+    return jsonify({"models": served_models.describe()})
+
 @app.route("/simulate", methods=["POST"])
 def simulate_strategy():
     """
     The main endpoint to run a race simulation.
-    Expects a JSON payload with the strategy details.
+    Expects a JSON payload with the strategy details. Send Accept: application/x-ndjson
+    or ?stream=1 to get the lap records as NDJSON lines with the summary last, or
+    ?format=columnar|msgpack (or the matching Accept type) for the compact lap_columns.
     """
     if not simulator.model:
         return jsonify({"error": "Model is not loaded. Cannot run simulation."}), 503
 
-    strategy_params = request.get_json()
+    with stage("request_parse"):
+        strategy_params = request.get_json()
     if not strategy_params:
         return jsonify({"error": "Missing JSON request body."}), 400
 
@@ -31,12 +166,242 @@ def simulate_strategy():
     required_keys = ["track", "driver", "stints"]
     if not all(key in strategy_params for key in required_keys):
         return jsonify({"error": f"Request must include {required_keys}."}), 400
+    request_capture.record("/simulate", strategy_params, request.args, request.headers.get("Accept"))
+    shadow_scorer.submit(strategy_params, simulator.bundle)
+
+    # Streamed responses: the strategy is validated here and predicted stint by stint as it streams.
+    if _wants_stream():
+        try:
+            return _vary_on_accept(Response(ndjson_lines(simulator.stream_simulation(strategy_params)), mimetype=NDJSON_MIMETYPE))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except InferenceTimeout as e:
+            return jsonify({"error": str(e)}), 503
+        except Exception as e:
+            return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
 
     try:
-        results = simulator.run_simulation(strategy_params)
-        return jsonify(results)
+        response_format = _response_format()
+    except UnsupportedFormat as e:
+        return jsonify({"error": str(e)}), 406
+
+    # Identical strategies on the same model version always produce the same body in a
+    # given format, so they can be answered from the response cache or with a 304.
+    try:
+        canonical = simulator.canonical_strategy(strategy_params)
+        cache_key = response_cache.make_key(canonical, simulator.model_version, response_format)
+    except (KeyError, TypeError, ValueError):
+        cache_key = None # Malformed stints; let the simulator report the error
+
+    if cache_key:
+        etag = response_cache.make_etag(cache_key, response_format)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return _vary_on_accept(response)
+        with stage("response_cache"):
+            cached_body = response_cache.get(cache_key)
+        if cached_body is not None:
+            response = Response(cached_body, mimetype=FORMAT_MIMETYPES[response_format], headers={"X-Cache": "HIT"})
+            response.set_etag(etag)
+            return _vary_on_accept(response)
+
+    try:
+        results = simulator.run_simulation(strategy_params, columnar=response_format != RECORDS)
+        with stage("serialize"):
+            response = _formatted_response(results, response_format)
+        if cache_key and "error" not in results:
+            response_cache.put(cache_key, response.get_data())
+            response.set_etag(etag)
+            response.headers["X-Cache"] = "MISS"
+        return response
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except InferenceTimeout as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
+
+@app.route("/simulate/batch", methods=["POST"])
+def simulate_batch():
+    """
+    Scores a list of strategies in one request with a single model pass.
+    Expects {"strategies": [<simulate payload>, ...]}; errors are reported per item.
+    Send Accept: application/x-ndjson or ?stream=1 to stream the lap records instead, or
+    ?format=columnar|msgpack for the compact lap_columns layout.
+    """
+    if not simulator.model:
+        return jsonify({"error": "Model is not loaded. Cannot run simulation."}), 503
+
+    batch_params = request.get_json()
+    if not batch_params or "strategies" not in batch_params:
+        return jsonify({"error": "Request must include a 'strategies' list."}), 400
+
+    try:
+        if _wants_stream():
+            return _vary_on_accept(Response(ndjson_lines(simulator.stream_batch(batch_params["strategies"])), mimetype=NDJSON_MIMETYPE))
+        response_format = _response_format()
+        results = simulator.run_batch(batch_params["strategies"], columnar=response_format != RECORDS)
+        return _formatted_response(results, response_format)
+    except UnsupportedFormat as e:
+        return jsonify({"error": str(e)}), 406
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
+    except InferenceTimeout as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
+
+@app.route("/simulate/monte-carlo", methods=["POST"])
+def simulate_monte_carlo():
+    """
+    Runs a Monte Carlo race simulation with safety cars, pit-loss variance and lap-time noise.
+    Accepts the /simulate payload plus an optional 'compare_stints' rival strategy.
+    """
+    if not simulator.model:
+        return jsonify({"error": "Model is not loaded. Cannot run simulation."}), 503
+
+    strategy_params = request.get_json()
+    if not strategy_params:
+        return jsonify({"error": "Missing JSON request body."}), 400
+
+    required_keys = ["track", "driver", "stints"]
+    if not all(key in strategy_params for key in required_keys):
+        return jsonify({"error": f"Request must include {required_keys}."}), 400
+
+    try:
+        results = simulator.run_monte_carlo(strategy_params)
+        return jsonify(results)
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    except InferenceTimeout as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
+
+@app.route("/optimize", methods=["POST"])
+def optimize_strategy():
+    """
+    Searches all stint plans for a race and returns the top-K strategies by total race time.
+    Expects a JSON payload with the track, driver and optional search constraints.
+    """
+    if not simulator.model:
+        return jsonify({"error": "Model is not loaded. Cannot run optimization."}), 503
+
+    optimize_params = request.get_json()
+    if not optimize_params:
+        return jsonify({"error": "Missing JSON request body."}), 400
+
+    required_keys = ["track", "driver"]
+    if not all(key in optimize_params for key in required_keys):
+        return jsonify({"error": f"Request must include {required_keys}."}), 400
+
+    try:
+        results = optimizer.optimize(optimize_params)
+        return jsonify(results)
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    except InferenceTimeout as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
+
+@app.route("/solve", methods=["POST"])
+def solve_strategy():
+    """
+    Finds the single optimal strategy with the dynamic-programming solver.
+    Returns the plan together with the lap-by-lap trace in the /simulate format.
+    """
+    if not simulator.model:
+        return jsonify({"error": "Model is not loaded. Cannot run solver."}), 503
+
+    solve_params = request.get_json()
+    if not solve_params:
+        return jsonify({"error": "Missing JSON request body."}), 400
+
+    required_keys = ["track", "driver"]
+    if not all(key in solve_params for key in required_keys):
+        return jsonify({"error": f"Request must include {required_keys}."}), 400
+
+    try:
+        response_format = _response_format()
+        results = solver.solve(solve_params, columnar=response_format != RECORDS)
+        return _formatted_response(results, response_format)
+    except UnsupportedFormat as e:
+        return jsonify({"error": str(e)}), 406
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    except InferenceTimeout as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
+
+@app.route("/pit-window", methods=["POST"])
+def pit_window_heatmap():
+    """
+    Returns total race time for every pit lap, as one-stop heatmaps per compound pair
+    or a two-stop slice for a given compound sequence.
+    """
+    if not simulator.model:
+        return jsonify({"error": "Model is not loaded. Cannot build heatmap."}), 503
+
+    heatmap_params = request.get_json()
+    if not heatmap_params:
+        return jsonify({"error": "Missing JSON request body."}), 400
+
+    required_keys = ["track", "driver"]
+    if not all(key in heatmap_params for key in required_keys):
+        return jsonify({"error": f"Request must include {required_keys}."}), 400
+
+    try:
+        results = pit_window_analyzer.build_heatmap(heatmap_params)
+        return jsonify(results)
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    except InferenceTimeout as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
+
+def _admin_authorized() -> bool:
+    """
+    Denies every admin request unless ADMIN_TOKEN is configured and the header matches it.
+    """
+    if not ADMIN_TOKEN:
+        return False
+    return hmac.compare_digest(request.headers.get("X-Admin-Token", "").encode(), ADMIN_TOKEN.encode())
+
+@app.route("/admin/reload", methods=["POST"])
+def reload_model():
+    """
+    Loads the current 'production' model and swaps it in without downtime.
+    Pass {"force": true} to reload even if that version is already active.
+    """
+    if not _admin_authorized():
+        return jsonify({"error": "Invalid or missing X-Admin-Token header."}), 403
+
+    reload_params = request.get_json(silent=True) or {}
+    try:
+        results = model_reloader.reload(force=bool(reload_params.get("force", False)))
+        if served_models.references:
+            results["served_models"] = served_models.refresh()
+        return jsonify(results)
+    except Exception as e:
+        return jsonify({"error": f"Model reload failed, still serving the current version: {e}"}), 500
+
+@app.route("/admin/rollback", methods=["POST"])
+def rollback_model():
+    """
+    Swaps the previously active model back in.
+    """
+    if not _admin_authorized():
+        return jsonify({"error": "Invalid or missing X-Admin-Token header."}), 403
+
+    try:
+        results = model_reloader.rollback()
+        return jsonify(results)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
 
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# --- Configuration ---
+ARTIFACT_CACHE_DIR = os.environ.get(
+    "ARTIFACT_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "f1-strategy-api", "artifacts")
+)
+ARTIFACT_CACHE_MAX_BYTES = int(os.environ.get("ARTIFACT_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+def file_sha256(path: str) -> str:
+    """
+    Streams a file through SHA-256.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _write_json_atomic(path: str, data: dict) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+class ArtifactCache:
+    """
+    A content-addressed, on-disk cache of model artifacts.
+
+    Layout under the cache directory:
+        blobs/<sha256>                  artifact bytes, named by their content hash
+        runs/<run_id>.json              manifest: artifact name -> sha256 and size
+        aliases/<model>@<alias>.json    the run and version an alias pointed to last time
+    Blobs are hashed when they are inserted and verified against that hash on every read
+    (or, for reads that ask for it, only against their size), and whole runs are evicted
+    least-recently-used first once the blobs exceed the size limit. A manifest can also
+    record that a run has no such artifacts, so optional ones are not looked up again.
+    """
+    def __init__(self, cache_dir: str = ARTIFACT_CACHE_DIR, max_bytes: int = ARTIFACT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        for sub_dir in ("blobs", "runs", "aliases"):
+            os.makedirs(os.path.join(cache_dir, sub_dir), exist_ok=True)
+
+    def _blob_path(self, sha256: str) -> str:
+        return os.path.join(self.cache_dir, "blobs", sha256)
+
+    def _manifest_path(self, run_id: str) -> str:
+        return os.path.join(self.cache_dir, "runs", f"{run_id}.json")
+
+    def _alias_path(self, model_name: str, alias: str) -> str:
+        return os.path.join(self.cache_dir, "aliases", f"{model_name}@{alias}.json")
+
+    def put_run(self, run_id: str, model_version: str, artifact_paths: dict) -> dict:
+        """
+        Copies downloaded artifacts into the cache and returns their cached paths.
+        """
+        with self._lock:
+            artifacts = {}
+            for name, source_path in artifact_paths.items():
+                sha256 = file_sha256(source_path)
+                blob_path = self._blob_path(sha256)
+                if not os.path.exists(blob_path):
+                    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(blob_path), suffix=".tmp")
+                    os.close(fd)
+                    shutil.copyfile(source_path, tmp_path)
+                    os.replace(tmp_path, blob_path)
+                artifacts[name] = {"sha256": sha256, "size": os.path.getsize(blob_path)}
+
+            _write_json_atomic(self._manifest_path(run_id), {
+                "run_id": run_id,
+                "model_version": model_version,
+                "artifacts": artifacts,
+                "cached_at": time.time(),
+            })
+            self._evict(keep_run_id=run_id)
+            return {name: self._blob_path(info["sha256"]) for name, info in artifacts.items()}
+
+    def get_run(self, run_id: str, verify: bool = True):
+        """
+        Returns {artifact name: path} for a cached run, or None if it is missing or any
+        blob fails its integrity check (corrupt runs are dropped from the cache). With
+        verify=False the blobs are only checked for their size, not re-hashed.
+        """
+        with self._lock:
+            manifest_path = self._manifest_path(run_id)
+            try:
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                return None
+            if manifest.get("missing"):
+                return None
+
+            paths = {}
+            for name, info in manifest["artifacts"].items():
+                blob_path = self._blob_path(info["sha256"])
+                if not os.path.exists(blob_path) or (
+                    file_sha256(blob_path) != info["sha256"] if verify else os.path.getsize(blob_path) != info["size"]
+                ):
+                    print(f"WARNING: Cached artifact '{name}' for run {run_id} failed its integrity check.")
+                    if os.path.exists(blob_path):
+                        os.remove(blob_path)
+                    os.remove(manifest_path)
+                    return None
+                paths[name] = blob_path
+
+            os.utime(manifest_path) # Mark as recently used for eviction
+            return paths
+
+    def put_missing(self, run_id: str, model_version: str) -> None:
+        """
+        Records that a run does not have the artifacts cached under this key.
+        """
+        with self._lock:
+            _write_json_atomic(self._manifest_path(run_id), {
+                "run_id": run_id,
+                "model_version": model_version,
+                "artifacts": {},
+                "missing": True,
+                "cached_at": time.time(),
+            })
+
+    def is_missing(self, run_id: str) -> bool:
+        """
+        Returns True if the artifacts under this key were recorded as missing from the run.
+        """
+        try:
+            with open(self._manifest_path(run_id)) as f:
+                return bool(json.load(f).get("missing"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+
+    def forget(self, run_id: str) -> None:
+        """
+        Drops a run's manifest (its blobs go at the next eviction if nothing else uses them).
+        """
+        with self._lock:
+            try:
+                os.remove(self._manifest_path(run_id))
+            except FileNotFoundError:
+                pass
+
+    def set_alias(self, model_name: str, alias: str, run_id: str, model_version: str) -> None:
+        """
+        Remembers which run an alias resolved to, so the next start can skip the registry.
+        """
+        _write_json_atomic(self._alias_path(model_name, alias), {"run_id": run_id, "model_version": model_version})
+
+    def resolve_alias(self, model_name: str, alias: str):
+        """
+        Returns the last known {'run_id', 'model_version'} for an alias, or None.
+        """
+        try:
+            with open(self._alias_path(model_name, alias)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _evict(self, keep_run_id: str = None) -> None:
+        """
+        Deletes least recently used runs until the blobs fit in max_bytes, then removes
+        blobs no remaining run refers to.
+        """
+        runs_dir = os.path.join(self.cache_dir, "runs")
+        manifests = []
+        for file_name in os.listdir(runs_dir):
+            path = os.path.join(runs_dir, file_name)
+            try:
+                with open(path) as f:
+                    manifests.append((os.path.getmtime(path), path, json.load(f)))
+            except (OSError, json.JSONDecodeError):
+                continue
+        manifests.sort(key=lambda item: item[0]) # Oldest first
+
+        def referenced(items):
+            return {info["sha256"]: info["size"] for _, _, m in items for info in m["artifacts"].values()}
+
+        while manifests and sum(referenced(manifests).values()) > self.max_bytes:
+            candidates = [item for item in manifests if item[2]["run_id"] != keep_run_id]
+            if not candidates:
+                break
+            _, path, manifest = candidates[0]
+            print(f"Evicting cached artifacts for run {manifest['run_id']}.")
+            os.remove(path)
+            manifests.remove(candidates[0])
+
+        keep = referenced(manifests)
+        blobs_dir = os.path.join(self.cache_dir, "blobs")
+        for file_name in os.listdir(blobs_dir):
+            if file_name not in keep and not file_name.endswith(".tmp"):
+                os.remove(os.path.join(blobs_dir, file_name))
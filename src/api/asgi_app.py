@@ -0,0 +1,460 @@
+# Async (ASGI) variant of the API with the same request and response contracts as app.py.
+#
+#   cd src/api && uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+#
+# The event loop only parses requests and writes responses. Simulations (streamed ones
+# included) run on a bounded thread pool, with a per-request timeout, cancellation when
+# the client disconnects and a 429 + Retry-After when too much work is already waiting.
+import time
+_import_started = time.perf_counter()
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.datastructures import MutableHeaders
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from simulator import simulator
+from micro_batcher import InferenceTimeout
+from optimizer import optimizer
+from solver import solver
+from pit_window import pit_window_analyzer
+from response_cache import response_cache
+from model_reloader import model_reloader
+from startup import startup
+from request_capture import request_capture
+from served_models import UnknownModel, served_models
+from shadow_scorer import shadow_scorer
+import metrics
+from streaming import NDJSON_MIMETYPE, ndjson_lines, wants_ndjson
+from response_formats import FORMAT_MIMETYPES, RECORDS, UnsupportedFormat, encode_body, negotiate_format
+
+# --- Configuration ---
+ASYNC_INFERENCE_WORKERS = int(os.environ.get("ASYNC_INFERENCE_WORKERS", 4))
+# Requests running or queued for the pool before new ones are turned away with a 429.
+ASYNC_MAX_PENDING = int(os.environ.get("ASYNC_MAX_PENDING", 64))
+ASYNC_REQUEST_TIMEOUT_SECONDS = float(os.environ.get("ASYNC_REQUEST_TIMEOUT_SECONDS", 30))
+ASYNC_RETRY_AFTER_SECONDS = int(os.environ.get("ASYNC_RETRY_AFTER_SECONDS", 1))
+# On every response whose format was negotiated from the Accept header, so caches in
+# between do not hand it to a client that asked for another format.
+VARY_ON_ACCEPT = {"Vary": "Accept"}
+
+inference_executor = ThreadPoolExecutor(max_workers=ASYNC_INFERENCE_WORKERS, thread_name_prefix="inference")
+# Released by the job itself when it finishes, so abandoned (timed out) jobs keep counting
+# against the limit until the pool is really free again.
+pending_slots = threading.BoundedSemaphore(ASYNC_MAX_PENDING)
+
+class Overloaded(Exception):
+    pass
+
+class RequestMetrics:
+    """
+    ASGI middleware doing what app.py's before/after request hooks do: counts and times
+    every request by route, and adds the Server-Timing header when it is enabled.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        token = metrics.start_request()
+        status = 500 # Unless the app gets as far as starting a response
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if metrics.SERVER_TIMING_ENABLED:
+                    elapsed = time.perf_counter() - started
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing", metrics.server_timing_header(metrics.current_stages(), elapsed)
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            # The router leaves the matched route in the scope; a stream is timed to its last chunk.
+            route = scope.get("route")
+            metrics.record_request(route.path if route is not None else "unmatched", status, time.perf_counter() - started)
+            metrics.end_request(token)
+
+class ClientDisconnected(Exception):
+    pass
+
+def _json_response(payload, status: int = 200, model_version=None, headers: dict = None) -> Response:
+    # encode_body matches Flask's jsonify byte for byte, so both servers return identical bodies.
+    response = Response(encode_body(payload, RECORDS), status_code=status, media_type="application/json", headers=headers)
+    response.headers["X-Model-Version"] = str(model_version if model_version is not None else simulator.model_version)
+    return response
+
+def _pinned_call(bundle, fn, *args):
+    """
+    Runs fn on the inference pool with the requested model pinned for the whole call.
+    Returns (result, model_version).
+    """
+    token = simulator.pin(bundle)
+    try:
+        return fn(*args), simulator.model_version
+    finally:
+        simulator.unpin(token)
+
+async def _wait_for_disconnect(request: Request) -> None:
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+def _submit(bundle, fn, *args):
+    """
+    Takes a pending slot and submits fn to the pool with the bundle pinned. Raises
+    Overloaded when every slot is taken; the caller releases the slot with _release_after.
+    """
+    if not pending_slots.acquire(blocking=False):
+        raise Overloaded()
+    try:
+        # In a copy of the request's context, so stages timed on the pool reach its Server-Timing.
+        return inference_executor.submit(contextvars.copy_context().run, _pinned_call, bundle, fn, *args)
+    except Exception:
+        pending_slots.release()
+        raise
+
+def _release_after(job) -> None:
+    """
+    Frees a pending slot once the job (the last one run under it) has finished.
+    """
+    job.add_done_callback(lambda _: pending_slots.release())
+
+async def _wait_for_job(request: Request, job):
+    """
+    Waits for a job, the timeout or the client hanging up, whichever comes first. A job
+    that has not started yet is cancelled; one that is already running finishes in the
+    background and its result is dropped.
+    """
+    result = asyncio.wrap_future(job)
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        done, _ = await asyncio.wait(
+            {result, disconnect}, timeout=ASYNC_REQUEST_TIMEOUT_SECONDS, return_when=asyncio.FIRST_COMPLETED
+        )
+    finally:
+        disconnect.cancel()
+
+    if result in done:
+        return result.result()
+    job.cancel()
+    if disconnect in done:
+        raise ClientDisconnected()
+    raise asyncio.TimeoutError()
+
+async def run_offloaded(request: Request, fn, *args):
+    """
+    Runs a CPU-bound call on the bounded pool and waits for it (see _wait_for_job).
+    Returns (result, model_version).
+    """
+    bundle = served_models.get(request.query_params.get("model")) # Raises UnknownModel
+    job = _submit(bundle, fn, *args)
+    _release_after(job)
+    return await _wait_for_job(request, job)
+
+async def stream_offloaded(request: Request, stream_fn, *args) -> Response:
+    """
+    The streaming counterpart of run_offloaded. stream_fn validates the request and returns
+    its generator of lines on the pool, like any other call; the NDJSON chunks are then
+    also produced on the pool (see _stream_chunks), under the same pending slot.
+    """
+    bundle = served_models.get(request.query_params.get("model")) # Raises UnknownModel
+    job = _submit(bundle, stream_fn, *args)
+    try:
+        lines, model_version = await _wait_for_job(request, job)
+    except BaseException:
+        _release_after(job)
+        raise
+    return StreamingResponse(_stream_chunks(request, ndjson_lines(lines), job), media_type=NDJSON_MIMETYPE,
+                             headers={"X-Model-Version": str(model_version), **VARY_ON_ACCEPT})
+
+async def _stream_chunks(request: Request, chunks, job):
+    """
+    Steps a stream's generator on the inference pool one chunk at a time, keeping its
+    pending slot until the last step has finished. The stream stops when the client has
+    disconnected, and ends with an error line if a chunk takes longer than the request
+    timeout (the status line has already been sent by then).
+    """
+    try:
+        while not await request.is_disconnected():
+            job = inference_executor.submit(next, chunks, None)
+            try:
+                chunk = await asyncio.wait_for(asyncio.wrap_future(job), ASYNC_REQUEST_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                yield next(ndjson_lines([{"error": f"Request timed out after {ASYNC_REQUEST_TIMEOUT_SECONDS:g} seconds."}]))
+                return
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        if job.done():
+            chunks.close()
+        _release_after(job)
+
+def _wants_stream(request: Request) -> bool:
+    return wants_ndjson(request.headers.get("accept"), request.query_params.get("stream"))
+
+def _response_format(request: Request) -> str:
+    return negotiate_format(request.headers.get("accept"), request.query_params.get("format"))
+
+async def _read_json(request: Request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+def _offload_error_response(e: Exception) -> Response:
+    if isinstance(e, UnknownModel):
+        return _json_response({"error": e.args[0]}, 404)
+    if isinstance(e, Overloaded):
+        return _json_response(
+            {"error": "Server is busy. Please retry shortly."}, 429,
+            headers={"Retry-After": str(ASYNC_RETRY_AFTER_SECONDS)}
+        )
+    if isinstance(e, InferenceTimeout): # The inference queue is stuck, not this request slow
+        return _json_response({"error": str(e)}, 503)
+    if isinstance(e, asyncio.TimeoutError):
+        return _json_response({"error": f"Request timed out after {ASYNC_REQUEST_TIMEOUT_SECONDS:g} seconds."}, 504)
+    # The client is gone; nobody reads this response.
+    return Response(status_code=499)
+
+async def health_check(request: Request) -> Response:
+    """
+    A simple endpoint to confirm that the API is running and the model is loaded.
+    """
+    if simulator.model and simulator.preprocessor:
+        return _json_response({
+            "status": "ok",
+            "message": "API is healthy and model is loaded.",
+            "model_version": simulator.model_version,
+            "model_source": simulator.bundle.source,
+            "registry_model_version": model_reloader.loader.latest_registry_version,
+            "model_reloader": model_reloader.stats(),
+            "startup": startup.stats(),
+            "encoder": "compiled" if simulator.encoder is not None else "sklearn",
+            "predictor": simulator.predictor.name,
+            "predictor_benchmark_ms": getattr(simulator.predictor, "load_benchmark_ms", None),
+            "track_shards": simulator.bundle.shards.stats() if simulator.bundle.shards is not None else None,
+            "degradation_curves": simulator.bundle.curves.stats() if simulator.bundle.curves is not None else None,
+            "lap_table": simulator.bundle.lap_table.stats() if simulator.bundle.lap_table is not None else None,
+            "prediction_cache": simulator.cache.stats(),
+            "micro_batching": simulator.batcher.stats(),
+            "response_cache": response_cache.stats(),
+            "request_capture": request_capture.stats(),
+            "served_models": served_models.stats(),
+            "shadow": shadow_scorer.stats(),
+            "async_executor": {
+                "workers": ASYNC_INFERENCE_WORKERS,
+                "max_pending": ASYNC_MAX_PENDING,
+                "timeout_seconds": ASYNC_REQUEST_TIMEOUT_SECONDS,
+            },
+        })
+    else:
+        return _json_response({"status": "error", "message": "API is running, but model failed to load."}, 500)
+
+async def liveness_check(request: Request) -> Response:
+    """
+    Liveness probe: the process is up and serving HTTP, whether or not a model is loaded.
+    """
+    return _json_response({"status": "alive"})
+
+async def readiness_check(request: Request) -> Response:
+    """
+    Readiness probe: a warmed-up model is loaded and predictions can be served.
+    """
+    if startup.ready:
+        return _json_response({"status": "ready", "model_version": simulator.model_version, "startup": startup.stats()})
+    status = "starting" if not startup.finished else "not_ready"
+    return _json_response({"status": status, "startup": startup.stats()}, 503)
+
+async def prometheus_metrics(request: Request) -> Response:
+    """
+    Stage, batch and cache metrics in the Prometheus text format.
+    """
+    return Response(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+async def list_models(request: Request) -> Response:
+    """
+    Lists the models that can be picked with ?model=<name> on any prediction endpoint.
+    """
+    return _json_response({"models": served_models.describe()})
+
+async def simulate_strategy(request: Request) -> Response:
+    """
+    The main endpoint to run a race simulation. Same contract as the Flask /simulate,
+    including the response cache and ETag / If-None-Match handling.
+    """
+    if not simulator.model:
+        return _json_response({"error": "Model is not loaded. Cannot run simulation."}, 503)
+
+    strategy_params = await _read_json(request)
+    if not strategy_params:
+        return _json_response({"error": "Missing JSON request body."}, 400)
+
+    required_keys = ["track", "driver", "stints"]
+    if not all(key in strategy_params for key in required_keys):
+        return _json_response({"error": f"Request must include {required_keys}."}, 400)
+    request_capture.record("/simulate", strategy_params, request.query_params, request.headers.get("accept"))
+    try:
+        bundle = served_models.get(request.query_params.get("model"))
+    except UnknownModel as e:
+        return _offload_error_response(e)
+    shadow_scorer.submit(strategy_params, bundle)
+
+    if _wants_stream(request):
+        try:
+            return await stream_offloaded(request, simulator.stream_simulation, strategy_params)
+        except (UnknownModel, Overloaded, InferenceTimeout, asyncio.TimeoutError, ClientDisconnected) as e:
+            return _offload_error_response(e)
+        except ValueError as e:
+            return _json_response({"error": str(e)}, 400)
+        except Exception as e:
+            return _json_response({"error": f"An unexpected error occurred: {e}"}, 500)
+
+    try:
+        response_format = _response_format(request)
+    except UnsupportedFormat as e:
+        return _json_response({"error": str(e)}, 406)
+    media_type = FORMAT_MIMETYPES[response_format]
+
+    model_version = bundle.model_version
+    try:
+        canonical = simulator.canonical_strategy(strategy_params)
+        cache_key = response_cache.make_key(canonical, model_version, response_format)
+    except (KeyError, TypeError, ValueError):
+        cache_key = None # Malformed stints; let the simulator report the error
+
+    if cache_key:
+        etag = f'"{response_cache.make_etag(cache_key, response_format)}"'
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+            return Response(status_code=304, headers={"ETag": etag, "X-Model-Version": str(model_version), **VARY_ON_ACCEPT})
+        cached_body = response_cache.get(cache_key)
+        if cached_body is not None:
+            return Response(cached_body, media_type=media_type, headers={
+                "ETag": etag, "X-Cache": "HIT", "X-Model-Version": str(model_version), **VARY_ON_ACCEPT
+            })
+
+    try:
+        results, model_version = await run_offloaded(
+            request, simulator.run_simulation, strategy_params, response_format != RECORDS
+        )
+    except (UnknownModel, Overloaded, InferenceTimeout, asyncio.TimeoutError, ClientDisconnected) as e:
+        return _offload_error_response(e)
+    except ValueError as e:
+        return _json_response({"error": str(e)}, 400)
+    except Exception as e:
+        return _json_response({"error": f"An unexpected error occurred: {e}"}, 500)
+
+    body = encode_body(results, response_format)
+    if not cache_key or "error" in results:
+        return Response(body, media_type=media_type, headers={"X-Model-Version": str(model_version), **VARY_ON_ACCEPT})
+    # The key was built before the call; only cache the body if the model did not change meanwhile.
+    if model_version == bundle.model_version:
+        response_cache.put(cache_key, body)
+    return Response(body, media_type=media_type, headers={
+        "ETag": etag, "X-Cache": "MISS", "X-Model-Version": str(model_version), **VARY_ON_ACCEPT
+    })
+
+def json_endpoint(fn, unavailable_message: str, required_keys=None, missing_body_message=None,
+                  client_errors=(ValueError, TypeError), stream_fn=None, columnar=False):
+    """
+    Builds an async endpoint that validates the JSON body like the Flask routes do and
+    runs fn(body) on the inference pool (or stream_fn(body) when NDJSON was requested).
+    With columnar=True the response format is negotiated and fn is called as
+    fn(body, columnar_layout).
+    """
+    async def endpoint(request: Request) -> Response:
+        if not simulator.model:
+            return _json_response({"error": unavailable_message}, 503)
+
+        params = await _read_json(request)
+        if missing_body_message is not None:
+            if not params or not all(key in params for key in required_keys):
+                return _json_response({"error": missing_body_message}, 400)
+        else:
+            if not params:
+                return _json_response({"error": "Missing JSON request body."}, 400)
+            if not all(key in params for key in required_keys):
+                return _json_response({"error": f"Request must include {required_keys}."}, 400)
+
+        try:
+            if stream_fn is not None and _wants_stream(request):
+                return await stream_offloaded(request, stream_fn, params)
+            if not columnar:
+                results, model_version = await run_offloaded(request, fn, params)
+                return _json_response(results, model_version=model_version)
+            response_format = _response_format(request)
+            results, model_version = await run_offloaded(request, fn, params, response_format != RECORDS)
+            return Response(encode_body(results, response_format), media_type=FORMAT_MIMETYPES[response_format],
+                            headers={"X-Model-Version": str(model_version), **VARY_ON_ACCEPT})
+        except (UnknownModel, Overloaded, InferenceTimeout, asyncio.TimeoutError, ClientDisconnected) as e:
+            return _offload_error_response(e)
+        except UnsupportedFormat as e:
+            return _json_response({"error": str(e)}, 406)
+        except client_errors as e:
+            return _json_response({"error": str(e)}, 400)
+        except Exception as e:
+            return _json_response({"error": f"An unexpected error occurred: {e}"}, 500)
+
+    return endpoint
+
+@asynccontextmanager
+async def lifespan(app):
+    startup.record("import", (time.perf_counter() - _import_started) * 1000.0)
+    # Runs off the event loop; with STARTUP_IN_BACKGROUND=1 this returns immediately.
+    await asyncio.get_running_loop().run_in_executor(None, startup.start)
+    yield
+    inference_executor.shutdown(wait=False, cancel_futures=True)
+
+app = Starlette(
+    routes=[
+        Route("/health", health_check, methods=["GET"]),
+        Route("/health/live", liveness_check, methods=["GET"]),
+        Route("/health/ready", readiness_check, methods=["GET"]),
+        Route("/metrics", prometheus_metrics, methods=["GET"]),
+        Route("/models", list_models, methods=["GET"]),
+        Route("/simulate", simulate_strategy, methods=["POST"]),
+        Route("/simulate/batch", json_endpoint(
+            lambda params, columnar: simulator.run_batch(params["strategies"], columnar),
+            "Model is not loaded. Cannot run simulation.",
+            required_keys=["strategies"],
+            missing_body_message="Request must include a 'strategies' list.",
+            client_errors=(ValueError,),
+            stream_fn=lambda params: simulator.stream_batch(params["strategies"]),
+            columnar=True,
+        ), methods=["POST"]),
+        Route("/simulate/monte-carlo", json_endpoint(
+            simulator.run_monte_carlo, "Model is not loaded. Cannot run simulation.",
+            required_keys=["track", "driver", "stints"],
+        ), methods=["POST"]),
+        Route("/optimize", json_endpoint(
+            optimizer.optimize, "Model is not loaded. Cannot run optimization.",
+            required_keys=["track", "driver"],
+        ), methods=["POST"]),
+        Route("/solve", json_endpoint(
+            solver.solve, "Model is not loaded. Cannot run solver.",
+            required_keys=["track", "driver"],
+            columnar=True,
+        ), methods=["POST"]),
+        Route("/pit-window", json_endpoint(
+            pit_window_analyzer.build_heatmap, "Model is not loaded. Cannot build heatmap.",
+            required_keys=["track", "driver"],
+        ), methods=["POST"]),
+    ],
+    middleware=[Middleware(RequestMetrics)],
+    lifespan=lifespan,
+)
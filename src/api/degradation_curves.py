@@ -0,0 +1,149 @@
+import os
+import threading
+import numpy as np
+from track_shards import TRACK_SHARDS_ENABLED
+
+# --- Configuration ---
+# Answer grid and Monte Carlo lap times from the run's distilled curves (0 always uses the model).
+DEGRADATION_CURVES_ENABLED = os.environ.get("DEGRADATION_CURVES_ENABLED", "1") != "0"
+# Curves whose held-out error against the model exceeds this many seconds are not used.
+DEGRADATION_CURVES_MAX_ERROR = float(os.environ.get("DEGRADATION_CURVES_MAX_ERROR", 0.5))
+# Must match model/distill.py, which fits the coefficients on the same basis.
+CURVE_BASIS = "piecewise_cubic_v1"
+# Largest difference from the design matrix saved with the curves (see check_basis).
+BASIS_PROBE_TOLERANCE = 1e-9
+
+def piecewise_basis(tyrelife, lapnumber, airtemp, tracktemp, knots) -> np.ndarray:
+    """
+    The design matrix of a curve. The API is deployed without src/model, so this mirrors
+    model/distill.py's; check_basis rejects curves whose saved basis it does not reproduce.
+    """
+    t = np.asarray(tyrelife, dtype=float) / 50.0
+    l = np.asarray(lapnumber, dtype=float) / 70.0
+    a = (np.asarray(airtemp, dtype=float) - 25.0) / 10.0
+    s = (np.asarray(tracktemp, dtype=float) - 35.0) / 15.0
+    columns = [np.ones_like(t), t, t ** 2, t ** 3]
+    columns += [np.maximum(t - knot / 50.0, 0.0) ** 3 for knot in knots]
+    columns += [l, l ** 2, t * l, a, s, t * s]
+    return np.column_stack(columns)
+
+def basis_terms(knots) -> list:
+    """
+    Names the columns of piecewise_basis in order, as model/distill.py saves them.
+    """
+    return ["1", "t", "t^2", "t^3", *[f"max(t-{knot:g}/50,0)^3" for knot in knots], "l", "l^2", "t*l", "a", "s", "t*s"]
+
+def check_basis(curves: dict):
+    """
+    Compares the basis saved with the curves (term order and the design matrix of a few
+    probe points) with the one evaluated here. Returns why they differ, or None.
+    """
+    if "basis_terms" not in curves or "basis_probe" not in curves:
+        return "they do not record their basis terms"
+    knots = tuple(float(knot) for knot in curves["knots"])
+    terms = [str(term) for term in curves["basis_terms"]]
+    if terms != basis_terms(knots):
+        return f"their basis terms {terms} differ from {basis_terms(knots)}"
+    if np.shape(curves["coefficients"])[-1] != len(terms):
+        return f"they have {np.shape(curves['coefficients'])[-1]} coefficients per curve for {len(terms)} terms"
+    probe = np.asarray(curves["basis_probe"], dtype=float)
+    difference = np.abs(piecewise_basis(*probe.T, knots) - np.asarray(curves["basis_probe_design"], dtype=float)).max()
+    if not difference <= BASIS_PROBE_TOLERANCE:
+        return f"the basis evaluated here is off by {difference:g} on their probe points"
+    return None
+
+class DegradationCurves:
+    """
+    The per-(track, compound, driver) lap time curves distilled from one training run.
+
+    A curve answers a lap only when its recorded error against the model is within
+    max_error and the lap lies inside the ranges it was fitted on (tyre life, lap number,
+    temperatures, season). Everything else is left to the model.
+    """
+    source = "degradation_curves" # How the responses' 'lap_time_source' names this approximation
+
+    def __init__(self, curves: dict, max_error: float = DEGRADATION_CURVES_MAX_ERROR):
+        self.knots = tuple(float(knot) for knot in curves["knots"])
+        self.year = int(curves["year"])
+        self.coefficients = np.asarray(curves["coefficients"], dtype=float)
+        self.ranges = np.asarray(curves["ranges"], dtype=float)
+        self.max_abs_error = np.asarray(curves["max_abs_error"], dtype=float)
+        self.max_error = max_error
+        self.index = {
+            (str(track), str(compound), str(driver)): position
+            for position, (track, compound, driver) in enumerate(zip(curves["tracks"], curves["compounds"], curves["drivers"]))
+            if self.max_abs_error[position] <= max_error
+        }
+        self._lock = threading.Lock()
+        self.answered_rows = 0
+        self.missed_rows = 0 # Asked for but not covered; answered by the model
+
+    def find(self, base_params: dict, compound: str):
+        """
+        Returns the index of the curve for a race's track, driver and weather on a compound,
+        or None if there is no usable curve.
+        """
+        if int(base_params.get("year", self.year)) != self.year:
+            return None
+        position = self.index.get((str(base_params["track"]), str(compound), str(base_params["driver"])))
+        if position is None:
+            return None
+        (_, _), (_, _), (air_low, air_high), (track_low, track_high) = self.ranges[position]
+        if not (air_low <= float(base_params["airtemp"]) <= air_high and track_low <= float(base_params["tracktemp"]) <= track_high):
+            return None
+        return position
+
+    def limits(self, position: int) -> tuple:
+        """
+        Returns the highest tyre life and lap number a curve was fitted on.
+        """
+        (_, tyrelife_high), (_, lapnumber_high), _, _ = self.ranges[position]
+        return tyrelife_high, lapnumber_high
+
+    def evaluate(self, position: int, tyrelife, lapnumber, airtemp: float, tracktemp: float) -> np.ndarray:
+        tyrelife = np.asarray(tyrelife, dtype=float)
+        design = piecewise_basis(
+            tyrelife, lapnumber, np.full(tyrelife.shape, float(airtemp)), np.full(tyrelife.shape, float(tracktemp)), self.knots
+        )
+        return design @ self.coefficients[position]
+
+    def record(self, answered_rows: int, missed_rows: int) -> None:
+        with self._lock:
+            self.answered_rows += answered_rows
+            self.missed_rows += missed_rows
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "curves": len(self.coefficients),
+                "usable_curves": len(self.index),
+                "max_error_s": self.max_error,
+                "year": self.year,
+                "answered_rows": self.answered_rows,
+                "missed_rows": self.missed_rows,
+            }
+
+def load_degradation_curves(loader, run_id: str, model_version: str):
+    """
+    Returns the DegradationCurves of a run, or None when they are off, missing or were
+    fitted on a different basis.
+    """
+    if not DEGRADATION_CURVES_ENABLED or not run_id:
+        return None
+    curves = loader.fetch_curves(run_id, model_version)
+    if curves is None:
+        return None
+    if str(curves.get("basis")) != CURVE_BASIS:
+        print(f"WARNING: Degradation curves of run {run_id} use basis '{curves.get('basis')}', not '{CURVE_BASIS}'. Ignoring them.")
+        return None
+    mismatch = check_basis(curves)
+    if mismatch is not None:
+        print(f"WARNING: Degradation curves of run {run_id} cannot be evaluated here: {mismatch}. Ignoring them.")
+        return None
+    if bool(curves.get("track_shards", False)) and not TRACK_SHARDS_ENABLED:
+        print(f"Degradation curves of run {run_id} were fitted to its track shards, which are disabled. Ignoring them.")
+        return None
+    loaded = DegradationCurves(curves)
+    print(f"Run {run_id} has {len(loaded.coefficients)} degradation curves, "
+          f"{len(loaded.index)} within {loaded.max_error}s of the model.")
+    return loaded
@@ -0,0 +1,154 @@
+import warnings
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+class CompiledEncoder:
+    """
+    A lightweight replacement for the fitted ColumnTransformer at inference time.
+
+    It holds the category -> output column maps of each one-hot encoded feature and the
+    output positions of the passthrough features, and writes lap dicts straight into a
+    preallocated NumPy array (converted to CSR when the ColumnTransformer would be sparse).
+    """
+    def __init__(self, categorical_maps: list, numerical_columns: list, n_features: int,
+                 sparse_output: bool, dtype=np.float64):
+        # categorical_maps: [(column_name, {category: output_index}, handle_unknown)]
+        self.categorical_maps = categorical_maps
+        # numerical_columns: [(column_name, output_index)]
+        self.numerical_columns = numerical_columns
+        self.n_features = n_features
+        self.sparse_output = sparse_output
+        self.dtype = dtype
+
+    def transform(self, laps: list):
+        """
+        Encodes a list of lap feature dicts exactly like preprocessor.transform would.
+        """
+        output = np.zeros((len(laps), self.n_features), dtype=self.dtype)
+
+        for column, mapping, handle_unknown in self.categorical_maps:
+            indices = np.array([mapping.get(lap[column], -1) for lap in laps], dtype=np.int64)
+            if handle_unknown == "error" and (indices == -1).any():
+                value = laps[int(np.argmax(indices == -1))][column]
+                raise ValueError(f"Found unknown category {value!r} in column '{column}' during transform.")
+            rows = np.flatnonzero(indices >= 0)
+            output[rows, indices[rows]] = 1.0
+
+        if self.numerical_columns:
+            names = [column for column, _ in self.numerical_columns]
+            indices = [index for _, index in self.numerical_columns]
+            values = np.array([[lap[name] for name in names] for lap in laps], dtype=np.float64)
+            output[:, indices] = values
+
+        if self.sparse_output:
+            return sparse.csr_matrix(output)
+        return output
+
+def _compile_one_hot(encoder: "OneHotEncoder", columns: list, offset: int):
+    """
+    Builds the category -> output column map for every feature of a fitted OneHotEncoder.
+    Dropped categories map to -2 so they encode as all zeros without counting as unknown.
+    """
+    if getattr(encoder, "_infrequent_enabled", False) or encoder.handle_unknown not in ("ignore", "error"):
+        return None
+
+    maps = []
+    drop_idx = encoder.drop_idx_
+    for feature, (column, categories) in enumerate(zip(columns, encoder.categories_)):
+        dropped = None if drop_idx is None or drop_idx[feature] is None else int(drop_idx[feature])
+        mapping = {}
+        for position, category in enumerate(categories.tolist()):
+            if position == dropped:
+                mapping[category] = -2
+            else:
+                mapping[category] = offset
+                offset += 1
+        maps.append((column, mapping, encoder.handle_unknown))
+    return maps, offset
+
+def _is_passthrough(transformer) -> bool:
+    from sklearn.preprocessing import FunctionTransformer
+    return transformer == "passthrough" or (
+        isinstance(transformer, FunctionTransformer) and transformer.func is None
+    )
+
+def canary_laps(encoder: CompiledEncoder) -> list:
+    """
+    Builds a small batch that touches every category, the dropped categories and an unknown one.
+    """
+    longest = max((len(mapping) for _, mapping, _ in encoder.categorical_maps), default=1)
+    laps = []
+    for row in range(longest + 1):
+        lap = {}
+        for column, mapping, handle_unknown in encoder.categorical_maps:
+            categories = list(mapping)
+            if row == longest and handle_unknown == "ignore":
+                lap[column] = "__unknown_category__"
+            else:
+                lap[column] = categories[row % len(categories)]
+        for position, (column, _) in enumerate(encoder.numerical_columns):
+            lap[column] = float((row * 7 + position * 3) % 11) # Includes zeros
+        laps.append(lap)
+    return laps
+
+def _outputs_match(expected, actual) -> bool:
+    if sparse.issparse(expected) != sparse.issparse(actual):
+        return False
+    if sparse.issparse(expected):
+        expected, actual = expected.tocsr(), actual.tocsr()
+        expected.sort_indices()
+        actual.sort_indices()
+        return (
+            expected.shape == actual.shape
+            and expected.dtype == actual.dtype
+            and np.array_equal(expected.indptr, actual.indptr)
+            and np.array_equal(expected.indices, actual.indices)
+            and np.array_equal(expected.data, actual.data)
+        )
+    return expected.dtype == actual.dtype and np.array_equal(expected, actual)
+
+def compile_preprocessor(preprocessor):
+    """
+    Compiles a fitted ColumnTransformer of OneHotEncoder and passthrough steps into a
+    CompiledEncoder. Returns None (so callers keep using sklearn) if the preprocessor uses
+    anything else or if the compiled output does not match it exactly on a canary batch.
+    """
+    # sklearn is imported here rather than at module level; unpickling the preprocessor
+    # has already loaded it by the time this runs.
+    from sklearn.preprocessing import OneHotEncoder
+    try:
+        categorical_maps, numerical_columns = [], []
+        for name, transformer, columns in preprocessor.transformers_:
+            if transformer == "drop" or len(columns) == 0:
+                continue
+            if not all(isinstance(column, str) for column in columns):
+                return None
+            output_slice = preprocessor.output_indices_[name]
+            if isinstance(transformer, OneHotEncoder):
+                compiled = _compile_one_hot(transformer, columns, output_slice.start)
+                if compiled is None:
+                    return None
+                maps, end = compiled
+                if end != output_slice.stop:
+                    return None
+                categorical_maps.extend(maps)
+            elif _is_passthrough(transformer):
+                numerical_columns.extend(zip(columns, range(output_slice.start, output_slice.stop)))
+            else:
+                return None
+
+        n_features = max(s.stop for s in preprocessor.output_indices_.values())
+        encoder = CompiledEncoder(categorical_maps, numerical_columns, n_features, preprocessor.sparse_output_)
+
+        canary = canary_laps(encoder)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore") # Unknown categories in the canary are expected
+            expected = preprocessor.transform(pd.DataFrame(canary))
+        if not _outputs_match(expected, encoder.transform(canary)):
+            print("WARNING: Compiled encoder does not match the preprocessor. Falling back to sklearn.")
+            return None
+        return encoder
+    except Exception as e:
+        print(f"WARNING: Could not compile the preprocessor ({e}). Falling back to sklearn.")
+        return None
@@ -0,0 +1,77 @@
+# Production server config for the API: pre-fork workers sharing one loaded model.
+#
+#   cd src/api && gunicorn -c gunicorn.conf.py app:app
+#
+# The app (and with it the model, compiled encoder and predictor) is loaded once in the
+# parent process. Workers are forked from it and share those pages copy-on-write, so each
+# extra worker costs its own request state rather than another copy of the model.
+import gc
+import multiprocessing
+import os
+
+# --- Configuration ---
+CPU_COUNT = multiprocessing.cpu_count()
+WORKERS = int(os.environ.get("WEB_CONCURRENCY", CPU_COUNT))
+# Request threads per worker. Simulations are CPU-bound, so a few are enough to keep the
+# micro-batcher fed without piling up work on the GIL.
+WORKER_THREADS = int(os.environ.get("WORKER_THREADS", 4))
+# Split the cores between workers so XGBoost / OpenMP / BLAS pools do not oversubscribe them.
+WORKER_INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS") or max(1, CPU_COUNT // WORKERS))
+for thread_variable in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(thread_variable, str(WORKER_INFERENCE_THREADS))
+# The parent makes its load-time predictions (predictor selection, warm-up) on one thread,
+# so no OpenMP thread pool exists at fork time; libgomp's pools do not survive fork, and a
+# worker using an inherited one can hang. Workers switch to their share in post_fork.
+# Set before the app is imported, because predictors.py reads INFERENCE_THREADS at import.
+os.environ["INFERENCE_THREADS"] = "1"
+# The parent must hold the model when it forks: a background startup thread would not be
+# copied into the workers, which would then serve 503s until their own reload.
+if os.environ.get("STARTUP_IN_BACKGROUND") == "1":
+    print("STARTUP_IN_BACKGROUND is ignored with the preloading gunicorn config; loading in the foreground.")
+os.environ["STARTUP_IN_BACKGROUND"] = "0"
+# Likewise for the lap time table. Loaded in the parent, its memory-mapped pages are shared
+# by every worker; a cached table is only size-checked, so this costs little after the first start.
+os.environ["LAP_TABLE_IN_BACKGROUND"] = "0"
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = WORKERS
+threads = WORKER_THREADS
+worker_class = "gthread"
+preload_app = True
+timeout = int(os.environ.get("WORKER_TIMEOUT", 120))
+
+def when_ready(server):
+    """
+    Runs in the parent once the preloaded app is ready, before any worker is forked.
+    """
+    from model_reloader import model_reloader
+
+    # Workers watch the registry themselves; a reload in the parent would not reach them.
+    model_reloader.stop()
+    # Move everything allocated so far out of the garbage collector's reach, so collections
+    # in the workers do not touch (and un-share) the parent's model objects.
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"Model loaded in the parent; forking {WORKERS} workers "
+                    f"with {WORKER_INFERENCE_THREADS} inference thread(s) each.")
+
+def post_fork(server, worker):
+    """
+    Background threads do not survive fork, so each worker restarts its own registry watcher.
+    The micro-batcher starts its scheduler thread on first use.
+
+    The worker then gives the loaded models its share of the cores and warms them up, which
+    starts the OpenMP thread pools in the worker rather than inheriting the parent's.
+    """
+    import predictors
+    from model_reloader import model_reloader
+    from served_models import served_models
+    from simulator import simulator
+
+    predictors.INFERENCE_THREADS = WORKER_INFERENCE_THREADS # For models loaded later in this worker
+    bundles = [simulator.active, simulator.previous, *served_models.bundles.values()]
+    for bundle in {id(bundle): bundle for bundle in bundles if bundle is not None}.values():
+        if bundle.predictor is not None:
+            bundle.predictor.set_threads(WORKER_INFERENCE_THREADS)
+            bundle.warm_up()
+    model_reloader.start()
@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+import numpy as np
+from track_shards import TRACK_SHARDS_ENABLED
+
+# --- Configuration ---
+# Answer grid and Monte Carlo lap times from the run's precomputed table (0 always skips it).
+LAP_TABLE_ENABLED = os.environ.get("LAP_TABLE_ENABLED", "1") != "0"
+LAP_TABLE_FORMAT = 1 # Bump with scripts/build_lap_table.py when the layout changes
+# Attach a run's table from a background thread, so neither startup nor a model reload
+# waits for a download of hundreds of MB; until then the curves or the model answer.
+LAP_TABLE_IN_BACKGROUND = os.environ.get("LAP_TABLE_IN_BACKGROUND", "1") != "0"
+
+class LapTimeTable:
+    """
+    Lap times precomputed by scripts/build_lap_table.py for every (track, driver, compound)
+    of the table, on a grid of air and track temperatures and every whole tyre life and lap
+    number of the race.
+
+    The times array is memory-mapped, so only the pages of the races actually asked for are
+    read. A lap costs four array lookups blended bilinearly on the two temperatures; laps
+    outside the table (other drivers, longer races, weather off the grid) are left to the model.
+    """
+    source = "lap_table" # How the responses' 'lap_time_source' names this approximation
+
+    def __init__(self, index: dict, times: np.ndarray):
+        self.index = index
+        self.times = times
+        self.year = int(index["year"])
+        self.air_temps = np.asarray(index["air_temps"], dtype=float)
+        self.track_temps = np.asarray(index["track_temps"], dtype=float)
+        self.max_tyrelife = int(index["max_tyrelife"])
+        self.max_lapnumbers = {track: int(laps) for track, laps in index["max_lapnumbers"].items()}
+        self.slabs = {tuple(key.split("|")): slab for key, slab in index["slabs"].items()}
+        self.slab_tracks = {slab: key.split("|")[0] for key, slab in index["slabs"].items()}
+        self._lock = threading.Lock()
+        self.answered_rows = 0
+        self.missed_rows = 0 # Asked for but not in the table; answered by the curves or the model
+
+    def find(self, base_params: dict, compound: str):
+        """
+        Returns the slab holding a race's track, driver and compound, or None if the race
+        is not in the table or its weather is off the temperature grid.
+        """
+        if int(base_params.get("year", self.year)) != self.year:
+            return None
+        slab = self.slabs.get((str(base_params["track"]), str(base_params["driver"]), str(compound)))
+        if slab is None:
+            return None
+        airtemp, tracktemp = float(base_params["airtemp"]), float(base_params["tracktemp"])
+        if not (self.air_temps[0] <= airtemp <= self.air_temps[-1] and self.track_temps[0] <= tracktemp <= self.track_temps[-1]):
+            return None
+        return slab
+
+    def limits(self, slab: int) -> tuple:
+        """
+        Returns the highest tyre life and lap number tabled for a race.
+        """
+        return self.max_tyrelife, self.max_lapnumbers[self.slab_tracks[slab]]
+
+    @staticmethod
+    def _bracket(grid: np.ndarray, value: float):
+        lower = int(np.clip(np.searchsorted(grid, value, side="right") - 1, 0, len(grid) - 2))
+        return lower, (value - grid[lower]) / (grid[lower + 1] - grid[lower])
+
+    def evaluate(self, slab: int, tyrelife, lapnumber, airtemp: float, tracktemp: float) -> np.ndarray:
+        """
+        Looks up whole-numbered tyre lives and lap numbers at one weather.
+        """
+        tyrelife = np.asarray(tyrelife).astype(np.intp)
+        lapnumber = np.asarray(lapnumber).astype(np.intp)
+        air, air_weight = self._bracket(self.air_temps, float(airtemp))
+        track, track_weight = self._bracket(self.track_temps, float(tracktemp))
+        corners = self.times[slab, air:air + 2, track:track + 2][:, :, tyrelife, lapnumber].astype(float)
+        air_blend = corners[0] * (1.0 - air_weight) + corners[1] * air_weight
+        return air_blend[0] * (1.0 - track_weight) + air_blend[1] * track_weight
+
+    def record(self, answered_rows: int, missed_rows: int) -> None:
+        with self._lock:
+            self.answered_rows += answered_rows
+            self.missed_rows += missed_rows
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "slabs": len(self.slabs),
+                "built_for_model_version": self.index.get("model_version"),
+                "accuracy": self.index.get("accuracy"),
+                "answered_rows": self.answered_rows,
+                "missed_rows": self.missed_rows,
+            }
+
+def load_lap_table(loader, run_id: str, model_version: str):
+    """
+    Returns the LapTimeTable of a run, or None when tables are off, the run has none, or it
+    is in another format or was built with track shards the API is not serving.
+    """
+    if not LAP_TABLE_ENABLED or not run_id:
+        return None
+    table = loader.fetch_lap_table(run_id, model_version)
+    if table is None:
+        return None
+    index = table["index"]
+    if index.get("format") != LAP_TABLE_FORMAT:
+        print(f"WARNING: The lap time table of run {run_id} has format {index.get('format')}, not {LAP_TABLE_FORMAT}. Ignoring it.")
+        return None
+    if index.get("track_shards") and not TRACK_SHARDS_ENABLED:
+        print(f"The lap time table of run {run_id} was built with its track shards, which are disabled. Ignoring it.")
+        return None
+    loaded = LapTimeTable(index, table["times"])
+    print(f"Run {run_id} has a lap time table of {len(loaded.slabs)} races ({table['times'].nbytes / 1e6:.1f} MB, memory-mapped).")
+    return loaded
+
+def attach_lap_table(bundle, loader, background: bool = None) -> None:
+    """
+    Loads the LapTimeTable of a bundle's run and sets it as bundle.lap_table, from a
+    background thread unless LAP_TABLE_IN_BACKGROUND is off.
+    """
+    if not LAP_TABLE_ENABLED or not bundle.run_id:
+        return
+
+    def attach():
+        started = time.perf_counter()
+        try:
+            table = load_lap_table(loader, bundle.run_id, bundle.model_version)
+        except Exception as e:
+            print(f"WARNING: Could not load the lap time table of run {bundle.run_id} ({e}).")
+            return
+        if table is not None:
+            bundle.lap_table = table
+            print(f"Lap time table attached to model version {bundle.model_version} "
+                  f"after {time.perf_counter() - started:.1f}s.")
+
+    if LAP_TABLE_IN_BACKGROUND if background is None else background:
+        threading.Thread(target=attach, name="lap-table-load", daemon=True).start()
+    else:
+        attach()
@@ -0,0 +1,191 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# --- Configuration ---
+# With metrics off, stage() is a no-op and nothing is recorded.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+# Adds a Server-Timing header with the per-stage durations of each request.
+SERVER_TIMING_ENABLED = os.environ.get("SERVER_TIMING_ENABLED", "0") == "1"
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+def _format_labels(label_names: tuple, label_values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """
+    A monotonically increasing count per label combination.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values: tuple = (), amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            return [
+                f"{self.name}{_format_labels(self.label_names, labels)} {value:g}"
+                for labels, value in sorted(self._values.items())
+            ]
+
+class Histogram:
+    """
+    A fixed-bucket histogram per label combination, in the Prometheus exposition layout.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: tuple, label_names: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label_names = label_names
+        self._series = {} # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, label_values: tuple = ()) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> list:
+        lines = []
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    bucket_labels = _format_labels(self.label_names, labels, 'le="' + le + '"')
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {series[-1]:.6f}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """
+    Holds the process's metrics and renders them in the Prometheus text format.
+
+    Collectors are callables, registered by components that already keep their own
+    counters (the caches), returning [(name, kind, help, value)] at scrape time.
+    """
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, help_text: str, label_names: tuple = ()) -> Counter:
+        metric = Counter(name, help_text, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, buckets: tuple, label_names: tuple = ()) -> Histogram:
+        metric = Histogram(name, help_text, buckets, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, help_text, value in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+# A single registry for the whole process.
+registry = MetricsRegistry()
+
+REQUESTS = registry.counter("f1_api_requests_total", "HTTP requests by endpoint and status code.", ("endpoint", "status"))
+REQUEST_SECONDS = registry.histogram(
+    "f1_api_request_duration_seconds", "End-to-end request latency.", LATENCY_BUCKETS, ("endpoint",)
+)
+STAGE_SECONDS = registry.histogram(
+    "f1_api_stage_duration_seconds", "Time spent in each stage of serving a request.", LATENCY_BUCKETS, ("stage",)
+)
+INFERENCE_BATCH_ROWS = registry.histogram(
+    "f1_api_inference_batch_rows", "Rows per model predict call.", ROW_BUCKETS
+)
+INFERENCE_QUEUE_WAIT_SECONDS = registry.histogram(
+    "f1_api_inference_queue_wait_seconds", "Time requests wait in the micro-batcher queue.", LATENCY_BUCKETS
+)
+
+# Stage durations of the request running in the current context, for Server-Timing.
+_request_stages = contextvars.ContextVar("request_stages", default=None)
+
+def start_request():
+    """
+    Starts collecting stage durations for the current request. Returns a token for end_request().
+    """
+    return _request_stages.set({})
+
+def current_stages() -> dict:
+    """
+    Returns the {stage: seconds} recorded so far by the current request.
+    """
+    return _request_stages.get() or {}
+
+def end_request(token) -> dict:
+    """
+    Stops collecting and returns the request's {stage: seconds}.
+    """
+    stages = _request_stages.get() or {}
+    _request_stages.reset(token)
+    return stages
+
+@contextmanager
+def stage(name: str):
+    """
+    Times a block as one stage: recorded in the stage histogram and, inside a request,
+    in that request's Server-Timing durations.
+    """
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, (name,))
+        stages = _request_stages.get()
+        if stages is not None:
+            stages[name] = stages.get(name, 0.0) + elapsed
+
+def record_request(endpoint: str, status: int, elapsed: float) -> None:
+    if not METRICS_ENABLED:
+        return
+    REQUESTS.inc((endpoint, str(status)))
+    REQUEST_SECONDS.observe(elapsed, (endpoint,))
+
+def server_timing_header(stages: dict, total: float) -> str:
+    """
+    Formats stage durations (seconds) as a Server-Timing header value in milliseconds.
+    """
+    entries = [f"{name};dur={seconds * 1000.0:.3f}" for name, seconds in stages.items()]
+    entries.append(f"total;dur={total * 1000.0:.3f}")
+    return ", ".join(entries)
@@ -0,0 +1,167 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+import numpy as np
+from metrics import INFERENCE_QUEUE_WAIT_SECONDS
+
+# --- Configuration ---
+# The longest the scheduler keeps adding queued requests to a batch (0 disables coalescing).
+# A batch runs as soon as the queue is empty, so a lone request never waits for the window.
+INFERENCE_BATCH_WINDOW_MS = float(os.environ.get("INFERENCE_BATCH_WINDOW_MS", 2.0))
+# A batch is run as soon as it holds this many rows; larger requests skip the queue.
+INFERENCE_MAX_BATCH_ROWS = int(os.environ.get("INFERENCE_MAX_BATCH_ROWS", 4096))
+# How long a request waits for its batch before giving up with InferenceTimeout (a 503).
+INFERENCE_TIMEOUT_SECONDS = float(os.environ.get("INFERENCE_TIMEOUT_SECONDS", 30.0))
+BATCH_SIZE_BUCKETS = (1, 10, 100, 1000, 10000) # Upper bounds (rows) of the batch size histogram
+RECENT_WAITS = 1000 # Queue waits kept for the percentile stats
+
+class InferenceTimeout(TimeoutError):
+    """
+    Raised to a caller whose batch did not finish within the timeout.
+    """
+
+class MicroBatcher:
+    """
+    Coalesces prediction requests from concurrent handlers into shared model calls.
+
+    Callers hand over their feature rows and block. A single scheduler thread takes the
+    first waiting request, adds the requests queued behind it (until the queue is empty,
+    window_ms has passed or the batch holds max_batch_rows rows), runs one predict per
+    model bundle on the combined rows and routes each slice of the results back to the
+    request that asked for it. Requests arriving while a batch runs form the next one.
+    """
+    def __init__(self, predict_rows, window_ms: float = INFERENCE_BATCH_WINDOW_MS,
+                 max_batch_rows: int = INFERENCE_MAX_BATCH_ROWS, timeout_seconds: float = INFERENCE_TIMEOUT_SECONDS):
+        # predict_rows(bundle, laps) -> np.ndarray, the uncached transform + predict call.
+        self.predict_rows = predict_rows
+        self.window_ms = window_ms
+        self.max_batch_rows = max_batch_rows
+        self.timeout_seconds = timeout_seconds
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.rows = 0
+        self.max_rows = 0
+        self.bypassed = 0
+        self.timeouts = 0
+        self.batch_size_counts = {bound: 0 for bound in BATCH_SIZE_BUCKETS + (float("inf"),)}
+        self._queue_waits_ms = deque(maxlen=RECENT_WAITS)
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_ms > 0
+
+    def predict(self, bundle, laps: list) -> np.ndarray:
+        """
+        Predicts laps with the given bundle, sharing the model call with any concurrent requests.
+        """
+        if not self.enabled or len(laps) >= self.max_batch_rows:
+            with self._stats_lock:
+                self.bypassed += 1
+            return self.predict_rows(bundle, laps)
+
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((bundle, laps, time.perf_counter(), future))
+        try:
+            return future.result(timeout=self.timeout_seconds)
+        except FutureTimeout:
+            future.cancel() # Dropped from its batch if that has not started yet
+            with self._stats_lock:
+                self.timeouts += 1
+            raise InferenceTimeout(f"Inference did not finish within {self.timeout_seconds:g} seconds.") from None
+
+    def _ensure_worker(self) -> None:
+        # Started on first use (not at import), so forked workers each get their own thread.
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            rows = len(batch[0][1])
+            deadline = time.perf_counter() + self.window_ms / 1000.0
+            while rows < self.max_batch_rows and time.perf_counter() < deadline:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+                rows += len(item[1])
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: list) -> None:
+        """
+        Runs one predict per bundle in the batch and resolves every waiting request.
+        """
+        started = time.perf_counter()
+        batch = [item for item in batch if item[3].set_running_or_notify_cancel()] # Skip timed out requests
+        if not batch:
+            return
+        groups = {}
+        for item in batch:
+            groups.setdefault(id(item[0]), []).append(item)
+
+        for items in groups.values():
+            bundle = items[0][0]
+            combined = [lap for _, laps, _, _ in items for lap in laps]
+            try:
+                predictions = self.predict_rows(bundle, combined)
+            except Exception as e:
+                for _, _, _, future in items:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for _, laps, _, future in items:
+                future.set_result(predictions[offset:offset + len(laps)])
+                offset += len(laps)
+
+        rows = sum(len(item[1]) for item in batch)
+        with self._stats_lock:
+            self.batches += 1
+            self.requests += len(batch)
+            self.rows += rows
+            self.max_rows = max(self.max_rows, rows)
+            self.batch_size_counts[next(b for b in self.batch_size_counts if rows <= b)] += 1
+            self._queue_waits_ms.extend((started - enqueued) * 1000.0 for _, _, enqueued, _ in batch)
+        for _, _, enqueued, _ in batch:
+            INFERENCE_QUEUE_WAIT_SECONDS.observe(started - enqueued)
+
+    def stats(self) -> dict:
+        """
+        Returns batch size and queue wait statistics for tuning the window.
+        """
+        with self._stats_lock:
+            waits = np.asarray(self._queue_waits_ms, dtype=float)
+            return {
+                "enabled": self.enabled,
+                "window_ms": self.window_ms,
+                "max_batch_rows": self.max_batch_rows,
+                "batches": self.batches,
+                "requests": self.requests,
+                "bypassed_requests": self.bypassed,
+                "timeouts": self.timeouts,
+                "timeout_seconds": self.timeout_seconds,
+                "mean_requests_per_batch": round(self.requests / self.batches, 2) if self.batches else 0.0,
+                "mean_rows_per_batch": round(self.rows / self.batches, 2) if self.batches else 0.0,
+                "max_rows_per_batch": self.max_rows,
+                "batch_size_histogram": {
+                    f"<={bound:g}": count for bound, count in self.batch_size_counts.items()
+                },
+                "queue_wait_ms": {
+                    "p50": round(float(np.percentile(waits, 50)), 3) if waits.size else 0.0,
+                    "p95": round(float(np.percentile(waits, 95)), 3) if waits.size else 0.0,
+                    "max": round(float(waits.max()), 3) if waits.size else 0.0,
+                },
+            }
@@ -1,22 +1,311 @@
-import mlflow
+import json
 import os
+import re
+import tempfile
+import threading
 import joblib
+import numpy as np
+from artifact_cache import ArtifactCache, file_sha256
 
 # --- Configuration ---
 MLFLOW_MODEL_NAME = "tire_degradation_model_v1"
 MODEL_ALIAS = "production"
 MODEL_ARTIFACT_NAME = "model.joblib"
 PREPROCESSOR_ARTIFACT_NAME = "preprocessor.joblib"
-    
+# Per-track models written by model/train.py next to the global model of the same run.
+SHARDS_DIR = "shards"
+SHARD_MANIFEST_NAME = "manifest.json"
+# Degradation curves distilled from the run's predictions (model/distill.py), if it has them.
+CURVES_ARTIFACT_NAME = "curves.npz"
+# Lap times precomputed by scripts/build_lap_table.py, memory-mapped by the API.
+LAP_TABLE_DIR = "lap_table"
+LAP_TABLE_ARTIFACT_NAMES = ("index.json", "times.npy")
+ARTIFACT_CACHE_ENABLED = os.environ.get("ARTIFACT_CACHE_ENABLED", "1") != "0"
+# Artifacts a run may not have: cache key suffix -> (directory in the run, file names).
+# A run found without them is remembered in the cache, so a cached start never needs the
+# registry to find that out again; the background registry check notices if they are added.
+OPTIONAL_ARTIFACTS = {
+    "shards": (SHARDS_DIR, (SHARD_MANIFEST_NAME,)),
+    "curves": ("", (CURVES_ARTIFACT_NAME,)),
+    "lap_table": (LAP_TABLE_DIR, LAP_TABLE_ARTIFACT_NAMES),
+}
+# Optional artifacts read back from the cache after a size check only. They were hashed
+# when cached; the lap table is hundreds of MB and is loaded without pickle.
+SIZE_CHECKED_ARTIFACTS = ("lap_table",)
+
+def _mlflow_client():
+    """
+    Imports mlflow on first use. It is slow to import and not needed when the artifacts
+    are already cached locally.
+    """
+    import mlflow
+    return mlflow.tracking.MlflowClient()
+
 class ModelLoader:
     """
     A dedicated class to handle loading model artifacts from the MLflow Model Registry.
+
+    Artifacts are kept in a local content-addressed cache. When the cache already holds the
+    last known production run, startup loads it immediately and checks the registry in a
+    background thread instead of blocking on the network. Nothing is loaded (and mlflow is
+    not imported) until load() is called.
     """
-    def __init__(self):
-        print("Initializing ModelLoader...")
+    def __init__(self, cache: ArtifactCache = None):
         self.model = None
         self.preprocessor = None
-        self._load_artifacts()
+        self.model_version = None
+        self.run_id = None
+        self.source = None
+        self.preprocessor_sha256 = None
+        self.latest_registry_version = None
+        self.cache = cache
+        if self.cache is None and ARTIFACT_CACHE_ENABLED:
+            try:
+                self.cache = ArtifactCache()
+            except OSError as e:
+                print(f"WARNING: Artifact cache unavailable ({e}). Loading directly from MLflow.")
+
+    def load(self):
+        """
+        Loads the production preprocessor and model, from the local cache when possible.
+        """
+        print("Initializing ModelLoader...")
+        if self._load_from_cache():
+            threading.Thread(target=self._refresh_from_registry, name="registry-refresh", daemon=True).start()
+        else:
+            self._load_artifacts()
+
+    def _read_artifacts(self, artifact_paths: dict):
+        """
+        Deserializes the preprocessor and model from local files.
+        """
+        preprocessor = joblib.load(artifact_paths[PREPROCESSOR_ARTIFACT_NAME])
+        print("Preprocessor loaded successfully.")
+        model = joblib.load(artifact_paths[MODEL_ARTIFACT_NAME])
+        print("Model loaded successfully.")
+        return preprocessor, model
+
+    def _load_run(self, artifact_paths: dict, run_id: str, model_version: str, source: str):
+        """
+        Loads the preprocessor and model from local files and records where they came from.
+        """
+        self.preprocessor, self.model = self._read_artifacts(artifact_paths)
+        self.preprocessor_sha256 = file_sha256(artifact_paths[PREPROCESSOR_ARTIFACT_NAME])
+        self.run_id = run_id
+        self.model_version = model_version
+        self.source = source
+
+    def _load_from_cache(self) -> bool:
+        """
+        Loads the last known production run from the local cache without touching the network.
+        """
+        if self.cache is None:
+            return False
+
+        known = self.cache.resolve_alias(MLFLOW_MODEL_NAME, MODEL_ALIAS)
+        if not known:
+            return False
+
+        artifact_paths = self.cache.get_run(known["run_id"])
+        if not artifact_paths:
+            return False
+
+        try:
+            print(f"Loading cached production model: Version {known['model_version']}, Run ID: {known['run_id']}")
+            self._load_run(artifact_paths, known["run_id"], known["model_version"], source="cache")
+            print("--- ModelLoader initialization complete (from local cache). ---")
+            return True
+        except Exception as e:
+            print(f"WARNING: Could not load cached artifacts ({e}). Falling back to the registry.")
+            return False
+
+    def _download_run(self, client, run_id: str, model_version: str, directory: str = "", cache_key: str = None,
+                      artifact_names: tuple = (PREPROCESSOR_ARTIFACT_NAME, MODEL_ARTIFACT_NAME),
+                      optional: bool = False, verify: bool = True) -> dict:
+        """
+        Returns local paths for a run's artifacts (the ones in a sub-directory of the run, if
+        given), downloading them only if they are not already cached. The client is only
+        created on a cache miss, when it is passed as None.
+
+        Optional artifacts are looked up in the run's listing first. If they are not there,
+        that is cached and FileNotFoundError is raised, now and on later calls. verify=False
+        checks cached artifacts by size instead of re-hashing them.
+        """
+        cache_key = cache_key or run_id
+        if self.cache is not None:
+            cached_paths = self.cache.get_run(cache_key, verify=verify)
+            if cached_paths:
+                print(f"Artifacts for {cache_key} found in the local cache.")
+                return cached_paths
+            if optional and self.cache.is_missing(cache_key):
+                raise FileNotFoundError(f"the local cache records {cache_key} as not in the run")
+
+        client = client or _mlflow_client()
+        if optional and not self._run_has_artifacts(client, run_id, directory, artifact_names):
+            if self.cache is not None:
+                self.cache.put_missing(cache_key, model_version)
+            raise FileNotFoundError(f"{cache_key} is not in the run")
+
+        download_dir = tempfile.mkdtemp(prefix="f1-artifacts-")
+        artifact_paths = {}
+        for artifact_name in artifact_names:
+            artifact_path = f"{directory}/{artifact_name}" if directory else artifact_name
+            print(f"Downloading artifact: {artifact_path}")
+            artifact_paths[artifact_name] = client.download_artifacts(
+                run_id=run_id,
+                path=artifact_path,
+                dst_path=download_dir
+            )
+
+        if self.cache is not None:
+            artifact_paths = self.cache.put_run(cache_key, model_version, artifact_paths)
+        return artifact_paths
+
+    @staticmethod
+    def _run_has_artifacts(client, run_id: str, directory: str, artifact_names: tuple) -> bool:
+        """
+        Checks the run's artifact listing. Registry errors are raised, not taken as a miss.
+        """
+        listed = {info.path for info in client.list_artifacts(run_id, directory or None)}
+        return all((f"{directory}/{name}" if directory else name) in listed for name in artifact_names)
+
+    def _download_optional(self, kind: str, run_id: str, model_version: str, client=None) -> dict:
+        """
+        Downloads (or finds in the cache) one of a run's OPTIONAL_ARTIFACTS.
+        """
+        directory, artifact_names = OPTIONAL_ARTIFACTS[kind]
+        return self._download_run(
+            client, run_id, model_version, directory=directory, cache_key=f"{run_id}.{kind}",
+            artifact_names=artifact_names, optional=True, verify=kind not in SIZE_CHECKED_ARTIFACTS
+        )
+
+    def _recheck_missing(self, client, run_id: str, model_version: str) -> None:
+        """
+        Looks again for the optional artifacts the cache records as missing from a run, and
+        caches any that have been added since, for the next model load.
+        """
+        for kind, (directory, artifact_names) in OPTIONAL_ARTIFACTS.items():
+            cache_key = f"{run_id}.{kind}"
+            if not self.cache.is_missing(cache_key) or not self._run_has_artifacts(client, run_id, directory, artifact_names):
+                continue
+            self.cache.forget(cache_key)
+            self._download_optional(kind, run_id, model_version, client)
+            print(f"Run {run_id} now has {kind}; they will be used on the next model load.")
+
+    def fetch_shard_manifest(self, run_id: str, model_version: str):
+        """
+        Returns the run's track shard manifest, or None if the run was trained without shards.
+        """
+        try:
+            artifact_paths = self._download_optional("shards", run_id, model_version)
+            with open(artifact_paths[SHARD_MANIFEST_NAME]) as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"No track shards for run {run_id} ({e}).")
+            return None
+
+    def fetch_curves(self, run_id: str, model_version: str):
+        """
+        Returns the run's distilled degradation curves as a dict of arrays, or None if the
+        run was trained without them.
+        """
+        try:
+            artifact_paths = self._download_optional("curves", run_id, model_version)
+            with np.load(artifact_paths[CURVES_ARTIFACT_NAME], allow_pickle=False) as curves:
+                return {name: curves[name] for name in curves.files}
+        except Exception as e:
+            print(f"No degradation curves for run {run_id} ({e}).")
+            return None
+
+    def fetch_lap_table(self, run_id: str, model_version: str):
+        """
+        Returns the run's lap time table as {"index": dict, "times": memory-mapped array},
+        or None if no table was built for it.
+        """
+        try:
+            artifact_paths = self._download_optional("lap_table", run_id, model_version)
+            with open(artifact_paths["index.json"]) as f:
+                index = json.load(f)
+            return {"index": index, "times": np.load(artifact_paths["times.npy"], mmap_mode="r")}
+        except Exception as e:
+            print(f"No lap time table for run {run_id} ({e}).")
+            return None
+
+    def fetch_shard(self, run_id: str, model_version: str, shard_path: str) -> dict:
+        """
+        Loads one track shard's preprocessor and model (from shard_path inside the run).
+        """
+        cache_key = f"{run_id}.{re.sub(r'[^A-Za-z0-9_-]+', '_', shard_path)}"
+        artifact_paths = self._download_run(None, run_id, model_version, directory=shard_path, cache_key=cache_key)
+        preprocessor, model = self._read_artifacts(artifact_paths)
+        return {
+            "preprocessor": preprocessor,
+            "model": model,
+            "preprocessor_sha256": file_sha256(artifact_paths[PREPROCESSOR_ARTIFACT_NAME]),
+        }
+
+    def _get_model_version(self, client, reference: str):
+        """
+        Gets the details of a registered model version, given an alias or a version number.
+        """
+        if reference.isdigit():
+            print(f"Fetching version {reference} of model '{MLFLOW_MODEL_NAME}'...")
+            return client.get_model_version(name=MLFLOW_MODEL_NAME, version=reference)
+        print(f"Fetching model version with alias '{reference}' for model '{MLFLOW_MODEL_NAME}'...")
+        return client.get_model_version_by_alias(name=MLFLOW_MODEL_NAME, alias=reference)
+
+    def _get_production_version(self, client):
+        """
+        Gets the details of the model version aliased as 'production'.
+        """
+        model_version_details = self._get_model_version(client, MODEL_ALIAS)
+        print(f"Found production model: Version {model_version_details.version}, Run ID: {model_version_details.run_id}")
+        return model_version_details
+
+    def fetch_model(self, reference: str) -> dict:
+        """
+        Resolves an alias or version number and loads that run's preprocessor and model
+        without touching the currently loaded pair. Used for hot reloads and extra served models.
+        """
+        client = _mlflow_client()
+        model_version_details = self._get_model_version(client, reference)
+        run_id = model_version_details.run_id
+        model_version = str(model_version_details.version)
+
+        artifact_paths = self._download_run(client, run_id, model_version)
+        preprocessor, model = self._read_artifacts(artifact_paths)
+        if self.cache is not None and not reference.isdigit():
+            self.cache.set_alias(MLFLOW_MODEL_NAME, reference, run_id, model_version)
+        return {
+            "preprocessor": preprocessor,
+            "model": model,
+            "model_version": model_version,
+            "run_id": run_id,
+            "preprocessor_sha256": file_sha256(artifact_paths[PREPROCESSOR_ARTIFACT_NAME]),
+        }
+
+    def fetch_production(self) -> dict:
+        """
+        Resolves the 'production' alias and loads that run's preprocessor and model without
+        touching the currently loaded pair. Used for hot reloads.
+        """
+        artifacts = self.fetch_model(MODEL_ALIAS)
+        self.latest_registry_version = artifacts["model_version"]
+        return artifacts
+
+    def get_run_id(self, reference: str) -> str:
+        """
+        Returns the run ID an alias or version number currently points to.
+        """
+        return self._get_model_version(_mlflow_client(), reference).run_id
+
+    def get_production_run_id(self) -> str:
+        """
+        Returns the run ID the 'production' alias currently points to.
+        """
+        model_version_details = self._get_production_version(_mlflow_client())
+        self.latest_registry_version = str(model_version_details.version)
+        return model_version_details.run_id
 
     def _load_artifacts(self):
         """
@@ -24,35 +313,20 @@ class ModelLoader:
         alias, gets its run ID, and downloads the model and preprocessor artifacts.
         """
         try:
-            client = mlflow.tracking.MlflowClient()
-            
+            client = _mlflow_client()
+
             # 1. Get the details of the model version aliased as 'production'
-            print(f"Fetching model version with alias '{MODEL_ALIAS}' for model '{MLFLOW_MODEL_NAME}'...")
-            model_version_details = client.get_model_version_by_alias(
-                name=MLFLOW_MODEL_NAME, 
-                alias=MODEL_ALIAS
-            )
+            model_version_details = self._get_production_version(client)
             run_id = model_version_details.run_id
-            print(f"Found production model: Version {model_version_details.version}, Run ID: {run_id}")
+            model_version = str(model_version_details.version)
+            self.latest_registry_version = model_version
+
+            # 2. Download (or reuse cached) preprocessor and model artifacts from that run
+            artifact_paths = self._download_run(client, run_id, model_version)
+            self._load_run(artifact_paths, run_id, model_version, source="registry")
+            if self.cache is not None:
+                self.cache.set_alias(MLFLOW_MODEL_NAME, MODEL_ALIAS, run_id, model_version)
 
-            # 2. Download the preprocessor artifact from that run
-            print(f"Downloading artifact: {PREPROCESSOR_ARTIFACT_NAME}")
-            local_preprocessor_path = client.download_artifacts(
-                run_id=run_id, 
-                path=PREPROCESSOR_ARTIFACT_NAME
-            )
-            self.preprocessor = joblib.load(local_preprocessor_path)
-            print("Preprocessor loaded successfully.")
-
-            # 3. Download the model artifact from that same run
-            print(f"Downloading artifact: {MODEL_ARTIFACT_NAME}")
-            local_model_path = client.download_artifacts(
-                run_id=run_id, 
-                path=MODEL_ARTIFACT_NAME
-            )
-            self.model = joblib.load(local_model_path)
-            print("Model loaded successfully.")
-            
             print("--- ModelLoader initialization complete. ---")
 
         except Exception as e:
@@ -60,7 +334,33 @@ class ModelLoader:
             print("The simulator will not be able to make predictions.")
             self.model = None
             self.preprocessor = None
+            self.model_version = None
+            self.run_id = None
+            self.source = None
+            self.preprocessor_sha256 = None
+
+    def _refresh_from_registry(self):
+        """
+        Checks the registry after a cached startup. If the production alias has moved, the
+        new run is downloaded into the cache so it is ready for the next load.
+        """
+        try:
+            client = _mlflow_client()
+            model_version_details = self._get_production_version(client)
+            model_version = str(model_version_details.version)
+            self.latest_registry_version = model_version
+            if model_version_details.run_id == self.run_id:
+                print("Cached production model is up to date with the registry.")
+                self._recheck_missing(client, self.run_id, self.model_version)
+                return
+
+            print(f"Registry has a newer production model (Version {model_version}). Caching it...")
+            self._download_run(client, model_version_details.run_id, model_version)
+            self.cache.set_alias(MLFLOW_MODEL_NAME, MODEL_ALIAS, model_version_details.run_id, model_version)
+            print(f"Version {model_version} is cached and will be used on the next model load.")
+        except Exception as e:
+            print(f"WARNING: Could not check the MLflow Registry ({e}). Serving the cached model.")
 
 # Create a single, global instance of the loader.
-# The model will be loaded once when the application starts.
+# The model is loaded once by startup.py when the application starts.
 model_loader = ModelLoader()
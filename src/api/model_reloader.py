@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+from model_loader import model_loader
+from simulator import simulator
+from served_models import served_models
+
+# --- Configuration ---
+# How often to check the 'production' alias for a new model (0 disables the watcher).
+MODEL_POLL_INTERVAL_SECONDS = float(os.environ.get("MODEL_POLL_INTERVAL_SECONDS", 60))
+
+class ModelReloader:
+    """
+    Swaps new production models into the simulator without restarting the API.
+
+    A background thread polls the registry. When the 'production' alias moves, the new
+    preprocessor and model are loaded, compiled and warmed up off the request path, then
+    swapped in atomically. Reloads and rollbacks can also be triggered on demand.
+    """
+    def __init__(self, simulator, loader, served_models, poll_interval: float = MODEL_POLL_INTERVAL_SECONDS):
+        self.simulator = simulator
+        self.loader = loader
+        # The other served models are refreshed on the same schedule.
+        self.served_models = served_models
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock() # One reload or rollback at a time
+        self._thread = None
+        self._stop = threading.Event()
+        # A run rolled back from is not reloaded automatically until the alias moves on.
+        self.rejected_run_id = None
+        self.reloads = 0
+        self.rollbacks = 0
+        self.last_checked_at = None
+        self.last_error = None
+
+    def start(self) -> None:
+        """
+        Starts the background watcher (once).
+        """
+        if self.poll_interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch, name="model-reloader", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the background watcher after its current check. Used by the pre-fork server,
+        where each worker runs its own watcher instead of the parent.
+        """
+        self._stop.set()
+
+    def _watch(self) -> None:
+        stop = self._stop
+        while not stop.wait(self.poll_interval):
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"WARNING: Background model reload failed ({e}). Keeping version {self.simulator.active.model_version}.")
+            self.served_models.refresh()
+
+    def reload(self, force: bool = False) -> dict:
+        """
+        Loads the model the 'production' alias points to and swaps it in if it is not already
+        active. With force=True the run is reloaded even if it is already active or was
+        rolled back from.
+        """
+        with self._lock:
+            self.last_checked_at = time.time()
+            try:
+                run_id = self.loader.get_production_run_id()
+                active = self.simulator.active
+                if not force and run_id in (active.run_id, self.rejected_run_id):
+                    return {"status": "unchanged", "model_version": active.model_version, "run_id": active.run_id}
+
+                print(f"Loading production run {run_id} for a hot swap...")
+                artifacts = self.loader.fetch_production()
+                bundle = self.served_models.build_bundle(artifacts, source="registry")
+                if bundle.predictor is None:
+                    raise ValueError("The new model could not be loaded.")
+                bundle.warm_up()
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+
+            previous_version = self.simulator.active.model_version
+            self.simulator.swap(bundle)
+            self.rejected_run_id = None
+            self.reloads += 1
+            self.last_error = None
+            print(f"Swapped model version {previous_version} -> {bundle.model_version}.")
+            return {
+                "status": "reloaded",
+                "previous_model_version": previous_version,
+                "model_version": bundle.model_version,
+                "run_id": bundle.run_id,
+            }
+
+    def rollback(self) -> dict:
+        """
+        Swaps the previously active model back in and stops the watcher from reloading the
+        rolled-back run.
+        """
+        with self._lock:
+            rolled_back = self.simulator.rollback()
+            self.rejected_run_id = rolled_back.run_id
+            self.rollbacks += 1
+            print(f"Rolled back model version {rolled_back.model_version} -> {self.simulator.active.model_version}.")
+            return {
+                "status": "rolled_back",
+                "previous_model_version": rolled_back.model_version,
+                "model_version": self.simulator.active.model_version,
+                "run_id": self.simulator.active.run_id,
+            }
+
+    def stats(self) -> dict:
+        previous = self.simulator.previous
+        return {
+            "poll_interval_seconds": self.poll_interval,
+            "watching": self._thread is not None and self._thread.is_alive(),
+            "reloads": self.reloads,
+            "rollbacks": self.rollbacks,
+            "rollback_model_version": previous.model_version if previous is not None else None,
+            "last_checked_at": self.last_checked_at,
+            "last_error": self.last_error,
+        }
+
+# A single, global reloader for the simulator shared by every route.
+model_reloader = ModelReloader(simulator, model_loader, served_models)
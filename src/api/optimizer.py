@@ -0,0 +1,187 @@
+import itertools
+import numpy as np
+from simulator import simulator # We reuse the simulator's model and feature building
+from track_config import get_track_settings
+
+# --- Configuration ---
+DRY_COMPOUNDS = ["soft", "medium", "hard"]
+MAX_SUPPORTED_STOPS = 3
+DEFAULT_MIN_STINT_LAPS = 5
+DEFAULT_TOP_K = 5
+
+def parse_search_options(params: dict, max_supported_stops: int = MAX_SUPPORTED_STOPS) -> dict:
+    """
+    Validates a strategy search request and fills in track defaults from track_config.yaml.
+    """
+    track_settings = get_track_settings(params.get("track"))
+
+    options = {
+        "total_laps": int(params.get("total_laps", track_settings.get("total_laps", 55))),
+        "pit_loss": float(params.get("pit_loss", track_settings.get("pit_stop_time", 23.0))),
+        "max_stops": int(params.get("max_stops", MAX_SUPPORTED_STOPS)),
+        "compounds": [c.lower() for c in params.get("compounds", DRY_COMPOUNDS)],
+        "min_compounds": int(params.get("min_compounds", 2)),
+        "min_stint_laps": int(params.get("min_stint_laps", DEFAULT_MIN_STINT_LAPS)),
+        "top_k": int(params.get("top_k", DEFAULT_TOP_K)),
+    }
+    options["max_stint_laps"] = int(params.get("max_stint_laps", options["total_laps"]))
+
+    if options["total_laps"] < 1:
+        raise ValueError("'total_laps' must be at least 1.")
+    if not 0 <= options["max_stops"] <= max_supported_stops:
+        raise ValueError(f"'max_stops' must be between 0 and {max_supported_stops}.")
+    if not options["compounds"]:
+        raise ValueError("'compounds' must list at least one tyre compound.")
+    if options["min_compounds"] > count_dry_compounds(options["compounds"]):
+        raise ValueError("'min_compounds' cannot exceed the number of allowed dry compounds.")
+    if not 1 <= options["min_stint_laps"] <= options["max_stint_laps"]:
+        raise ValueError("Stint length limits must satisfy 1 <= min_stint_laps <= max_stint_laps.")
+    if options["top_k"] < 1:
+        raise ValueError("'top_k' must be at least 1.")
+
+    return options
+
+def count_dry_compounds(compounds) -> int:
+    """
+    Counts the different dry compounds in a list. The regulation's two-compound rule (and
+    so 'min_compounds') is about dry tyres; intermediates and wets do not count towards it.
+    """
+    return len(set(compounds) & set(DRY_COMPOUNDS))
+
+def smallest_indices(values: np.ndarray, k: int) -> np.ndarray:
+    """
+    Returns the indices of the k smallest finite values in ascending order (ties by index,
+    as a stable argsort would), without sorting the whole array.
+    """
+    if len(values) > k:
+        kth = np.partition(values, k - 1)[k - 1]
+        candidates = np.flatnonzero(values <= kth)
+    else:
+        candidates = np.flatnonzero(np.isfinite(values))
+    candidates = candidates[np.isfinite(values[candidates])]
+    return candidates[np.argsort(values[candidates], kind="stable")[:k]]
+
+def stint_cost_matrix(grid: np.ndarray, options: dict) -> np.ndarray:
+    """
+    Builds cost[compound, first_lap, last_lap]: the summed lap times of a stint on fresh tyres.
+
+    Stints shorter or longer than the allowed limits are given an infinite cost so they
+    drop out of every candidate that uses them.
+    """
+    num_compounds = grid.shape[0]
+    total_laps = options["total_laps"]
+    max_length = min(options["max_stint_laps"], total_laps)
+
+    cost = np.full((num_compounds, total_laps + 2, total_laps + 1), np.inf)
+    for first_lap in range(1, total_laps + 1):
+        length = min(max_length, total_laps - first_lap + 1)
+        tyre_life = np.arange(1, length + 1)
+        lap_numbers = np.arange(first_lap, first_lap + length)
+        cumulative = np.cumsum(grid[:, tyre_life, lap_numbers], axis=1)
+        valid = tyre_life >= options["min_stint_laps"]
+        cost[:, first_lap, lap_numbers[valid]] = cumulative[:, valid]
+    return cost
+
+def score_sequence(cost: np.ndarray, sequence: tuple, total_laps: int) -> np.ndarray:
+    """
+    Scores every choice of pit laps for one compound sequence.
+
+    The result has one axis per stop, each indexed by the pit lap minus one; impossible
+    combinations (out-of-order stops, illegal stint lengths) are infinite.
+    """
+    if len(sequence) == 1:
+        return np.array(cost[sequence[0], 1, total_laps])
+
+    inner_laps = slice(1, total_laps)
+    totals = cost[sequence[0], 1, inner_laps]
+    for compound in sequence[1:-1]:
+        middle = cost[compound, 2:total_laps + 1, inner_laps]
+        totals = totals[..., None] + middle
+    return totals + cost[sequence[-1], 2:total_laps + 1, total_laps]
+
+class StrategyOptimizer:
+    """
+    Searches every stint plan for a race and ranks them by total race time.
+
+    All lap times come from a single batched prediction over the (compound, tyre life,
+    lap number) grid of the race, so candidates are scored with array lookups instead
+    of one model call per strategy.
+    """
+    def __init__(self, simulator):
+        self.simulator = simulator
+
+    def optimize(self, params: dict) -> dict:
+        """
+        Finds the top-K strategies for a race, ranked by total race time including pit losses.
+        'lap_time_source' counts the searched lap times by where they came from.
+        """
+        options = parse_search_options(params)
+        total_laps = options["total_laps"]
+        compounds = list(dict.fromkeys(options["compounds"]))
+        max_tyre_age = min(options["max_stint_laps"], total_laps)
+
+        base_params = self.simulator._get_base_params(params)
+        sources = {}
+        grid = self.simulator.predict_lap_time_grid(
+            base_params, compounds, total_laps, max_tyre_age, exact=bool(params.get("exact", False)), sources=sources
+        )
+        cost = stint_cost_matrix(grid, options)
+
+        # Fastest possible lap for each lap number on each compound, used as an optimistic bound.
+        lap_floor = np.nanmin(grid[:, 1:, 1:], axis=1)
+
+        candidates = []
+        evaluated, pruned = 0, 0
+        for stops in range(options["max_stops"] + 1):
+            sequences = []
+            for sequence in itertools.product(range(len(compounds)), repeat=stops + 1):
+                if count_dry_compounds(compounds[c] for c in sequence) < options["min_compounds"]:
+                    continue
+                lower_bound = stops * options["pit_loss"] + lap_floor[list(set(sequence))].min(axis=0).sum()
+                sequences.append((lower_bound, sequence))
+
+            for lower_bound, sequence in sorted(sequences):
+                if len(candidates) >= options["top_k"] and lower_bound >= candidates[-1][0]:
+                    pruned += 1
+                    continue
+
+                totals = score_sequence(cost, sequence, total_laps) + stops * options["pit_loss"]
+                flat = totals.ravel()
+                finite = int(np.count_nonzero(np.isfinite(flat)))
+                evaluated += finite
+                if finite == 0:
+                    continue
+
+                for flat_index in smallest_indices(flat, options["top_k"]):
+                    pit_laps = [int(i) + 1 for i in np.unravel_index(flat_index, totals.shape)] if stops else []
+                    candidates.append((float(flat[flat_index]), sequence, pit_laps))
+                candidates = sorted(candidates, key=lambda c: c[0])[:options["top_k"]]
+
+        strategies = []
+        for rank, (total_time, sequence, pit_laps) in enumerate(candidates, start=1):
+            boundaries = [0] + pit_laps + [total_laps]
+            strategies.append({
+                "rank": rank,
+                "stops": len(pit_laps),
+                "total_race_time": round(total_time, 3),
+                "gap_to_best": round(total_time - candidates[0][0], 3),
+                "pit_laps": pit_laps,
+                "stints": [
+                    {"compound": compounds[compound], "laps": boundaries[i + 1] - boundaries[i]}
+                    for i, compound in enumerate(sequence)
+                ],
+            })
+
+        return {
+            "track": base_params["track"],
+            "driver": base_params["driver"],
+            "total_laps": total_laps,
+            "pit_loss": options["pit_loss"],
+            "strategies_evaluated": evaluated,
+            "sequences_pruned": pruned,
+            "lap_time_source": sources,
+            "strategies": strategies,
+        }
+
+# Create a single optimizer instance that shares the simulator's loaded model
+optimizer = StrategyOptimizer(simulator)
@@ -0,0 +1,104 @@
+import itertools
+import numpy as np
+from simulator import simulator # We reuse the simulator's model and feature building
+from optimizer import count_dry_compounds, parse_search_options, stint_cost_matrix, score_sequence
+
+# --- Configuration ---
+SUPPORTED_HEATMAP_STOPS = (1, 2)
+
+def _to_json_matrix(values: np.ndarray) -> list:
+    """
+    Rounds race times to milliseconds and replaces impossible cells with null.
+    """
+    rounded = np.round(values, 3).astype(object)
+    rounded[~np.isfinite(values)] = None
+    return rounded.tolist()
+
+class PitWindowAnalyzer:
+    """
+    Builds total race time heatmaps over every pit lap of a race.
+
+    Each compound's lap times are predicted once for every reachable (tyre life, lap number)
+    pair, and stint times come from prefix sums along those curves, so filling an N x N
+    heatmap never costs more model calls than the grid itself.
+    """
+    def __init__(self, simulator):
+        self.simulator = simulator
+
+    def build_heatmap(self, params: dict) -> dict:
+        """
+        Returns one-stop heatmaps for every compound pair, or a two-stop slice for one compound sequence.
+        'lap_time_source' counts the lap times behind them by where they came from.
+        """
+        stops = int(params.get("stops", 1))
+        if stops not in SUPPORTED_HEATMAP_STOPS:
+            raise ValueError(f"'stops' must be one of {list(SUPPORTED_HEATMAP_STOPS)}.")
+
+        # Unlike the optimizer, the heatmap covers every pit lap unless the caller limits stints.
+        options = parse_search_options({"min_stint_laps": 1, **params})
+        total_laps = options["total_laps"]
+        if total_laps <= stops:
+            raise ValueError(f"A {stops}-stop heatmap needs more than {stops} race laps.")
+
+        if stops == 1:
+            compounds = list(dict.fromkeys(options["compounds"]))
+            sequences = [
+                pair for pair in itertools.product(range(len(compounds)), repeat=2)
+                if count_dry_compounds(compounds[c] for c in pair) >= options["min_compounds"]
+            ]
+        else:
+            sequence = [c.lower() for c in params.get("sequence", [])]
+            if len(sequence) != 3:
+                raise ValueError("A two-stop heatmap needs a 'sequence' of exactly three compounds.")
+            if count_dry_compounds(sequence) < options["min_compounds"]:
+                raise ValueError("'sequence' does not satisfy the minimum number of compounds.")
+            compounds = list(dict.fromkeys(sequence))
+            sequences = [tuple(compounds.index(c) for c in sequence)]
+
+        base_params = self.simulator._get_base_params(params)
+        max_tyre_age = min(options["max_stint_laps"], total_laps)
+        sources = {}
+        grid = self.simulator.predict_lap_time_grid(
+            base_params, compounds, total_laps, max_tyre_age, exact=bool(params.get("exact", False)), sources=sources
+        )
+        cost = stint_cost_matrix(grid, options)
+
+        pit_laps = list(range(1, total_laps))
+        response = {
+            "track": base_params["track"],
+            "driver": base_params["driver"],
+            "total_laps": total_laps,
+            "pit_loss": options["pit_loss"],
+            "stops": stops,
+            "pit_laps": pit_laps,
+            "lap_time_source": sources,
+        }
+
+        if stops == 1:
+            heatmaps = []
+            for sequence in sequences:
+                totals = score_sequence(cost, sequence, total_laps) + options["pit_loss"]
+                best = int(np.argmin(totals))
+                heatmaps.append({
+                    "compounds": [compounds[c] for c in sequence],
+                    "best_pit_lap": pit_laps[best] if np.isfinite(totals[best]) else None,
+                    "best_race_time": round(float(totals[best]), 3) if np.isfinite(totals[best]) else None,
+                    "total_race_time": _to_json_matrix(totals),
+                })
+            response["heatmaps"] = heatmaps
+        else:
+            # Rows are the first pit lap, columns the second; cells with second <= first are null.
+            totals = score_sequence(cost, sequences[0], total_laps) + 2 * options["pit_loss"]
+            best = np.unravel_index(np.argmin(totals), totals.shape)
+            finite = np.isfinite(totals[best])
+            response.update({
+                "sequence": [compounds[c] for c in sequences[0]],
+                "best_pit_laps": [pit_laps[i] for i in best] if finite else None,
+                "best_race_time": round(float(totals[best]), 3) if finite else None,
+                "total_race_time": _to_json_matrix(totals),
+            })
+
+        return response
+
+# Create a single analyzer instance that shares the simulator's loaded model
+pit_window_analyzer = PitWindowAnalyzer(simulator)
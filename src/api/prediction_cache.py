@@ -0,0 +1,97 @@
+import os
+import threading
+from collections import OrderedDict
+from metrics import registry
+
+# --- Configuration ---
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", 50000))
+
+class PredictionCache:
+    """
+    A thread-safe, size-bounded LRU cache of lap-time predictions.
+
+    Keys are normalized feature tuples, stored per model version so a prediction is only
+    ever served for the version that made it. Entries of every version served at once (the
+    active one, the previous one and any ?model= version) share the same LRU budget.
+    """
+    def __init__(self, max_entries: int = PREDICTION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.model_version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def bind(self, model_version) -> None:
+        """
+        Records the active model version. Entries of other versions are kept until they are
+        evicted, so a rollback or a request for another version still finds its predictions.
+        """
+        with self._lock:
+            self.model_version = model_version
+
+    def get_many(self, keys: list, model_version) -> list:
+        """
+        Looks up a batch of keys, returning None for every miss.
+        """
+        if self.max_entries <= 0:
+            return [None] * len(keys)
+
+        values = []
+        with self._lock:
+            for key in keys:
+                versioned_key = (model_version, key)
+                value = self._entries.get(versioned_key)
+                if value is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(versioned_key)
+                    self.hits += 1
+                values.append(value)
+        return values
+
+    def put_many(self, keys: list, values, model_version) -> None:
+        """
+        Stores a batch of predictions, evicting the least recently used entries when full.
+        """
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            for key, value in zip(keys, values):
+                versioned_key = (model_version, key)
+                self._entries[versioned_key] = float(value)
+                self._entries.move_to_end(versioned_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters for sizing and monitoring.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model_version": self.model_version,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+# A single, process-wide cache shared by every simulator request.
+prediction_cache = PredictionCache()
+
+def _collect_metrics() -> list:
+    stats = prediction_cache.stats()
+    return [
+        ("f1_api_prediction_cache_hits_total", "counter", "Lap predictions answered from the cache.", stats["hits"]),
+        ("f1_api_prediction_cache_misses_total", "counter", "Lap predictions that needed the model.", stats["misses"]),
+        ("f1_api_prediction_cache_entries", "gauge", "Lap predictions currently cached.", stats["entries"]),
+    ]
+
+registry.register_collector(_collect_metrics)
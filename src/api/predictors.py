@@ -0,0 +1,151 @@
+import os
+import time
+import numpy as np
+from scipy import sparse
+from tree_ensemble import compile_tree_ensemble
+
+# --- Configuration ---
+# Threads used by each worker for a single prediction call (0 lets the library decide).
+# Read when a predictor is built, so a forked worker can change it (see gunicorn.conf.py).
+INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS", 0))
+# 'auto' benchmarks the compiled tree ensemble against the native predict at load time.
+PREDICTOR_BACKEND = os.environ.get("PREDICTOR_BACKEND", "auto")
+# Seconds of lap time. The compiled ensemble adds up its leaves like the model does, so it
+# should match exactly; anything more would round some lap times differently.
+TREE_ENSEMBLE_TOLERANCE = 1e-6
+# The large (optimizer-sized) benchmark batch has 8x this many rows.
+SMALL_BATCH_ROWS = 256
+
+class SklearnPredictor:
+    """
+    Generic fallback that calls the estimator's own predict (ridge, random_forest, ...).
+    """
+    name = "sklearn_predict"
+
+    def __init__(self, model, n_threads: int = None):
+        self.model = model
+        self.set_threads(INFERENCE_THREADS if n_threads is None else n_threads)
+
+    def set_threads(self, n_threads: int) -> None:
+        if n_threads > 0 and hasattr(self.model, "n_jobs"):
+            self.model.n_jobs = n_threads
+
+    def predict(self, features) -> np.ndarray:
+        return np.asarray(self.model.predict(features), dtype=float)
+
+class BoosterPredictor:
+    """
+    Fast path for XGBoost models: predicts with the underlying Booster's inplace_predict,
+    skipping the sklearn wrapper's validation and DMatrix construction.
+    """
+    name = "xgboost_inplace_predict"
+
+    def __init__(self, model, n_threads: int = None):
+        self.booster = model.get_booster()
+        self.missing = model.missing
+        self.set_threads(INFERENCE_THREADS if n_threads is None else n_threads)
+
+        # Match XGBRegressor.predict, which stops at the best early-stopping round.
+        try:
+            self.iteration_range = (0, int(model.best_iteration) + 1)
+        except AttributeError:
+            self.iteration_range = (0, 0)
+
+    def set_threads(self, n_threads: int) -> None:
+        if n_threads > 0:
+            self.booster.set_param({"nthread": n_threads})
+
+    def predict(self, features) -> np.ndarray:
+        predictions = self.booster.inplace_predict(
+            features,
+            iteration_range=self.iteration_range,
+            missing=self.missing,
+            validate_features=False,
+        )
+        return np.asarray(predictions, dtype=float)
+
+class TreeEnsemblePredictor:
+    """
+    Evaluates a RandomForest or XGBoost model from flat NumPy arrays (see tree_ensemble.py).
+    """
+    name = "compiled_tree_ensemble"
+
+    def __init__(self, ensemble):
+        self.ensemble = ensemble
+
+    def set_threads(self, n_threads: int) -> None:
+        pass # Single-threaded NumPy
+
+    def predict(self, features) -> np.ndarray:
+        return self.ensemble.predict(features)
+
+def build_native_predictor(model, n_threads: int = None):
+    """
+    Returns the model's own prediction path (Booster inplace_predict or sklearn predict).
+    """
+    if hasattr(model, "get_booster"):
+        try:
+            return BoosterPredictor(model, n_threads)
+        except Exception as e:
+            print(f"WARNING: Could not use the native XGBoost Booster ({e}). Falling back to predict().")
+    return SklearnPredictor(model, n_threads)
+
+def time_predictor(predictor, features, repeats: int = 5) -> float:
+    """
+    Returns the best-of-N wall time of one predict call, in milliseconds.
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predictor.predict(features)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000.0
+
+def build_predictor(model, n_threads: int = None, sample_features=None,
+                    backend: str = PREDICTOR_BACKEND):
+    """
+    Picks the fastest available prediction path for a loaded model.
+
+    With a representative sample batch, the compiled tree ensemble is checked against the
+    native predictor and only used if it agrees within tolerance and is faster at both
+    batch sizes. One path serves every batch, so a lap's prediction does not depend on
+    which other laps it was batched with.
+    """
+    if model is None:
+        return None
+
+    native = build_native_predictor(model, n_threads)
+    if backend == "native" or sample_features is None:
+        return native
+
+    ensemble = compile_tree_ensemble(model)
+    if ensemble is None:
+        return native
+
+    compiled = TreeEnsemblePredictor(ensemble)
+    expected = native.predict(sample_features)
+    if not np.allclose(compiled.predict(sample_features), expected, rtol=0.0, atol=TREE_ENSEMBLE_TOLERANCE):
+        print("WARNING: Compiled tree ensemble disagrees with the model. Using native predict.")
+        return native
+
+    # Benchmark a race-sized batch and a large optimizer-sized batch.
+    large_features = _tile_rows(sample_features, 8 * SMALL_BATCH_ROWS)
+    timings = {
+        "small": {p.name: time_predictor(p, sample_features) for p in (native, compiled)},
+        "large": {p.name: time_predictor(p, large_features, repeats=2) for p in (native, compiled)},
+    }
+    wins_small = timings["small"][compiled.name] < timings["small"][native.name]
+    wins_large = timings["large"][compiled.name] < timings["large"][native.name]
+
+    chosen = compiled if backend == "compiled" or (wins_small and wins_large) else native
+    chosen.load_benchmark_ms = {
+        size: {name: round(ms, 4) for name, ms in results.items()} for size, results in timings.items()
+    }
+    print(f"Selected predictor '{chosen.name}' (timings in ms: {chosen.load_benchmark_ms}).")
+    return chosen
+
+def _tile_rows(features, n_rows: int):
+    repeats = -(-n_rows // features.shape[0])
+    if sparse.issparse(features):
+        return sparse.vstack([features] * repeats, format="csr")[:n_rows]
+    return np.tile(features, (repeats, 1))[:n_rows]
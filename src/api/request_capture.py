@@ -0,0 +1,71 @@
+import json
+import os
+import random
+import threading
+import time
+
+# --- Configuration ---
+# JSONL file that /simulate payloads are appended to (unset disables capture).
+REQUEST_CAPTURE_PATH = os.environ.get("REQUEST_CAPTURE_PATH")
+# Fraction of requests recorded, and a cap on the records written by one process.
+REQUEST_CAPTURE_SAMPLE_RATE = float(os.environ.get("REQUEST_CAPTURE_SAMPLE_RATE", 1.0))
+REQUEST_CAPTURE_MAX_RECORDS = int(os.environ.get("REQUEST_CAPTURE_MAX_RECORDS", 100000))
+
+class RequestCapture:
+    """
+    Appends incoming request payloads to a JSONL corpus for scripts/replay_benchmark.py.
+
+    Each line holds the endpoint, the query string arguments, the Accept header and the
+    JSON body, so the replay sends the same request the client did.
+    """
+    def __init__(self, path: str = REQUEST_CAPTURE_PATH, sample_rate: float = REQUEST_CAPTURE_SAMPLE_RATE,
+                 max_records: int = REQUEST_CAPTURE_MAX_RECORDS):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_records = max_records
+        self.records = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path) and self.sample_rate > 0
+
+    def record(self, endpoint: str, payload, args: dict = None, accept: str = None) -> None:
+        """
+        Writes one request to the corpus. Never raises; a failed write only counts as an error.
+        """
+        if not self.enabled or self.records >= self.max_records:
+            return
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+
+        line = json.dumps({
+            "endpoint": endpoint,
+            "args": dict(args or {}),
+            "accept": accept,
+            "payload": payload,
+            "captured_at": round(time.time(), 3),
+        }, sort_keys=True)
+        with self._lock:
+            if self.records >= self.max_records:
+                return
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+                self.records += 1
+            except (OSError, TypeError, ValueError) as e:
+                self.errors += 1
+                print(f"WARNING: Could not capture request to {self.path}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "sample_rate": self.sample_rate,
+            "records": self.records,
+            "errors": self.errors,
+        }
+
+# A single, global capture for the API process.
+request_capture = RequestCapture()
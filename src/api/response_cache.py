@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from metrics import registry
+
+# --- Configuration ---
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", 300))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+class ResponseCache:
+    """
+    A thread-safe cache of serialized JSON responses with a TTL and a total size limit.
+
+    Entries are keyed by a hash of the canonical request, the model version and the
+    response format, and the same hash (tagged with the format) doubles as the ETag.
+    """
+    def __init__(self, ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(canonical_request, model_version, response_format: str) -> str:
+        """
+        Hashes a canonical request together with the model version that will answer it and
+        the format its body is encoded in.
+        """
+        payload = json.dumps(
+            {"request": canonical_request, "model_version": model_version, "format": response_format},
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_etag(key: str, response_format: str) -> str:
+        """
+        Derives the (unquoted) ETag value for a cache key and the format of its body.
+        """
+        return f"{key[:32]}-{response_format}"
+
+    def get(self, key: str):
+        """
+        Returns the cached response body for a key, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            body, expires_at = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key: str, body: bytes) -> None:
+        """
+        Stores a response body, evicting the least recently used entries to stay under max_bytes.
+        """
+        if self.ttl_seconds <= 0 or len(body) > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (body, time.monotonic() + self.ttl_seconds)
+            self._size_bytes += len(body)
+            while self._size_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        body, _ = self._entries.pop(key)
+        self._size_bytes -= len(body)
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters and current memory use.
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self._size_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+# A single cache instance for the /simulate endpoint.
+response_cache = ResponseCache()
+
+def _collect_metrics() -> list:
+    stats = response_cache.stats()
+    return [
+        ("f1_api_response_cache_hits_total", "counter", "/simulate responses answered from the cache.", stats["hits"]),
+        ("f1_api_response_cache_misses_total", "counter", "/simulate responses that had to be computed.", stats["misses"]),
+        ("f1_api_response_cache_bytes", "gauge", "Bytes of cached /simulate responses.", stats["size_bytes"]),
+    ]
+
+registry.register_collector(_collect_metrics)
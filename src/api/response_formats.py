@@ -0,0 +1,58 @@
+import json
+
+try:
+    import msgpack
+except ImportError: # Optional; only needed for the MessagePack format
+    msgpack = None
+
+# --- Configuration ---
+# "records" is the default lap_records layout; "columnar" and "msgpack" use lap_columns.
+RECORDS = "records"
+COLUMNAR = "columnar"
+MSGPACK = "msgpack"
+COLUMNAR_JSON_MIMETYPE = "application/vnd.f1-strategy.columnar+json"
+MSGPACK_MIMETYPE = "application/msgpack"
+FORMAT_MIMETYPES = {
+    RECORDS: "application/json",
+    COLUMNAR: COLUMNAR_JSON_MIMETYPE,
+    MSGPACK: MSGPACK_MIMETYPE,
+}
+ACCEPT_FORMATS = {
+    "application/json": RECORDS,
+    COLUMNAR_JSON_MIMETYPE: COLUMNAR,
+    MSGPACK_MIMETYPE: MSGPACK,
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+}
+
+class UnsupportedFormat(ValueError):
+    pass
+
+def negotiate_format(accept_header: str, format_flag: str = None) -> str:
+    """
+    Picks the response format from ?format=records|columnar|msgpack, or else from the first
+    media type in the Accept header that has a format. Defaults to records.
+    """
+    if format_flag:
+        response_format = format_flag.lower()
+        if response_format not in FORMAT_MIMETYPES:
+            raise UnsupportedFormat(f"Unknown format '{format_flag}'. Use one of {list(FORMAT_MIMETYPES)}.")
+    else:
+        response_format = RECORDS
+        for media_range in (accept_header or "").split(","):
+            media_type = media_range.split(";")[0].strip().lower()
+            if media_type in ACCEPT_FORMATS:
+                response_format = ACCEPT_FORMATS[media_type]
+                break
+
+    if response_format == MSGPACK and msgpack is None:
+        raise UnsupportedFormat("MessagePack responses need the 'msgpack' package on the server.")
+    return response_format
+
+def encode_body(payload, response_format: str) -> bytes:
+    """
+    Encodes a response body. JSON formats match Flask's jsonify output byte for byte.
+    """
+    if response_format == MSGPACK:
+        return msgpack.packb(payload, use_bin_type=True)
+    return (json.dumps(payload, sort_keys=True, separators=(",", ":")) + "\n").encode()
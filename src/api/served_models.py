@@ -0,0 +1,150 @@
+import os
+import threading
+from model_loader import MODEL_ALIAS, model_loader
+from simulator import ModelBundle, simulator
+from track_shards import load_track_shards
+from degradation_curves import load_degradation_curves
+from lap_table import attach_lap_table
+
+# --- Configuration ---
+# Registry aliases or version numbers served next to 'production', e.g. "challenger,7".
+SERVED_MODELS = [reference.strip() for reference in os.environ.get("SERVED_MODELS", "").split(",") if reference.strip()]
+
+class UnknownModel(LookupError):
+    pass
+
+class ServedModels:
+    """
+    The registered model versions held in memory next to the production model, so a request
+    can pick one with ?model=<alias or version>.
+
+    'production' always means the simulator's active bundle, which the reloader keeps up to
+    date. Bundles whose preprocessor artifacts are byte-identical share one preprocessor and
+    compiled encoder.
+    """
+    def __init__(self, simulator, loader, references: list = SERVED_MODELS):
+        self.simulator = simulator
+        self.loader = loader
+        self.references = [reference for reference in references if reference != MODEL_ALIAS]
+        self.bundles = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def build_bundle(self, artifacts: dict, source: str) -> ModelBundle:
+        """
+        Builds a bundle from fetched artifacts, reusing the preprocessor and encoder of any
+        loaded bundle with the same preprocessor artifact. Its lap time table, if the run has
+        one, is attached once loaded.
+        """
+        shared = self._bundle_with_preprocessor(artifacts.get("preprocessor_sha256"))
+        bundle = ModelBundle(
+            artifacts["model"],
+            shared.preprocessor if shared else artifacts["preprocessor"],
+            artifacts["model_version"],
+            run_id=artifacts["run_id"],
+            source=source,
+            preprocessor_sha256=artifacts.get("preprocessor_sha256"),
+            encoder=shared.encoder if shared else None,
+            shards=load_track_shards(self.loader, artifacts["run_id"], artifacts["model_version"]),
+            curves=load_degradation_curves(self.loader, artifacts["run_id"], artifacts["model_version"]),
+        )
+        attach_lap_table(bundle, self.loader)
+        return bundle
+
+    def _bundle_with_preprocessor(self, preprocessor_sha256: str):
+        if not preprocessor_sha256:
+            return None
+        for bundle in [self.simulator.active, *self.bundles.values()]:
+            if bundle is not None and bundle.preprocessor_sha256 == preprocessor_sha256 and bundle.encoder is not None:
+                return bundle
+        return None
+
+    def load(self) -> None:
+        """
+        Loads every configured model. A model that fails to load is reported and skipped.
+        """
+        for reference in self.references:
+            try:
+                self._load(reference)
+            except Exception as e:
+                self.errors[reference] = str(e)
+                print(f"WARNING: Could not load served model '{reference}' ({e}).")
+
+    def _load(self, reference: str) -> ModelBundle:
+        artifacts = self.loader.fetch_model(reference)
+        bundle = self.build_bundle(artifacts, source="registry")
+        if bundle.predictor is None:
+            raise ValueError(f"Model '{reference}' could not be loaded.")
+        bundle.warm_up()
+        with self._lock:
+            self.bundles[reference] = bundle
+            self.errors.pop(reference, None)
+        shared = " (shared preprocessor)" if bundle.preprocessor is not artifacts["preprocessor"] else ""
+        print(f"Serving model '{reference}': Version {bundle.model_version}, Run ID: {bundle.run_id}{shared}")
+        return bundle
+
+    def refresh(self) -> dict:
+        """
+        Reloads the served models whose alias has moved to another run since they were loaded.
+        """
+        results = {}
+        for reference in self.references:
+            try:
+                current = self.bundles.get(reference)
+                if current is not None and self.loader.get_run_id(reference) == current.run_id:
+                    results[reference] = "unchanged"
+                    continue
+                self._load(reference)
+                results[reference] = "reloaded"
+            except Exception as e:
+                self.errors[reference] = str(e)
+                results[reference] = f"failed: {e}"
+        return results
+
+    def get(self, name: str = None) -> ModelBundle:
+        """
+        Returns the bundle for a model name (an alias or version number from SERVED_MODELS),
+        or for the version number of any loaded model. No name means production.
+        """
+        if not name or name == MODEL_ALIAS:
+            return self.simulator.active
+        bundles = self.bundles
+        if name in bundles:
+            return bundles[name]
+        for bundle in [self.simulator.active, *bundles.values()]:
+            if bundle is not None and str(bundle.model_version) == name:
+                return bundle
+        raise UnknownModel(f"Model '{name}' is not served. Available: {self.names()}.")
+
+    def names(self) -> list:
+        return [MODEL_ALIAS] + list(self.bundles)
+
+    def describe(self) -> list:
+        """
+        Lists the served models for the /models endpoint.
+        """
+        entries = []
+        for name, bundle in [(MODEL_ALIAS, self.simulator.active), *self.bundles.items()]:
+            if bundle is None or bundle.model is None:
+                continue
+            entries.append({
+                "name": name,
+                "model_version": bundle.model_version,
+                "run_id": bundle.run_id,
+                "model_type": type(bundle.model).__name__,
+                "predictor": bundle.predictor.name if bundle.predictor is not None else None,
+                "preprocessor_sha256": bundle.preprocessor_sha256,
+                "track_shards": bundle.shards.stats() if bundle.shards is not None else None,
+                "degradation_curves": bundle.curves.stats() if bundle.curves is not None else None,
+                "lap_table": bundle.lap_table.stats() if bundle.lap_table is not None else None,
+            })
+        return entries
+
+    def stats(self) -> dict:
+        return {
+            "models": {name: bundle.model_version for name, bundle in self.bundles.items()},
+            "errors": dict(self.errors),
+        }
+
+# A single, global set of served models for the API process.
+served_models = ServedModels(simulator, model_loader)
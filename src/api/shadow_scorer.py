@@ -0,0 +1,165 @@
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+import numpy as np
+from metrics import LATENCY_BUCKETS, registry
+from served_models import served_models
+from simulator import simulator
+
+# --- Configuration ---
+# A served model (see SERVED_MODELS) scored in the background on production /simulate traffic.
+SHADOW_MODEL = os.environ.get("SHADOW_MODEL")
+SHADOW_SAMPLE_RATE = float(os.environ.get("SHADOW_SAMPLE_RATE", 1.0))
+# Requests waiting to be shadow scored; more are dropped rather than slowing anything down.
+SHADOW_MAX_PENDING = int(os.environ.get("SHADOW_MAX_PENDING", 100))
+RECENT_SCORES = 1000 # Scores kept for the percentile stats
+DELTA_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+SHADOW_PREDICT_SECONDS = registry.histogram(
+    "f1_api_shadow_predict_seconds", "Transform and predict time of a shadow scored race, per model.",
+    LATENCY_BUCKETS, ("role",)
+)
+SHADOW_LAP_DELTA_SECONDS = registry.histogram(
+    "f1_api_shadow_lap_delta_seconds", "Mean absolute lap time difference between the shadow and production models.",
+    DELTA_BUCKETS
+)
+
+class ShadowScorer:
+    """
+    Scores a candidate model on the same races as production, off the response path.
+
+    /simulate hands over the strategy of each production request. A background thread builds the
+    race's laps, runs them through both models without any cache or batching (so the timings
+    compare like for like) and records the predict times and the lap time differences.
+    """
+    def __init__(self, simulator, models, candidate: str = SHADOW_MODEL,
+                 sample_rate: float = SHADOW_SAMPLE_RATE, max_pending: int = SHADOW_MAX_PENDING):
+        self.simulator = simulator
+        self.models = models
+        self.candidate = candidate
+        self.sample_rate = sample_rate
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self.scored = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_error = None
+        self._production_ms = deque(maxlen=RECENT_SCORES)
+        self._candidate_ms = deque(maxlen=RECENT_SCORES)
+        self._mean_abs_deltas = deque(maxlen=RECENT_SCORES)
+        self._race_deltas = deque(maxlen=RECENT_SCORES)
+        self.max_abs_delta = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.candidate) and self.sample_rate > 0
+
+    def submit(self, strategy: dict, bundle) -> None:
+        """
+        Queues a strategy that production (bundle) is answering. Never blocks the caller.
+        """
+        if not self.enabled or bundle is not self.simulator.active:
+            return
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((strategy, bundle))
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+
+    def _ensure_worker(self) -> None:
+        # Started on first use (not at import), so forked workers each get their own thread.
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="shadow-scorer", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            strategy, production = self._queue.get()
+            try:
+                self._score(strategy, production)
+            except Exception as e:
+                with self._stats_lock:
+                    self.errors += 1
+                    self.last_error = str(e)
+
+    def _timed_predict(self, bundle, laps: list):
+        started = time.perf_counter()
+        # Uncached, unbatched and shard-aware, and kept out of the production serving metrics.
+        predictions = self.simulator._predict_rows(bundle, laps, record_metrics=False)
+        return np.asarray(predictions, dtype=float), time.perf_counter() - started
+
+    def _score(self, strategy: dict, production) -> None:
+        candidate = self.models.get(self.candidate)
+        if candidate is production:
+            return
+        try:
+            laps = self.simulator._build_lap_features(strategy["stints"], self.simulator._get_base_params(strategy))
+        except (KeyError, TypeError, ValueError):
+            return # An invalid strategy; production answered it with a 400
+        if not laps:
+            return
+
+        production_times, production_seconds = self._timed_predict(production, laps)
+        candidate_times, candidate_seconds = self._timed_predict(candidate, laps)
+        deltas = candidate_times - production_times
+        mean_abs_delta = float(np.mean(np.abs(deltas)))
+
+        SHADOW_PREDICT_SECONDS.observe(production_seconds, ("production",))
+        SHADOW_PREDICT_SECONDS.observe(candidate_seconds, ("candidate",))
+        SHADOW_LAP_DELTA_SECONDS.observe(mean_abs_delta)
+        with self._stats_lock:
+            self.scored += 1
+            self._production_ms.append(production_seconds * 1000.0)
+            self._candidate_ms.append(candidate_seconds * 1000.0)
+            self._mean_abs_deltas.append(mean_abs_delta)
+            self._race_deltas.append(float(deltas.sum()))
+            self.max_abs_delta = max(self.max_abs_delta, float(np.max(np.abs(deltas))))
+
+    def stats(self) -> dict:
+        """
+        Returns how the candidate compares with production on the recently scored races.
+        """
+        def percentiles(values) -> dict:
+            values = np.asarray(values, dtype=float)
+            if not values.size:
+                return {"p50": 0.0, "p95": 0.0}
+            return {"p50": round(float(np.percentile(values, 50)), 3), "p95": round(float(np.percentile(values, 95)), 3)}
+
+        with self._stats_lock:
+            try:
+                candidate_version = self.models.get(self.candidate).model_version if self.enabled else None
+            except LookupError:
+                candidate_version = None
+            race_deltas = np.asarray(self._race_deltas, dtype=float)
+            return {
+                "enabled": self.enabled,
+                "candidate": self.candidate,
+                "candidate_model_version": candidate_version,
+                "sample_rate": self.sample_rate,
+                "scored": self.scored,
+                "dropped": self.dropped,
+                "pending": self._queue.qsize(),
+                "errors": self.errors,
+                "last_error": self.last_error,
+                "production_predict_ms": percentiles(self._production_ms),
+                "candidate_predict_ms": percentiles(self._candidate_ms),
+                "mean_abs_lap_delta_s": round(float(np.mean(self._mean_abs_deltas)), 4) if self._mean_abs_deltas else 0.0,
+                "max_abs_lap_delta_s": round(self.max_abs_delta, 4),
+                # Candidate minus production race time, pit stops excluded (they are the same for both).
+                "mean_race_time_delta_s": round(float(race_deltas.mean()), 3) if race_deltas.size else 0.0,
+            }
+
+# A single, global shadow scorer for the API process.
+shadow_scorer = ShadowScorer(simulator, served_models)
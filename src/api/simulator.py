@@ -1,110 +1,764 @@
+import contextvars
+import threading
+import time
+from contextlib import nullcontext
+import numpy as np
 import pandas as pd
-from model_loader import model_loader # We import the loader instance
+from track_config import get_track_settings
+from prediction_cache import prediction_cache
+from encoder import canary_laps, compile_preprocessor
+from predictors import build_predictor
+from micro_batcher import MicroBatcher
+from metrics import INFERENCE_BATCH_ROWS, stage
 
-# A simple mapping for default temperatures if the user doesn't provide them.
-DEFAULT_TRACK_TEMPS = {
-    "Silverstone": {"airtemp": 20.0, "tracktemp": 30.0},
-    "Monza": {"airtemp": 25.0, "tracktemp": 40.0},
-    "Bahrain": {"airtemp": 28.0, "tracktemp": 35.0},
-    "Spa-Francorchamps": {"airtemp": 18.0, "tracktemp": 25.0},
-    # Add other tracks as needed
-}
+# Order of the model's input features, used to build hashable keys for lap rows.
+FEATURE_COLUMNS = ("track", "driver", "year", "compound", "tyrelife", "lapnumber", "airtemp", "tracktemp")
+MAX_BATCH_STRATEGIES = 500
+STREAM_BATCH_CHUNK = 25 # Strategies built and predicted together while a batch is streamed
+
+# Monte Carlo defaults. Safety car effects are rough averages across circuits.
+MC_DEFAULT_SAMPLES = 10000
+MC_MAX_SAMPLES = 100000
+MC_DEFAULT_SAFETY_CAR_PROBABILITY = 15.0 # Percent chance of at least one safety car per race
+MC_SAFETY_CAR_LAPS = (3, 5) # Min and max laps a safety car stays out
+MC_SAFETY_CAR_LAP_FACTOR = 1.4 # Laps behind the safety car are ~40% slower
+MC_SAFETY_CAR_PIT_FACTOR = 0.5 # Pitting under the safety car costs about half the usual time
+MC_DEFAULT_PIT_LOSS_STD = 1.5 # Seconds
+MC_DEFAULT_LAP_TIME_NOISE = 0.3 # Seconds
+
+def count_source(sources: dict, source: str, rows: int) -> None:
+    """
+    Adds rows to a {source: lap times} tally (the responses' 'lap_time_source'), if one is kept.
+    """
+    if sources is not None and rows:
+        sources[source] = sources.get(source, 0) + rows
+
+def lap_key(lap: dict) -> tuple:
+    """
+    Builds a normalized, hashable key for a lap's feature row.
+    """
+    return tuple(
+        float(lap[column]) if isinstance(lap[column], (int, float, np.number)) else lap[column]
+        for column in FEATURE_COLUMNS
+    )
+
+class ModelBundle:
+    """
+    A preprocessor and model pair together with everything derived from them (compiled
+    encoder, chosen predictor). Bundles are immutable once built, so a request that holds
+    one keeps predicting with the same model even if another bundle is swapped in. The one
+    exception is the lap table, which may be attached after the bundle starts serving.
+    """
+    def __init__(self, model, preprocessor, model_version=None, run_id=None, source=None,
+                 preprocessor_sha256=None, encoder=None, shards=None, curves=None, lap_table=None):
+        self.model = model
+        self.preprocessor = preprocessor
+        self.model_version = model_version
+        self.run_id = run_id
+        self.source = source
+        # Content hash of the preprocessor artifact; bundles with equal hashes share one encoder.
+        self.preprocessor_sha256 = preprocessor_sha256
+        # The run's per-track models (track_shards.TrackShards), if it was trained with them.
+        self.shards = shards
+        # Lap time curves distilled from the run (degradation_curves.DegradationCurves), if any.
+        self.curves = curves
+        # Lap times precomputed for the model (lap_table.LapTimeTable), if a table was built;
+        # usually set later by lap_table.attach_lap_table, as it can take a while to download.
+        self.lap_table = lap_table
+        # Build times in milliseconds, reported as startup phases.
+        self.timings = {}
+
+        started = time.perf_counter()
+        if encoder is None and preprocessor is not None:
+            encoder = compile_preprocessor(preprocessor)
+        self.encoder = encoder
+        # A race-sized batch touching every known category, used to pick the fastest predictor.
+        self.sample_laps = None
+        self.sample_features = None
+        if self.encoder is not None:
+            self.sample_laps = (canary_laps(self.encoder) * 60)[:60]
+            self.sample_features = self.encoder.transform(self.sample_laps)
+        self.timings["encoder_compile"] = round((time.perf_counter() - started) * 1000.0, 2)
+
+        started = time.perf_counter()
+        self.predictor = build_predictor(model, sample_features=self.sample_features)
+        self.timings["predictor_select"] = round((time.perf_counter() - started) * 1000.0, 2)
+
+    @property
+    def approximations(self) -> list:
+        """
+        The faster stand-ins for the model that this bundle has, most accurate first.
+        """
+        return [approximation for approximation in (self.lap_table, self.curves) if approximation is not None]
+
+    def warm_up(self) -> None:
+        """
+        Encodes and predicts the canary batch so a bundle is known to work (and any lazy
+        initialization has happened) before it serves traffic.
+        """
+        if self.predictor is None or self.sample_laps is None:
+            return
+        started = time.perf_counter()
+        predictions = self.predictor.predict(self.encoder.transform(self.sample_laps))
+        if not np.all(np.isfinite(predictions)):
+            raise ValueError(f"Model version {self.model_version} produced non-finite predictions on the canary batch.")
+        self.timings["warm_up"] = round((time.perf_counter() - started) * 1000.0, 2)
 
 class RaceSimulator:
-    def __init__(self, model, preprocessor):
+    def __init__(self, model, preprocessor, model_version=None, cache=prediction_cache, run_id=None, source=None):
         """
         Initializes the simulator with a loaded model and preprocessor.
         """
-        self.model = model
-        self.preprocessor = preprocessor
+        self.cache = cache
+        # Coalesces cache misses from concurrent requests into shared predict calls.
+        self.batcher = MicroBatcher(self._predict_rows)
+        self.active = None
+        self.previous = None
+        self._swap_lock = threading.Lock()
+        # The bundle pinned by the request currently running in this context, if any.
+        self._pinned = contextvars.ContextVar("pinned_model_bundle", default=None)
+        self.set_model(model, preprocessor, model_version, run_id=run_id, source=source)
+
+    def set_model(self, model, preprocessor, model_version=None, run_id=None, source=None):
+        """
+        Points the simulator at a model and preprocessor. Cached predictions are kept per
+        model version, so none made by a previous model are served for this one.
+        """
+        self.swap(ModelBundle(model, preprocessor, model_version, run_id=run_id, source=source))
+
+    def swap(self, bundle: ModelBundle) -> None:
+        """
+        Atomically makes a bundle the active one. Requests that already pinned the old
+        bundle finish on it; the old bundle is kept for rollback.
+        """
+        with self._swap_lock:
+            if self.active is not None:
+                self.previous = self.active
+            self.active = bundle
+            self.cache.bind(bundle.model_version)
+
+    def rollback(self) -> ModelBundle:
+        """
+        Swaps the previous bundle back in. Returns the bundle that was rolled back from.
+        """
+        with self._swap_lock:
+            if self.previous is None or self.previous.model is None:
+                raise ValueError("There is no previous model version to roll back to.")
+            self.active, self.previous = self.previous, self.active
+            self.cache.bind(self.active.model_version)
+            return self.previous
+
+    def pin(self, bundle: ModelBundle = None):
+        """
+        Pins a bundle (the active one by default) for the rest of the current request.
+        Returns a token for unpin().
+        """
+        return self._pinned.set(bundle or self.active)
+
+    def unpin(self, token) -> None:
+        self._pinned.reset(token)
+
+    @property
+    def bundle(self) -> ModelBundle:
+        return self._pinned.get() or self.active
+
+    @property
+    def model(self):
+        return self.bundle.model
+
+    @property
+    def preprocessor(self):
+        return self.bundle.preprocessor
+
+    @property
+    def encoder(self):
+        return self.bundle.encoder
+
+    @property
+    def predictor(self):
+        return self.bundle.predictor
+
+    @property
+    def model_version(self):
+        return self.bundle.model_version
+
+    def _transform(self, laps: list, bundle: ModelBundle = None):
+        """
+        Encodes lap dicts into the model's feature matrix, using the compiled encoder when
+        available and the sklearn preprocessor otherwise.
+        """
+        bundle = bundle or self.bundle
+        if bundle.encoder is not None:
+            return bundle.encoder.transform(laps)
+        return bundle.preprocessor.transform(pd.DataFrame(laps))
+
+    def _predict_rows(self, bundle: ModelBundle, laps: list, record_metrics: bool = True) -> np.ndarray:
+        """
+        Runs one transform and predict call for a list of laps, bypassing every cache.
+        When the model has track shards, each track's laps go to its shard instead.
+        Without record_metrics (shadow scoring), the serving metrics are left untouched.
+        """
+        if record_metrics:
+            INFERENCE_BATCH_ROWS.observe(len(laps))
+        if bundle.shards is None:
+            return self._predict_with(bundle, laps, record_metrics)
+
+        predictions = np.empty(len(laps), dtype=float)
+        for shard, indices in bundle.shards.route(laps):
+            rows = laps if len(indices) == len(laps) else [laps[index] for index in indices]
+            predictions[indices] = self._predict_with(shard or bundle, rows, record_metrics)
+        return predictions
+
+    def _predict_with(self, bundle: ModelBundle, laps: list, record_metrics: bool = True) -> np.ndarray:
+        timed = stage if record_metrics else (lambda name: nullcontext())
+        with timed("transform"):
+            features = self._transform(laps, bundle)
+        with timed("predict"):
+            return bundle.predictor.predict(features)
+
+    def _predict_lap_times(self, laps: list) -> np.ndarray:
+        """
+        Predicts lap times for a batch of laps. Cached rows are answered from the prediction
+        cache and all misses go through a single transform and predict call, shared with
+        concurrent requests by the micro-batcher.
+        """
+        bundle = self.bundle # One bundle for the whole batch, even if a swap happens meanwhile
+        if not bundle.model or not bundle.preprocessor:
+            return np.full(len(laps), 95.0)
+
+        model_version = bundle.model_version
+        with stage("prediction_cache"):
+            keys = [lap_key(lap) for lap in laps]
+            cached = self.cache.get_many(keys, model_version)
+
+        missing = {}
+        for lap, key, value in zip(laps, keys, cached):
+            if value is None and key not in missing:
+                missing[key] = lap
+
+        if missing:
+            if bundle.shards is not None:
+                bundle.shards.prefetch(missing.values())
+            with stage("inference"): # Includes any micro-batcher queue wait
+                predictions = self.batcher.predict(bundle, list(missing.values()))
+            self.cache.put_many(list(missing), predictions, model_version)
+            predicted = dict(zip(missing, predictions))
+            cached = [predicted[key] if value is None else value for key, value in zip(keys, cached)]
+
+        return np.asarray(cached, dtype=float)
+
+    def _predict_lap_times_fast(self, laps: list, exact: bool = False, sources: dict = None) -> np.ndarray:
+        """
+        Like _predict_lap_times, but answers the laps covered by the model's lap time table
+        or distilled curves from them. Only the rest (or everything, when exact) goes to the model.
+        Given a sources dict, adds how many lap times came from each source to it.
+        """
+        approximations = [] if exact else self.bundle.approximations
+        if not approximations or not laps:
+            count_source(sources, "model", len(laps))
+            return self._predict_lap_times(laps)
+        with stage("fast_path"):
+            predictions, mask = self._approximate_laps(approximations, laps, sources)
+        if not mask.all():
+            missing = np.flatnonzero(~mask)
+            count_source(sources, "model", len(missing))
+            predictions[missing] = self._predict_lap_times([laps[index] for index in missing])
+        return predictions
+
+    def _approximate_laps(self, approximations: list, laps: list, sources: dict = None):
+        """
+        Answers what the approximations cover of each race's laps. Returns (lap times, mask
+        of the laps answered); the unmasked entries are NaN.
+        """
+        predictions = np.full(len(laps), np.nan)
+        races = {}
+        for index, lap in enumerate(laps):
+            key = (lap["track"], lap["driver"], lap["year"], lap["compound"], lap["airtemp"], lap["tracktemp"])
+            races.setdefault(key, []).append(index)
+
+        for (track, driver, year, compound, airtemp, tracktemp), indices in races.items():
+            base_params = {"track": track, "driver": driver, "year": year, "airtemp": airtemp, "tracktemp": tracktemp}
+            tyrelife = np.array([laps[index]["tyrelife"] for index in indices], dtype=float)
+            lapnumber = np.array([laps[index]["lapnumber"] for index in indices], dtype=float)
+            predictions[indices] = self._approximate(approximations, base_params, compound, tyrelife, lapnumber, sources)
+        return predictions, ~np.isnan(predictions)
+
+    def _approximate(self, approximations: list, base_params: dict, compound: str,
+                     tyrelife: np.ndarray, lapnumber: np.ndarray, sources: dict = None) -> np.ndarray:
+        """
+        Evaluates one race's laps with each approximation in turn, each taking the laps left
+        that fall within its limits. Laps none of them covers are NaN.
+        """
+        values = np.full(len(tyrelife), np.nan)
+        pending = np.ones(len(tyrelife), dtype=bool)
+        for approximation in approximations:
+            position = approximation.find(base_params, compound)
+            covered = np.zeros(len(tyrelife), dtype=bool)
+            if position is not None:
+                max_tyrelife, max_lapnumber = approximation.limits(position)
+                covered = pending & (tyrelife <= max_tyrelife) & (lapnumber <= max_lapnumber)
+                if covered.any():
+                    values[covered] = approximation.evaluate(
+                        position, tyrelife[covered], lapnumber[covered], base_params["airtemp"], base_params["tracktemp"]
+                    )
+                    pending &= ~covered
+            approximation.record(int(covered.sum()), int(pending.sum()))
+            count_source(sources, approximation.source, int(covered.sum()))
+            if not pending.any():
+                break
+        return values
 
     def _predict_lap_time(self, lap_data: dict) -> float:
         """
         Predicts a single lap's time using the loaded model and preprocessor.
         """
-        if not self.model or not self.preprocessor:
-            return 95.0 
-
-        df = pd.DataFrame([lap_data])
-        transformed_data = self.preprocessor.transform(df)
-        prediction = self.model.predict(transformed_data)
-        return float(prediction[0])
+        return float(self._predict_lap_times([lap_data])[0])
 
-    def run_simulation(self, strategy: dict) -> dict:
+    def _get_base_params(self, strategy: dict) -> dict:
         """
-        Runs a full race simulation based on a user-defined strategy.
+        Builds the features shared by every lap of the race (track, driver, year, weather).
         """
-        # --- 1. Extract and validate inputs (using lowercase) ---
         base_params = {
             "track": strategy.get("track"),
             "driver": strategy.get("driver"),
             "year": 2025,
         }
-        
-        default_temps = DEFAULT_TRACK_TEMPS.get(base_params["track"], {"airtemp": 22.0, "tracktemp": 32.0})
-        base_params["airtemp"] = strategy.get("air_temp", default_temps["airtemp"])
-        base_params["tracktemp"] = strategy.get("track_temp", default_temps["tracktemp"])
 
-        stints = strategy.get("stints", [])
-        if not stints:
-            raise ValueError("Strategy must include at least one stint.")
+        # Default weather comes from track_config.yaml, like every other per-track setting.
+        track_settings = get_track_settings(base_params["track"])
+        base_params["airtemp"] = strategy.get("air_temp", float(track_settings["air_temp"]))
+        base_params["tracktemp"] = strategy.get("track_temp", float(track_settings["track_temp"]))
+        return base_params
 
-        # --- 2. Run the lap-by-lap simulation ---
-        lap_records = []
-        total_laps = sum(stint['laps'] for stint in stints)
+    def canonical_strategy(self, strategy: dict) -> dict:
+        """
+        Reduces a strategy payload to the inputs that determine its result, with defaults
+        resolved, so equivalent payloads compare and hash equal.
+        """
+        return {
+            **self._get_base_params(strategy),
+            "stints": [
+                {"compound": stint["compound"], "laps": int(stint["laps"])}
+                for stint in strategy.get("stints", [])
+            ],
+        }
+
+    def _build_lap_features(self, stints: list, base_params: dict) -> list:
+        """
+        Expands a list of stints into one feature row per lap of the race.
+        """
+        laps = []
         current_lap_number = 1
 
         for stint_info in stints:
             compound = stint_info['compound']
             num_laps_in_stint = stint_info['laps']
-            
+
             for tyre_lap in range(1, num_laps_in_stint + 1):
                 # Using lowercase keys to match the training data columns
-                lap_data = {
+                laps.append({
                     "tyrelife": float(tyre_lap),
                     "lapnumber": float(current_lap_number),
                     **base_params,
                     "compound": compound,
-                }
-                
-                predicted_time = self._predict_lap_time(lap_data)
-                
-                lap_records.append({
-                    "Lap Number": current_lap_number,
-                    "Compound": compound,
-                    "TyreLife": tyre_lap,
-                    "LapTimeInSeconds": round(predicted_time, 3)
                 })
                 current_lap_number += 1
 
-        # --- 3. Calculate summary statistics ---
-        if not lap_records:
-            return {"error": "Simulation produced no results."}
+        return laps
 
-        results_df = pd.DataFrame(lap_records)
-        best_lap = results_df.loc[results_df['LapTimeInSeconds'].idxmin()]
-        worst_lap = results_df.loc[results_df['LapTimeInSeconds'].idxmax()]
-        
-        summary = {
-            "total_laps_simulated": total_laps,
-            "average_lap_time": round(results_df['LapTimeInSeconds'].mean(), 3),
+    def predict_lap_time_grid(self, base_params: dict, compounds: list, total_laps: int, max_tyre_age: int,
+                              exact: bool = False, sources: dict = None) -> np.ndarray:
+        """
+        Predicts every reachable (compound, tyre life, lap number) combination of a race in one batch.
+
+        The returned array has shape (len(compounds), max_tyre_age + 1, total_laps + 1) and is indexed
+        as grid[compound_index, tyrelife, lapnumber] with 1-based tyre life and lap numbers.
+        Unreachable cells (a tyre older than the lap it is used on) are NaN.
+
+        Unless exact is set, the cells covered by the model's lap time table or distilled curves
+        are answered from them; only the rest are predicted by the model. Given a sources dict,
+        adds how many cells came from each source to it.
+        """
+        grid = np.full((len(compounds), max_tyre_age + 1, total_laps + 1), np.nan)
+        lap_grid, tyre_grid = np.meshgrid(np.arange(total_laps + 1), np.arange(max_tyre_age + 1))
+        reachable = (tyre_grid >= 1) & (tyre_grid <= lap_grid)
+        approximations = [] if exact else self.bundle.approximations
+
+        laps, index = [], []
+        for compound_index, compound in enumerate(compounds):
+            model_cells = reachable
+            if approximations:
+                with stage("fast_path"):
+                    grid[compound_index][reachable] = self._approximate(
+                        approximations, base_params, compound, tyre_grid[reachable], lap_grid[reachable], sources
+                    )
+                model_cells = reachable & np.isnan(grid[compound_index])
+            # What is left goes to the model, lap by lap as before
+            for lap_number, tyre_life in zip(*np.nonzero(model_cells.T)):
+                laps.append({
+                    "tyrelife": float(tyre_life),
+                    "lapnumber": float(lap_number),
+                    **base_params,
+                    "compound": compound,
+                })
+                index.append((compound_index, tyre_life, lap_number))
+
+        if laps:
+            compound_idx, tyre_idx, lap_idx = np.array(index).T
+            grid[compound_idx, tyre_idx, lap_idx] = self._predict_lap_times(laps)
+        count_source(sources, "model", len(laps))
+        return grid
+
+    def _lap_records(self, laps: list, lap_times: np.ndarray):
+        """
+        Yields the response record of each lap, one at a time.
+        """
+        for lap, lap_time in zip(laps, lap_times):
+            yield {
+                "Lap Number": int(lap["lapnumber"]),
+                "Compound": lap["compound"],
+                "TyreLife": int(lap["tyrelife"]),
+                "LapTimeInSeconds": round(float(lap_time), 3)
+            }
+
+    def _lap_columns(self, laps: list, lap_times: np.ndarray) -> dict:
+        """
+        The compact layout of the lap records: one array per field, with the compound
+        run-length encoded since it only changes at pit stops.
+        """
+        compounds, run_lengths = [], []
+        for lap in laps:
+            if compounds and compounds[-1] == lap["compound"]:
+                run_lengths[-1] += 1
+            else:
+                compounds.append(lap["compound"])
+                run_lengths.append(1)
+        return {
+            "Lap Number": [int(lap["lapnumber"]) for lap in laps],
+            "TyreLife": [int(lap["tyrelife"]) for lap in laps],
+            "LapTimeInSeconds": [round(float(lap_time), 3) for lap_time in lap_times],
+            "Compound": {"values": compounds, "run_lengths": run_lengths},
+        }
+
+    def _summarize(self, laps: list, lap_times: np.ndarray) -> dict:
+        """
+        Builds the race summary from the predicted lap times, without materializing the
+        lap records.
+        """
+        rounded = np.array([round(float(lap_time), 3) for lap_time in lap_times])
+        best, worst = int(np.argmin(rounded)), int(np.argmax(rounded))
+        return {
+            "total_laps_simulated": len(laps),
+            "average_lap_time": float(np.round(rounded.mean(), 3)),
             "best_lap": {
-                "lap_time": best_lap['LapTimeInSeconds'],
-                "lap_number": int(best_lap['Lap Number']),
-                "compound": best_lap['Compound'],
+                "lap_time": float(rounded[best]),
+                "lap_number": int(laps[best]["lapnumber"]),
+                "compound": laps[best]["compound"],
             },
             "worst_lap": {
-                "lap_time": worst_lap['LapTimeInSeconds'],
-                "lap_number": int(worst_lap['Lap Number']),
-                "compound": worst_lap['Compound'],
+                "lap_time": float(rounded[worst]),
+                "lap_number": int(laps[worst]["lapnumber"]),
+                "compound": laps[worst]["compound"],
             },
             "pit_stop_disclaimer": "Total race time does not include time lost during pit stops (typically +2.0-5.0s per stop)."
         }
 
+    def _build_results(self, laps: list, lap_times: np.ndarray, columnar: bool = False) -> dict:
+        """
+        Turns the per-lap features and predicted times into the simulation response, with
+        lap_records (default) or the columnar lap_columns.
+        """
+        if not laps:
+            return {"error": "Simulation produced no results."}
+
+        if columnar:
+            return {
+                "summary": self._summarize(laps, lap_times),
+                "lap_columns": self._lap_columns(laps, lap_times)
+            }
+        return {
+            "summary": self._summarize(laps, lap_times),
+            "lap_records": list(self._lap_records(laps, lap_times))
+        }
+
+    def _call_pinned(self, bundle: ModelBundle, fn, *args):
+        """
+        Calls fn with a bundle pinned, for work done after the request itself has returned
+        (streamed responses are generated after the request has unpinned its bundle).
+        """
+        token = self.pin(bundle)
+        try:
+            return fn(*args)
+        finally:
+            self.unpin(token)
+
+    def _stream_results(self, bundle: ModelBundle, laps: list, lap_times: np.ndarray = None, **line_fields):
+        """
+        Yields the simulation response as NDJSON lines: {"lap_record": ...} per lap, then
+        {"summary": ...} (or a single {"error": ...}). Extra fields are added to every line.
+        Without lap_times, each stint is predicted with the bundle just before its lines.
+        """
+        if not laps:
+            yield {**line_fields, "error": "Simulation produced no results."}
+            return
+        predict = lap_times is None
+        if predict:
+            lap_times = np.empty(len(laps))
+            stint_starts = [index for index, lap in enumerate(laps) if lap["tyrelife"] == 1.0] + [len(laps)]
+        else:
+            stint_starts = [0, len(laps)]
+        for start, end in zip(stint_starts, stint_starts[1:]):
+            if predict:
+                try:
+                    lap_times[start:end] = self._call_pinned(bundle, self._predict_lap_times, laps[start:end])
+                except Exception as e:
+                    yield {**line_fields, "error": f"Prediction failed: {e}"}
+                    return
+            for record in self._lap_records(laps[start:end], lap_times[start:end]):
+                yield {**line_fields, "lap_record": record}
+        yield {**line_fields, "summary": self._summarize(laps, lap_times)}
+
+    def run_simulation(self, strategy: dict, columnar: bool = False) -> dict:
+        """
+        Runs a full race simulation based on a user-defined strategy.
+        """
+        laps, lap_times = self._simulate_laps(strategy)
+
+        # --- 3. Calculate summary statistics ---
+        with stage("results"):
+            return self._build_results(laps, lap_times, columnar)
+
+    def stream_simulation(self, strategy: dict):
+        """
+        Validates a strategy and builds its laps now, and returns a generator of NDJSON
+        lines that predicts the race one stint at a time with the model pinned now, so the
+        first lap records go out before the rest of the race is predicted.
+        """
+        base_params = self._get_base_params(strategy)
+        stints = strategy.get("stints", [])
+        if not stints:
+            raise ValueError("Strategy must include at least one stint.")
+        laps = self._build_lap_features(stints, base_params)
+        return self._stream_results(self.bundle, laps)
+
+    def _simulate_laps(self, strategy: dict):
+        """
+        Builds the lap features of a strategy and predicts all of them in one batch.
+        """
+        # --- 1. Extract and validate inputs (using lowercase) ---
+        base_params = self._get_base_params(strategy)
+
+        stints = strategy.get("stints", [])
+        if not stints:
+            raise ValueError("Strategy must include at least one stint.")
+
+        # --- 2. Build the whole race up front and predict every lap in one batch ---
+        with stage("lap_features"):
+            laps = self._build_lap_features(stints, base_params)
+        return laps, self._predict_lap_times(laps)
+
+    def run_batch(self, strategies: list, columnar: bool = False) -> dict:
+        """
+        Runs many strategies with a single prediction over their de-duplicated lap rows.
+
+        Results come back in request order. An invalid strategy yields an {"error": ...}
+        entry in its slot instead of failing the whole batch.
+        """
+        item_laps, unique_times = self._predict_batch(strategies)
+
+        results = []
+        for item in item_laps:
+            if isinstance(item, Exception):
+                results.append({"error": str(item)})
+                continue
+            laps, positions = item
+            results.append(self._build_results(laps, unique_times[positions], columnar))
+
         return {
-            "summary": summary,
-            "lap_records": results_df.to_dict(orient='records')
+            "results": results,
+            "total_laps": sum(len(item[0]) for item in item_laps if not isinstance(item, Exception)),
+            "unique_laps_predicted": len(unique_times),
+        }
+
+    def stream_batch(self, strategies: list):
+        """
+        Validates a batch now and returns a generator of NDJSON lines for it: each strategy's
+        lines tagged with its "strategy" index, then a final {"summary": ...} line.
+
+        The strategies are built and predicted STREAM_BATCH_CHUNK at a time inside the
+        generator, with the model pinned now, so lines flow after the first chunk instead of
+        after the whole batch. Rows are de-duplicated within each chunk.
+        """
+        self._check_batch(strategies)
+        bundle = self.bundle
+
+        def lines():
+            total_laps = unique_laps = 0
+            for first in range(0, len(strategies), STREAM_BATCH_CHUNK):
+                try:
+                    item_laps, unique_times = self._call_pinned(
+                        bundle, self._predict_batch, strategies[first:first + STREAM_BATCH_CHUNK]
+                    )
+                except Exception as e:
+                    yield {"error": f"Prediction failed: {e}"}
+                    return
+                unique_laps += len(unique_times)
+                for index, item in enumerate(item_laps, start=first):
+                    if isinstance(item, Exception):
+                        yield {"strategy": index, "error": str(item)}
+                        continue
+                    laps, positions = item
+                    total_laps += len(laps)
+                    yield from self._stream_results(bundle, laps, unique_times[positions], strategy=index)
+            yield {"summary": {"total_laps": total_laps, "unique_laps_predicted": unique_laps}}
+        return lines()
+
+    def _check_batch(self, strategies: list) -> None:
+        if not isinstance(strategies, list) or not strategies:
+            raise ValueError("'strategies' must be a non-empty list.")
+        if len(strategies) > MAX_BATCH_STRATEGIES:
+            raise ValueError(f"A batch can contain at most {MAX_BATCH_STRATEGIES} strategies.")
+
+    def _predict_batch(self, strategies: list):
+        """
+        Validates a batch and predicts its de-duplicated lap rows. Returns one entry per
+        strategy, either (laps, positions into the predictions) or the exception it raised,
+        together with the predictions.
+        """
+        self._check_batch(strategies)
+
+        required_keys = ["track", "driver", "stints"]
+        item_laps, unique_rows, row_index = [], [], {}
+        for strategy in strategies:
+            try:
+                if not isinstance(strategy, dict) or not all(key in strategy for key in required_keys):
+                    raise ValueError(f"Strategy must include {required_keys}.")
+                stints = strategy.get("stints", [])
+                if not stints:
+                    raise ValueError("Strategy must include at least one stint.")
+                laps = self._build_lap_features(stints, self._get_base_params(strategy))
+            except KeyError as e:
+                item_laps.append(ValueError(f"Every stint must include {e}."))
+                continue
+            except (ValueError, TypeError) as e:
+                item_laps.append(e)
+                continue
+
+            # Strategies for the same race share most of their laps, so predict each row once.
+            positions = []
+            for lap in laps:
+                key = lap_key(lap)
+                if key not in row_index:
+                    row_index[key] = len(unique_rows)
+                    unique_rows.append(lap)
+                positions.append(row_index[key])
+            item_laps.append((laps, positions))
+
+        unique_times = self._predict_lap_times(unique_rows) if unique_rows else np.empty(0)
+        return item_laps, unique_times
+
+    def _sample_race_times(self, lap_times: np.ndarray, pit_laps: np.ndarray, safety_car_laps: np.ndarray,
+                           rng: np.random.Generator, options: dict) -> np.ndarray:
+        """
+        Samples total race times for one strategy given each sample's safety-car laps.
+        """
+        num_samples = safety_car_laps.shape[0]
+        samples = lap_times[None, :] + rng.normal(0.0, options["lap_time_noise"], (num_samples, len(lap_times)))
+        samples = np.where(safety_car_laps, samples * MC_SAFETY_CAR_LAP_FACTOR, samples)
+
+        pit_losses = rng.normal(options["pit_loss"], options["pit_loss_std"], (num_samples, len(pit_laps)))
+        pit_losses = np.maximum(pit_losses, 0.0)
+        if len(pit_laps):
+            pit_losses = np.where(safety_car_laps[:, pit_laps - 1], pit_losses * MC_SAFETY_CAR_PIT_FACTOR, pit_losses)
+
+        return samples.sum(axis=1) + pit_losses.sum(axis=1)
+
+    def run_monte_carlo(self, strategy: dict) -> dict:
+        """
+        Samples many race realisations of a strategy (and optionally a rival strategy on
+        'compare_stints') around one batched lap-time prediction.
+
+        Each sample draws safety-car periods, pit-loss times and lap-time noise as NumPy
+        arrays, so the model is only called once no matter how many samples are requested.
+        The lap times come from the lap time table or distilled curves where they cover
+        the race, unless 'exact' is set.
+        """
+        base_params = self._get_base_params(strategy)
+        track_settings = get_track_settings(base_params["track"])
+
+        options = {
+            "n_samples": int(strategy.get("n_samples", MC_DEFAULT_SAMPLES)),
+            "safety_car_probability": float(strategy.get("safety_car_probability", MC_DEFAULT_SAFETY_CAR_PROBABILITY)),
+            "pit_loss": float(strategy.get("pit_loss", track_settings.get("pit_stop_time", 23.0))),
+            "pit_loss_std": float(strategy.get("pit_loss_std", MC_DEFAULT_PIT_LOSS_STD)),
+            "lap_time_noise": float(strategy.get("lap_time_noise", MC_DEFAULT_LAP_TIME_NOISE)),
+        }
+        if not 1 <= options["n_samples"] <= MC_MAX_SAMPLES:
+            raise ValueError(f"'n_samples' must be between 1 and {MC_MAX_SAMPLES}.")
+        if not 0.0 <= options["safety_car_probability"] <= 100.0:
+            raise ValueError("'safety_car_probability' must be a percentage between 0 and 100.")
+        if options["pit_loss_std"] < 0 or options["lap_time_noise"] < 0:
+            raise ValueError("'pit_loss_std' and 'lap_time_noise' cannot be negative.")
+
+        stint_plans = {"strategy": strategy.get("stints", [])}
+        if strategy.get("compare_stints"):
+            stint_plans["compare"] = strategy["compare_stints"]
+        if not stint_plans["strategy"]:
+            raise ValueError("Strategy must include at least one stint.")
+
+        race_laps = {label: sum(stint['laps'] for stint in stints) for label, stints in stint_plans.items()}
+        if len(set(race_laps.values())) > 1:
+            raise ValueError("'stints' and 'compare_stints' must cover the same number of laps.")
+        total_laps = race_laps["strategy"]
+
+        # One prediction for every lap of every strategy; samples only perturb these times.
+        laps = {label: self._build_lap_features(stints, base_params) for label, stints in stint_plans.items()}
+        sources = {}
+        all_lap_times = self._predict_lap_times_fast(
+            [lap for label in laps for lap in laps[label]], exact=bool(strategy.get("exact", False)), sources=sources
+        )
+        base_lap_times = dict(zip(laps, np.split(all_lap_times, len(laps))))
+
+        # Safety-car periods are shared between strategies so comparisons see the same race.
+        rng = np.random.default_rng(strategy.get("seed"))
+        num_samples = options["n_samples"]
+        has_safety_car = rng.random(num_samples) < options["safety_car_probability"] / 100.0
+        safety_car_start = rng.integers(1, total_laps + 1, num_samples)
+        safety_car_length = rng.integers(MC_SAFETY_CAR_LAPS[0], MC_SAFETY_CAR_LAPS[1] + 1, num_samples)
+        lap_numbers = np.arange(1, total_laps + 1)
+        safety_car_laps = (
+            has_safety_car[:, None]
+            & (lap_numbers[None, :] >= safety_car_start[:, None])
+            & (lap_numbers[None, :] < (safety_car_start + safety_car_length)[:, None])
+        )
+
+        race_times, results = {}, {}
+        for label, stints in stint_plans.items():
+            pit_laps = np.cumsum([stint['laps'] for stint in stints])[:-1]
+            race_times[label] = self._sample_race_times(base_lap_times[label], pit_laps, safety_car_laps, rng, options)
+            p10, p50, p90 = np.percentile(race_times[label], [10, 50, 90])
+            results[label] = {
+                "stints": stints,
+                "deterministic_race_time": round(float(base_lap_times[label].sum() + len(pit_laps) * options["pit_loss"]), 3),
+                "mean_race_time": round(float(race_times[label].mean()), 3),
+                "std_race_time": round(float(race_times[label].std()), 3),
+                "p10_race_time": round(float(p10), 3),
+                "p50_race_time": round(float(p50), 3),
+                "p90_race_time": round(float(p90), 3),
+            }
+
+        response = {
+            "n_samples": num_samples,
+            "total_laps_simulated": total_laps,
+            "safety_car_rate": round(float(has_safety_car.mean()), 4),
+            "assumptions": options,
+            "lap_time_source": sources,
+            **results,
         }
+        if "compare" in race_times:
+            response["win_probability"] = round(float((race_times["strategy"] < race_times["compare"]).mean()), 4)
+        return response
 
-# Create a single instance of the simulator, passing the loaded model and preprocessor
-simulator = RaceSimulator(model=model_loader.model, preprocessor=model_loader.preprocessor)
+# Create a single instance of the simulator. It starts without a model; startup.py loads
+# the artifacts and swaps them in, so importing this module stays cheap.
+simulator = RaceSimulator(model=None, preprocessor=None)
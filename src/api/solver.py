@@ -0,0 +1,137 @@
+import numpy as np
+from simulator import simulator # We reuse the simulator's model and feature building
+from optimizer import DRY_COMPOUNDS, parse_search_options
+
+# --- Configuration ---
+# The DP is linear in the number of stops, so it can go further than the exhaustive search.
+MAX_SOLVER_STOPS = 6
+
+class PitStrategySolver:
+    """
+    Finds the optimal pit strategy with dynamic programming over race states.
+
+    A state after each lap is (compound, tyre age, set of compounds used, stops made). Lap
+    times come from one batched prediction over the (compound, tyre life, lap number) grid,
+    so the whole solve is a single O(laps x compounds x max_tyre_age) pass over that grid.
+    """
+    def __init__(self, simulator):
+        self.simulator = simulator
+
+    def _solve_states(self, grid: np.ndarray, options: dict, compounds: list):
+        """
+        Runs the forward DP pass and returns the optimal final state with its back-pointers.
+        """
+        num_compounds = grid.shape[0]
+        total_laps = options["total_laps"]
+        max_age = grid.shape[1] - 1
+        max_stops = options["max_stops"]
+        min_stint = options["min_stint_laps"]
+        pit_loss = options["pit_loss"]
+        num_masks = 1 << num_compounds
+
+        # Unreachable cells in the grid become infinitely slow laps.
+        lap_times = np.where(np.isnan(grid), np.inf, grid)
+
+        # values[compound, tyre_age, used_mask, stops] = best race time up to the current lap.
+        values = np.full((num_compounds, max_age + 1, num_masks, max_stops + 1), np.inf)
+        for compound in range(num_compounds):
+            values[compound, 1, 1 << compound, 0] = lap_times[compound, 1, 1]
+
+        # pit_from[lap][compound, used_mask, stops] = (previous compound, previous age, previous mask)
+        pit_from = {}
+        for lap in range(2, total_laps + 1):
+            next_values = np.full_like(values, np.inf)
+            next_values[:, 2:] = values[:, 1:-1] + lap_times[:, 2:, lap][:, :, None, None]
+
+            if max_stops > 0 and min_stint <= max_age:
+                # Best state to pit from for every (used_mask, stops) pair.
+                eligible = values[:, min_stint:, :, :max_stops]
+                flat = eligible.reshape(-1, num_masks, max_stops)
+                best_flat = flat.argmin(axis=0)
+                best_value = flat.min(axis=0)
+                best_compound, best_age = np.unravel_index(best_flat, eligible.shape[:2])
+
+                back = np.full((num_compounds, num_masks, max_stops + 1, 3), -1, dtype=np.int64)
+                for new_compound in range(num_compounds):
+                    stint_start = pit_loss + lap_times[new_compound, 1, lap]
+                    for prev_mask in range(num_masks):
+                        new_mask = prev_mask | (1 << new_compound)
+                        candidate = best_value[prev_mask] + stint_start
+                        current = next_values[new_compound, 1, new_mask, 1:]
+                        improved = candidate < current
+                        current[improved] = candidate[improved]
+                        back[new_compound, new_mask, 1:][improved] = np.stack([
+                            best_compound[prev_mask][improved],
+                            best_age[prev_mask][improved] + min_stint,
+                            np.full(improved.sum(), prev_mask),
+                        ], axis=1)
+                pit_from[lap] = back
+
+            values = next_values
+
+        # Only finish states that satisfy the stint length and compound rules are legal; the
+        # compound rule counts dry compounds only.
+        dry_mask = sum(1 << index for index, compound in enumerate(compounds) if compound in DRY_COMPOUNDS)
+        legal_masks = [m for m in range(num_masks) if bin(m & dry_mask).count("1") >= options["min_compounds"]]
+        final = np.full_like(values, np.inf)
+        final[:, min_stint:, legal_masks, :] = values[:, min_stint:, legal_masks, :]
+        best_state = np.unravel_index(np.argmin(final), final.shape)
+        return float(final[best_state]), best_state, pit_from
+
+    def _trace_plan(self, best_state: tuple, pit_from: dict, total_laps: int, compounds: list) -> tuple:
+        """
+        Walks the back-pointers from the final state to recover the stints and pit laps.
+        """
+        compound, age, mask, stops = (int(i) for i in best_state)
+        stints, pit_laps = [], []
+        lap = total_laps
+        while lap >= 1:
+            first_lap = lap - age + 1
+            stints.append({"compound": compounds[compound], "laps": age})
+            if first_lap == 1:
+                break
+            pit_laps.append(first_lap - 1)
+            compound, age, mask = (int(i) for i in pit_from[first_lap][compound, mask, stops])
+            stops -= 1
+            lap = first_lap - 1
+        return stints[::-1], pit_laps[::-1]
+
+    def solve(self, params: dict, columnar: bool = False) -> dict:
+        """
+        Returns the optimal strategy for a race and its lap-by-lap trace. 'lap_time_source'
+        counts where the searched lap times came from; the trace is always the model's.
+        """
+        options = parse_search_options(params, max_supported_stops=MAX_SOLVER_STOPS)
+        total_laps = options["total_laps"]
+        compounds = list(dict.fromkeys(options["compounds"]))
+        max_tyre_age = min(options["max_stint_laps"], total_laps)
+
+        base_params = self.simulator._get_base_params(params)
+        sources = {}
+        grid = self.simulator.predict_lap_time_grid(
+            base_params, compounds, total_laps, max_tyre_age, exact=bool(params.get("exact", False)), sources=sources
+        )
+
+        total_time, best_state, pit_from = self._solve_states(grid, options, compounds)
+        if not np.isfinite(total_time):
+            raise ValueError("No strategy satisfies the requested stop, stint and compound rules.")
+
+        stints, pit_laps = self._trace_plan(best_state, pit_from, total_laps, compounds)
+
+        # The trace always comes from the model, so it matches what run_simulation predicts
+        # for the plan even when the search ran on the lap time table or curves.
+        laps = self.simulator._build_lap_features(stints, base_params)
+        results = self.simulator._build_results(laps, self.simulator._predict_lap_times(laps), columnar)
+        results["lap_time_source"] = sources
+
+        results["plan"] = {
+            "stops": len(pit_laps),
+            "total_race_time": round(total_time, 3),
+            "pit_loss": options["pit_loss"],
+            "pit_laps": pit_laps,
+            "stints": stints,
+        }
+        return results
+
+# Create a single solver instance that shares the simulator's loaded model
+solver = PitStrategySolver(simulator)
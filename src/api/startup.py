@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from model_loader import model_loader
+from model_reloader import model_reloader
+from simulator import ModelBundle, simulator
+from served_models import served_models
+from track_shards import load_track_shards
+from degradation_curves import load_degradation_curves
+from lap_table import attach_lap_table
+
+# --- Configuration ---
+# Load the model in a background thread so the server accepts connections (and answers
+# liveness probes) immediately; routes return 503 until it is ready.
+STARTUP_IN_BACKGROUND = os.environ.get("STARTUP_IN_BACKGROUND", "0") == "1"
+
+class Startup:
+    """
+    Runs the API's startup phases in order and records how long each one took:
+    import, artifact_load, encoder_compile, predictor_select, warm_up and served_models.
+    """
+    def __init__(self):
+        self.phases_ms = {}
+        self.started = False
+        self.finished = False
+        self.error = None
+        self._lock = threading.Lock()
+
+    def record(self, phase: str, elapsed_ms: float) -> None:
+        self.phases_ms[phase] = round(elapsed_ms, 2)
+
+    def run(self) -> None:
+        """
+        Loads the artifacts, compiles and warms up the model, then swaps it into the
+        simulator and starts the registry watcher.
+        """
+        try:
+            started = time.perf_counter()
+            model_loader.load()
+            self.record("artifact_load", (time.perf_counter() - started) * 1000.0)
+
+            bundle = ModelBundle(
+                model_loader.model, model_loader.preprocessor, model_loader.model_version,
+                run_id=model_loader.run_id, source=model_loader.source,
+                preprocessor_sha256=model_loader.preprocessor_sha256,
+                shards=load_track_shards(model_loader, model_loader.run_id, model_loader.model_version),
+                curves=load_degradation_curves(model_loader, model_loader.run_id, model_loader.model_version)
+            )
+            attach_lap_table(bundle, model_loader)
+            bundle.warm_up()
+            self.phases_ms.update(bundle.timings)
+            simulator.swap(bundle)
+
+            if served_models.references:
+                started = time.perf_counter()
+                served_models.load()
+                self.record("served_models", (time.perf_counter() - started) * 1000.0)
+        except Exception as e:
+            self.error = str(e)
+            print(f"FATAL: API startup failed: {e}")
+        finally:
+            self.finished = True
+            print(f"Startup phases (ms): {self.phases_ms}")
+            # Keep watching the registry even after a failed start, so a fixed model recovers it.
+            model_reloader.start()
+
+    def start(self, background: bool = STARTUP_IN_BACKGROUND) -> None:
+        """
+        Runs startup once, either inline or in a background thread.
+        """
+        with self._lock:
+            if self.started:
+                return
+            self.started = True
+        if background:
+            threading.Thread(target=self.run, name="api-startup", daemon=True).start()
+        else:
+            self.run()
+
+    def start_with_bundle(self, bundle: ModelBundle) -> None:
+        """
+        Starts on a bundle built elsewhere (the replay benchmark's stub model) instead of
+        loading from the registry. The registry watcher is not started.
+        """
+        with self._lock:
+            if self.started:
+                return
+            self.started = True
+        bundle.warm_up()
+        self.phases_ms.update(bundle.timings)
+        simulator.swap(bundle)
+        self.finished = True
+
+    @property
+    def ready(self) -> bool:
+        return self.finished and simulator.active.model is not None
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "finished": self.finished,
+            "phases_ms": self.phases_ms,
+            "total_ms": round(sum(self.phases_ms.values()), 2),
+            "error": self.error,
+        }
+
+# A single, global startup sequence for the API process.
+startup = Startup()
@@ -0,0 +1,28 @@
+import json
+
+# --- Configuration ---
+NDJSON_MIMETYPE = "application/x-ndjson"
+NDJSON_MIMETYPES = (NDJSON_MIMETYPE, "application/ndjson", "application/jsonl")
+STREAM_QUERY_VALUES = ("1", "true", "ndjson")
+
+def wants_ndjson(accept_header: str, stream_flag: str = None) -> bool:
+    """
+    Returns True when a request asked for newline-delimited JSON, either with ?stream=1
+    (or ?stream=ndjson) or with an Accept header that lists an NDJSON type before JSON.
+    """
+    if stream_flag is not None and stream_flag.lower() in STREAM_QUERY_VALUES:
+        return True
+    for media_range in (accept_header or "").split(","):
+        media_type = media_range.split(";")[0].strip().lower()
+        if media_type in NDJSON_MIMETYPES:
+            return True
+        if media_type in ("application/json", "*/*", "application/*"):
+            return False
+    return False
+
+def ndjson_lines(lines):
+    """
+    Serializes an iterable of dicts to NDJSON, one encoded line at a time.
+    """
+    for line in lines:
+        yield (json.dumps(line, sort_keys=True, separators=(",", ":")) + "\n").encode()
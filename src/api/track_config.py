@@ -0,0 +1,29 @@
+import os
+import yaml
+
+# --- Configuration ---
+TRACK_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "track_config.yaml")
+
+
+def load_track_config(config_path: str = TRACK_CONFIG_PATH) -> dict:
+    """
+    Loads the per-track race settings from the YAML file that ships with the API.
+    """
+    try:
+        with open(config_path, 'r') as f:
+            return yaml.safe_load(f) or {}
+    except FileNotFoundError:
+        print(f"WARNING: Track config not found at {config_path}. Using built-in defaults only.")
+        return {}
+
+
+TRACK_CONFIG = load_track_config()
+
+
+def get_track_settings(track: str) -> dict:
+    """
+    Returns the settings for a track, falling back to the 'default' block for missing values.
+    """
+    settings = dict(TRACK_CONFIG.get("default", {}))
+    settings.update(TRACK_CONFIG.get("tracks", {}).get(track, {}))
+    return settings
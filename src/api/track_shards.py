@@ -0,0 +1,134 @@
+import os
+import threading
+from collections import OrderedDict
+from simulator import ModelBundle
+
+# --- Configuration ---
+# Use the per-track models of a run, when it has them (0 always uses the global model).
+TRACK_SHARDS_ENABLED = os.environ.get("TRACK_SHARDS_ENABLED", "1") != "0"
+# Shards kept in memory at once; the least recently used one is dropped beyond this.
+TRACK_SHARDS_MAX_LOADED = int(os.environ.get("TRACK_SHARDS_MAX_LOADED", 8))
+
+class TrackShards:
+    """
+    The per-track models of one training run, loaded on first use and kept in a bounded LRU.
+
+    The run's manifest maps tracks to shards. A shard is downloaded, compiled and warmed up
+    the first time one of its tracks is predicted (concurrent requests for it wait for the
+    one load). Tracks without a shard, and shards that fail to load, use the global model.
+    """
+    def __init__(self, loader, run_id: str, model_version: str, manifest: dict,
+                 max_loaded: int = TRACK_SHARDS_MAX_LOADED):
+        self.loader = loader
+        self.run_id = run_id
+        self.model_version = model_version
+        self.track_to_shard = dict(manifest.get("tracks", {}))
+        self.shards = dict(manifest.get("shards", {}))
+        self.max_loaded = max_loaded
+        self._loaded = OrderedDict()
+        self._failed = {}
+        self._lock = threading.Lock()
+        self._load_locks = {shard: threading.Lock() for shard in self.shards}
+        self.loads = 0
+        self.evictions = 0
+        self.fallback_rows = 0
+
+    def route(self, laps: list) -> list:
+        """
+        Groups lap indices by the bundle that should predict them: [(shard bundle or None, indices)].
+        None means the global model.
+        """
+        groups = {}
+        for index, lap in enumerate(laps):
+            groups.setdefault(self.track_to_shard.get(lap["track"]), []).append(index)
+
+        routed = []
+        for shard, indices in groups.items():
+            bundle = self.get(shard) if shard is not None else None
+            if bundle is None:
+                with self._lock:
+                    self.fallback_rows += len(indices)
+            routed.append((bundle, indices))
+        return routed
+
+    def prefetch(self, laps) -> None:
+        """
+        Loads the shards of the given laps' tracks in the calling thread, so a first-use
+        download happens in the request that needs it rather than on the micro-batcher's
+        thread, where it would hold up every other request.
+        """
+        for shard in {self.track_to_shard.get(lap["track"]) for lap in laps} - {None}:
+            self.get(shard)
+
+    def get(self, shard: str):
+        """
+        Returns a shard's bundle, loading it on first use, or None if it cannot be loaded.
+        """
+        with self._lock:
+            bundle = self._loaded.get(shard)
+            if bundle is not None:
+                self._loaded.move_to_end(shard)
+                return bundle
+            if shard in self._failed or shard not in self._load_locks:
+                return None
+
+        with self._load_locks[shard]:
+            with self._lock:
+                if shard in self._loaded:
+                    return self._loaded[shard]
+                if shard in self._failed:
+                    return None
+            try:
+                bundle = self._load(shard)
+            except Exception as e:
+                print(f"WARNING: Could not load track shard '{shard}' ({e}). Using the global model for it.")
+                with self._lock:
+                    self._failed[shard] = str(e)
+                return None
+
+            with self._lock:
+                self._loaded[shard] = bundle
+                self.loads += 1
+                while len(self._loaded) > self.max_loaded:
+                    evicted, _ = self._loaded.popitem(last=False)
+                    self.evictions += 1
+                    print(f"Evicted track shard '{evicted}' from memory.")
+            return bundle
+
+    def _load(self, shard: str) -> ModelBundle:
+        artifacts = self.loader.fetch_shard(self.run_id, self.model_version, self.shards[shard]["path"])
+        bundle = ModelBundle(
+            artifacts["model"], artifacts["preprocessor"], f"{self.model_version}/{shard}",
+            run_id=self.run_id, source="shard", preprocessor_sha256=artifacts["preprocessor_sha256"]
+        )
+        if bundle.predictor is None:
+            raise ValueError("The shard model could not be loaded.")
+        bundle.warm_up()
+        print(f"Loaded track shard '{shard}' for tracks {self.shards[shard].get('tracks')}.")
+        return bundle
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "shards": len(self.shards),
+                "tracks": len(self.track_to_shard),
+                "loaded": list(self._loaded),
+                "max_loaded": self.max_loaded,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "failed": dict(self._failed),
+                "fallback_rows": self.fallback_rows,
+            }
+
+def load_track_shards(loader, run_id: str, model_version: str):
+    """
+    Returns the TrackShards of a run, or None when sharding is off or the run has no shards.
+    Only the manifest is fetched here; the shards themselves load on demand.
+    """
+    if not TRACK_SHARDS_ENABLED or not run_id:
+        return None
+    manifest = loader.fetch_shard_manifest(run_id, model_version)
+    if not manifest or not manifest.get("shards"):
+        return None
+    print(f"Run {run_id} has {len(manifest['shards'])} track shards covering {len(manifest.get('tracks', {}))} tracks.")
+    return TrackShards(loader, run_id, model_version, manifest)
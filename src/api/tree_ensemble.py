@@ -0,0 +1,178 @@
+import json
+import numpy as np
+from scipy import sparse
+
+class TreeEnsemble:
+    """
+    A tree ensemble flattened into NumPy arrays and evaluated level by level.
+
+    Every node of every tree lives in the same arrays (feature index, threshold, left/right
+    child, default direction for missing values, leaf value). Leaves point at themselves, so
+    a whole batch can be pushed down all trees at once for max_depth vectorized steps.
+    The leaves are then added up in the library's own order and precision, so predictions
+    are bit-identical to the model's predict.
+    """
+    def __init__(self, roots, feature, threshold, left, right, default_left, leaf_value,
+                 max_depth: int, base_score: float, average: bool, strict_less: bool, sparse_missing: bool):
+        self.roots = np.asarray(roots, dtype=np.int64)
+        self.feature = np.asarray(feature, dtype=np.int64)
+        self.left = np.asarray(left, dtype=np.int64)
+        self.right = np.asarray(right, dtype=np.int64)
+        self.default_left = np.asarray(default_left, dtype=bool)
+        self.max_depth = max_depth
+        self.base_score = base_score
+        self.average = average
+        # XGBoost splits on x < threshold in float32; sklearn on x <= threshold with float32 inputs.
+        self.strict_less = strict_less
+        self.threshold = np.asarray(threshold, dtype=np.float32 if strict_less else np.float64)
+        # XGBoost also adds up its float32 leaf values in float32; sklearn in float64.
+        self.leaf_value = np.asarray(leaf_value, dtype=np.float32 if strict_less else np.float64)
+        # XGBoost treats entries absent from a sparse matrix as missing; sklearn treats them as zero.
+        self.sparse_missing = sparse_missing
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    def _to_dense(self, features) -> np.ndarray:
+        if sparse.issparse(features):
+            features = features.tocsr()
+            if self.sparse_missing:
+                dense = np.full(features.shape, np.nan, dtype=np.float32)
+                rows = np.repeat(np.arange(features.shape[0]), np.diff(features.indptr))
+                dense[rows, features.indices] = features.data
+                return dense
+            return features.toarray().astype(np.float32)
+        return np.asarray(features, dtype=np.float32)
+
+    def predict(self, features) -> np.ndarray:
+        """
+        Predicts a batch by walking every row down every tree one level at a time.
+        """
+        X = self._to_dense(features)
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], self.n_trees)).copy()
+
+        for _ in range(self.max_depth):
+            values = X[rows, self.feature[nodes]]
+            thresholds = self.threshold[nodes]
+            go_left = values < thresholds if self.strict_less else values <= thresholds
+            missing = np.isnan(values)
+            go_left = np.where(missing, self.default_left[nodes], go_left)
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        leaves = self.leaf_value[nodes]
+        # cumsum adds strictly left to right (sum and mean add pairwise, which rounds differently).
+        if self.average:
+            # sklearn adds the trees' predictions one at a time, then divides.
+            return np.cumsum(leaves, axis=1)[:, -1] / self.n_trees + self.base_score
+        # XGBoost starts each row at base_score and adds every tree's leaf in tree order.
+        start = np.full((X.shape[0], 1), self.base_score, dtype=leaves.dtype)
+        return np.cumsum(np.hstack([start, leaves]), axis=1, dtype=leaves.dtype)[:, -1].astype(np.float64)
+
+def _tree_depth(left: np.ndarray, right: np.ndarray, root: int) -> int:
+    depth, frontier = 0, [root]
+    while True:
+        children = [c for node in frontier for c in (left[node], right[node]) if c != node]
+        if not children:
+            return depth
+        frontier, depth = children, depth + 1
+
+def _assemble(trees: list, **kwargs) -> TreeEnsemble:
+    """
+    Concatenates per-tree node arrays into one ensemble, offsetting child indices and
+    turning leaves into self-loops.
+    """
+    roots, feature, threshold, left, right, default_left, leaf_value = [], [], [], [], [], [], []
+    offset, max_depth = 0, 0
+    for tree in trees:
+        n_nodes = len(tree["left"])
+        node_ids = np.arange(n_nodes) + offset
+        is_leaf = tree["left"] < 0
+        tree_left = np.where(is_leaf, node_ids, tree["left"] + offset)
+        tree_right = np.where(is_leaf, node_ids, tree["right"] + offset)
+
+        roots.append(offset)
+        feature.append(np.where(is_leaf, 0, tree["feature"]))
+        threshold.append(np.where(is_leaf, 0.0, tree["threshold"]))
+        left.append(tree_left)
+        right.append(tree_right)
+        default_left.append(tree["default_left"])
+        leaf_value.append(np.where(is_leaf, tree["value"], 0.0))
+        max_depth = max(max_depth, _tree_depth(tree_left - offset, tree_right - offset, 0))
+        offset += n_nodes
+
+    return TreeEnsemble(
+        roots, np.concatenate(feature), np.concatenate(threshold), np.concatenate(left),
+        np.concatenate(right), np.concatenate(default_left), np.concatenate(leaf_value),
+        max_depth=max_depth, **kwargs
+    )
+
+def compile_random_forest(model) -> TreeEnsemble:
+    """
+    Flattens a fitted sklearn RandomForestRegressor (single output).
+    """
+    trees = []
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        if tree.n_outputs != 1:
+            return None
+        trees.append({
+            "left": tree.children_left.astype(np.int64),
+            "right": tree.children_right.astype(np.int64),
+            "feature": tree.feature.astype(np.int64),
+            "threshold": tree.threshold,
+            "default_left": np.zeros(tree.node_count, dtype=bool),
+            "value": tree.value[:, 0, 0],
+        })
+    return _assemble(trees, base_score=0.0, average=True, strict_less=False, sparse_missing=False)
+
+def compile_xgboost(model) -> TreeEnsemble:
+    """
+    Flattens a fitted XGBRegressor with a gbtree booster and an identity link objective.
+    """
+    config = json.loads(model.get_booster().save_raw("json"))["learner"]
+    if config["gradient_booster"]["name"] != "gbtree" or config["objective"]["name"] != "reg:squarederror":
+        return None
+    if int(config["learner_model_param"].get("num_target", 1)) != 1:
+        return None
+
+    booster_model = config["gradient_booster"]["model"]
+    trees_per_round = int(booster_model["gbtree_model_param"].get("num_parallel_tree", 1))
+    json_trees = booster_model["trees"]
+    # Match XGBRegressor.predict, which stops at the best early-stopping round.
+    try:
+        json_trees = json_trees[:(int(model.best_iteration) + 1) * trees_per_round]
+    except AttributeError:
+        pass
+
+    trees = []
+    for tree in json_trees:
+        if any(split_type != 0 for split_type in tree["split_type"]):
+            return None # Categorical splits are not supported
+        trees.append({
+            "left": np.asarray(tree["left_children"], dtype=np.int64),
+            "right": np.asarray(tree["right_children"], dtype=np.int64),
+            "feature": np.asarray(tree["split_indices"], dtype=np.int64),
+            "threshold": np.asarray(tree["split_conditions"], dtype=np.float32),
+            "default_left": np.asarray(tree["default_left"], dtype=bool),
+            # Leaves store their (already learning-rate scaled) weight in split_conditions.
+            "value": np.asarray(tree["split_conditions"], dtype=np.float32),
+        })
+
+    base_score = float(config["learner_model_param"]["base_score"].strip("[]"))
+    return _assemble(trees, base_score=base_score, average=False, strict_less=True, sparse_missing=True)
+
+def compile_tree_ensemble(model):
+    """
+    Converts a RandomForestRegressor or XGBRegressor into a TreeEnsemble, or returns None
+    for any other model type.
+    """
+    try:
+        if hasattr(model, "get_booster"):
+            return compile_xgboost(model)
+        if hasattr(model, "estimators_") and all(hasattr(e, "tree_") for e in model.estimators_):
+            return compile_random_forest(model)
+    except Exception as e:
+        print(f"WARNING: Could not compile the tree ensemble ({e}).")
+    return None
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, Any
+
+# --- Configuration ---
+CURVES_FILENAME = "curves.npz"
+# The API (src/api/degradation_curves.py) evaluates the same basis; bump the name if it changes.
+# Its term order and a probe of its design matrix are saved with the curves and checked on load.
+CURVE_BASIS = "piecewise_cubic_v1"
+DEFAULT_KNOTS = (10.0, 20.0, 30.0) # Tyre life (laps) where the cubic may bend
+VALIDATION_FRACTION = 0.25
+# (tyrelife, lapnumber, airtemp, tracktemp) points the API re-evaluates the basis on.
+BASIS_PROBE = np.array([
+    [1.0, 1.0, 25.0, 35.0], [8.0, 12.0, 14.5, 22.0], [15.0, 40.0, 31.0, 48.5],
+    [27.0, 55.0, 19.0, 41.0], [38.0, 70.0, 36.5, 57.0], [52.0, 78.0, 9.0, 18.5],
+])
+
+def piecewise_basis(tyrelife, lapnumber, airtemp, tracktemp, knots) -> np.ndarray:
+    """
+    Builds the design matrix of a degradation curve: a cubic spline in tyre life (truncated
+    power basis), a quadratic in lap number (fuel burn), a tyre life x lap number term and
+    linear temperature terms, with track temperature also scaling the degradation rate.
+
+    Args:
+        tyrelife, lapnumber, airtemp, tracktemp: Arrays of equal length.
+        knots: Tyre life values where the spline pieces join.
+
+    Returns:
+        np.ndarray: One row per sample, one column per basis term.
+    """
+    t = np.asarray(tyrelife, dtype=float) / 50.0
+    l = np.asarray(lapnumber, dtype=float) / 70.0
+    a = (np.asarray(airtemp, dtype=float) - 25.0) / 10.0
+    s = (np.asarray(tracktemp, dtype=float) - 35.0) / 15.0
+    columns = [np.ones_like(t), t, t ** 2, t ** 3]
+    columns += [np.maximum(t - knot / 50.0, 0.0) ** 3 for knot in knots]
+    columns += [l, l ** 2, t * l, a, s, t * s]
+    return np.column_stack(columns)
+
+def basis_terms(knots) -> list:
+    """
+    Names the columns of piecewise_basis in order, with t = tyrelife/50, l = lapnumber/70,
+    a = (airtemp-25)/10 and s = (tracktemp-35)/15.
+    """
+    return ["1", "t", "t^2", "t^3", *[f"max(t-{knot:g}/50,0)^3" for knot in knots], "l", "l^2", "t*l", "a", "s", "t*s"]
+
+def distill_degradation_curves(
+    predict_fn: Callable[[pd.DataFrame], np.ndarray],
+    X_reference: pd.DataFrame,
+    params: Dict[str, Any]
+) -> Dict[str, np.ndarray]:
+    """
+    Fits one compact curve per (track, compound, driver) to the predictions of the trained
+    model, so the API can evaluate lap times without running the model.
+
+    Each curve is fitted by least squares on random points inside the ranges seen in the
+    training data for that track and compound (tyre life never above lap number) and
+    checked on held-out points; its maximum and 99th percentile absolute errors are stored
+    with it so the API can decide which curves are accurate enough to use.
+
+    Args:
+        predict_fn: Maps a DataFrame of model features to lap times (the production model).
+        X_reference: The training features, used for the combinations and value ranges.
+        params: The 'distillation' section of params.yaml.
+
+    Returns:
+        Dict[str, np.ndarray]: The arrays saved to curves.npz.
+    """
+    rng = np.random.default_rng(params.get('random_state', 42))
+    samples = int(params.get('samples_per_curve', 400))
+    knots = tuple(params.get('knots', DEFAULT_KNOTS))
+    year = int(params.get('year', 2025))
+
+    keys, ranges, frames = [], [], []
+    for (track, compound), group in X_reference.groupby(['track', 'compound']):
+        track_rows = X_reference[X_reference['track'] == track]
+        box = np.array([
+            [1.0, float(group['tyrelife'].max())],
+            [1.0, float(track_rows['lapnumber'].max())],
+            [float(group['airtemp'].min()), float(group['airtemp'].max())],
+            [float(group['tracktemp'].min()), float(group['tracktemp'].max())],
+        ])
+        for driver in sorted(track_rows['driver'].unique()):
+            lapnumber = rng.uniform(box[1, 0], box[1, 1], samples).round()
+            tyrelife = np.minimum(rng.uniform(box[0, 0], box[0, 1], samples).round(), lapnumber)
+            frames.append(pd.DataFrame({
+                'compound': compound, 'track': track, 'year': year, 'driver': driver,
+                'tyrelife': tyrelife, 'lapnumber': lapnumber,
+                'airtemp': rng.uniform(box[2, 0], box[2, 1], samples).round(1),
+                'tracktemp': rng.uniform(box[3, 0], box[3, 1], samples).round(1),
+            }))
+            keys.append((track, compound, driver))
+            ranges.append(box)
+
+    print(f"Predicting {samples * len(keys)} distillation samples for {len(keys)} curves...")
+    points = pd.concat(frames, ignore_index=True)
+    targets = np.asarray(predict_fn(points), dtype=float).reshape(len(keys), samples)
+    inputs = points[['tyrelife', 'lapnumber', 'airtemp', 'tracktemp']].to_numpy(dtype=float).reshape(len(keys), samples, 4)
+
+    n_fit = samples - int(samples * VALIDATION_FRACTION)
+    coefficients = np.empty((len(keys), len(basis_terms(knots))))
+    max_abs_error = np.empty(len(keys))
+    p99_abs_error = np.empty(len(keys))
+    for index in range(len(keys)):
+        design = piecewise_basis(*inputs[index].T, knots)
+        coefficients[index] = np.linalg.lstsq(design[:n_fit], targets[index, :n_fit], rcond=None)[0]
+        errors = np.abs(design[n_fit:] @ coefficients[index] - targets[index, n_fit:])
+        max_abs_error[index] = errors.max()
+        p99_abs_error[index] = np.percentile(errors, 99)
+
+    print(f"Distilled {len(keys)} curves: median max error {np.median(max_abs_error):.4f}s, "
+          f"worst {max_abs_error.max():.4f}s.")
+    return {
+        "basis": np.array(CURVE_BASIS),
+        "knots": np.array(knots, dtype=float),
+        "basis_terms": np.array(basis_terms(knots)),
+        "basis_probe": BASIS_PROBE,
+        "basis_probe_design": piecewise_basis(*BASIS_PROBE.T, knots),
+        "year": np.array(year),
+        "tracks": np.array([key[0] for key in keys]),
+        "compounds": np.array([key[1] for key in keys]),
+        "drivers": np.array([key[2] for key in keys]),
+        "coefficients": coefficients,
+        "ranges": np.array(ranges),
+        "max_abs_error": max_abs_error,
+        "p99_abs_error": p99_abs_error,
+    }
+
+def save_curves(curves: Dict[str, np.ndarray], output_path: str = CURVES_FILENAME) -> str:
+    """
+    Writes the curve arrays as an uncompressed .npz, which the API can read without pickle.
+    """
+    np.savez(output_path, **curves)
+    return output_path
@@ -1,3 +1,8 @@
+import json
+import os
+import re
+import shutil
+import numpy as np
 import pandas as pd
 import mlflow
 import yaml
@@ -8,11 +13,127 @@ import joblib
 from model.preprocessing import create_preprocessor, fit_and_save_preprocessor
 from model.models import MODEL_GETTERS
 from model.evaluate import get_regression_metrics
+from model.distill import CURVES_FILENAME, distill_degradation_curves, save_curves
 
 # --- Configuration ---
 PARAMS_FILE = "params.yaml" # This should be accessible in the Airflow environment
 PREPROCESSOR_FILENAME = "preprocessor.joblib"
 MODEL_FILENAME = "model.joblib"
+SHARDS_DIR = "shards" # Logged under the same run; the API reads shards/manifest.json
+
+def _fit_model(model_name: str, model_params: dict, X_train, y_train, X_test, y_test):
+    """
+    Creates and fits a model, using the test set for early stopping with XGBoost.
+    """
+    model = MODEL_GETTERS[model_name](model_params)
+    if model_name == 'xgboost':
+        model.fit(X_train, y_train, eval_set=[(X_test, y_test)], verbose=False)
+    else:
+        model.fit(X_train, y_train)
+    return model
+
+def train_track_shards(X_train, X_test, y_train, y_test, model_name: str, model_params: dict, params: dict,
+                       global_model, global_preprocessor, output_dir: str = SHARDS_DIR) -> dict:
+    """
+    Trains one model per track (or per track cluster) on the global train/test split and
+    writes each shard's preprocessor and model plus a manifest to output_dir.
+
+    A single-track shard drops the 'track' column, so its feature matrix is much narrower
+    than the global one. Tracks with too few laps, and shards that do not beat the global
+    model on their own test laps (when sharding.require_improvement is set), stay on the
+    global model.
+
+    Returns:
+        dict: The manifest: {"tracks": {track: shard}, "shards": {shard: details}}.
+    """
+    sharding = params.get('sharding', {})
+    categorical = params['features']['categorical']
+    numerical = params['features']['numerical']
+    min_rows = sharding.get('min_rows', 2000)
+
+    clusters = {name: list(tracks) for name, tracks in (sharding.get('clusters') or {}).items()}
+    clustered = {track for tracks in clusters.values() for track in tracks}
+    for track in sorted(X_train['track'].unique()):
+        if track not in clustered:
+            clusters[track] = [track]
+
+    # Start from an empty directory: scripts/run_training.py trains several models in the
+    # same working directory, and a previous model's shards must not be logged with this one.
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+
+    global_features = len(global_preprocessor.get_feature_names_out())
+    manifest = {"model_name": model_name, "tracks": {}, "shards": {}}
+    for shard_name, tracks in clusters.items():
+        train_rows = X_train['track'].isin(tracks)
+        test_rows = X_test['track'].isin(tracks)
+        if train_rows.sum() < min_rows or test_rows.sum() == 0:
+            print(f"Skipping shard '{shard_name}': only {int(train_rows.sum())} training laps.")
+            continue
+
+        shard_categorical = [c for c in categorical if c != 'track' or len(tracks) > 1]
+        preprocessor = create_preprocessor(X_train[train_rows], shard_categorical, numerical).fit(X_train[train_rows])
+        shard_X_train = preprocessor.transform(X_train[train_rows])
+        shard_X_test = preprocessor.transform(X_test[test_rows])
+        model = _fit_model(model_name, model_params, shard_X_train, y_train[train_rows], shard_X_test, y_test[test_rows])
+
+        shard_metrics = get_regression_metrics(y_test[test_rows], model.predict(shard_X_test))
+        global_metrics = get_regression_metrics(
+            y_test[test_rows], global_model.predict(global_preprocessor.transform(X_test[test_rows]))
+        )
+        print(f"Shard '{shard_name}': MAE {shard_metrics['mae']:.4f} vs global {global_metrics['mae']:.4f} "
+              f"({shard_X_train.shape[1]} features vs {global_features}).")
+        if sharding.get('require_improvement', True) and shard_metrics['mae'] >= global_metrics['mae']:
+            print(f"Shard '{shard_name}' does not beat the global model; its tracks stay on the global model.")
+            continue
+
+        shard_id = re.sub(r'[^A-Za-z0-9_-]+', '_', shard_name)
+        shard_dir = os.path.join(output_dir, shard_id)
+        os.makedirs(shard_dir, exist_ok=True)
+        joblib.dump(preprocessor, os.path.join(shard_dir, PREPROCESSOR_FILENAME))
+        joblib.dump(model, os.path.join(shard_dir, MODEL_FILENAME))
+
+        manifest["shards"][shard_id] = {
+            "name": shard_name,
+            "path": f"{SHARDS_DIR}/{shard_id}",
+            "tracks": tracks,
+            "training_rows": int(train_rows.sum()),
+            "n_features": int(shard_X_train.shape[1]),
+            "metrics": shard_metrics,
+            "global_metrics": global_metrics,
+        }
+        for track in tracks:
+            manifest["tracks"][track] = shard_id
+
+    with open(os.path.join(output_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def _served_predict_fn(global_model, global_preprocessor, manifest: dict = None, shards_dir: str = SHARDS_DIR):
+    """
+    Returns a function predicting lap times the way the API serves this run: each track's laps
+    go to its shard when it has one, and everything else to the global model.
+    """
+    shards = {}
+    for shard_id in (manifest or {}).get("shards", {}):
+        shards[shard_id] = (
+            joblib.load(os.path.join(shards_dir, shard_id, PREPROCESSOR_FILENAME)),
+            joblib.load(os.path.join(shards_dir, shard_id, MODEL_FILENAME)),
+        )
+    track_to_shard = (manifest or {}).get("tracks", {})
+
+    def predict(X: pd.DataFrame):
+        predictions = pd.Series(0.0, index=X.index)
+        routes = X['track'].map(track_to_shard)
+        for shard_id, (preprocessor, model) in shards.items():
+            rows = routes == shard_id
+            if rows.any():
+                predictions[rows] = model.predict(preprocessor.transform(X[rows]))
+        rows = routes.isna()
+        if rows.any():
+            predictions[rows] = global_model.predict(global_preprocessor.transform(X[rows]))
+        return predictions.to_numpy()
+    return predict
 
 def train_model(data: pd.DataFrame, model_name: str):
     """
@@ -65,15 +186,9 @@ def train_model(data: pd.DataFrame, model_name: str):
         print("Data transformation complete.")
 
         # 6. Get and Train the Model
-        model_getter = MODEL_GETTERS[model_name]
-        model = model_getter(model_params)
-        
         print(f"Training {model_name} model...")
         # For XGBoost, we can use the validation set for early stopping
-        if model_name == 'xgboost':
-            model.fit(X_train_transformed, y_train, eval_set=[(X_test_transformed, y_test)], verbose=False)
-        else:
-            model.fit(X_train_transformed, y_train)
+        model = _fit_model(model_name, model_params, X_train_transformed, y_train, X_test_transformed, y_test)
         print("Model training complete.")
 
         # 7. Evaluate the Model and Log Metrics
@@ -87,6 +202,35 @@ def train_model(data: pd.DataFrame, model_name: str):
         mlflow.log_artifact(MODEL_FILENAME)
         print("Model artifact saved and logged to MLflow.")
 
+        # 9. Optionally train per-track shards; the API falls back to the global model above
+        if params.get('sharding', {}).get('enabled', False):
+            print("Training per-track shards...")
+            manifest = train_track_shards(
+                X_train, X_test, y_train, y_test, model_name, model_params, params,
+                model, fitted_preprocessor
+            )
+            mlflow.log_artifacts(SHARDS_DIR, artifact_path=SHARDS_DIR)
+            mlflow.log_metric("track_shards", len(manifest["shards"]))
+            print(f"{len(manifest['shards'])} track shards logged to MLflow.")
+
+        # 10. Optionally distill per-(track, compound, driver) curves from the served predictions
+        distillation = params.get('distillation', {})
+        if distillation.get('enabled', False):
+            print("Distilling degradation curves...")
+            served_manifest = manifest if params.get('sharding', {}).get('enabled', False) else None
+            curves = distill_degradation_curves(
+                _served_predict_fn(model, fitted_preprocessor, served_manifest), X_train, distillation
+            )
+            # The curves follow the shards; the API ignores them when it serves without shards.
+            curves["track_shards"] = np.array(bool(served_manifest and served_manifest["shards"]))
+            mlflow.log_artifact(save_curves(curves, CURVES_FILENAME))
+            mlflow.log_metrics({
+                "curves": len(curves["coefficients"]),
+                "curves_median_max_abs_error": float(np.median(curves["max_abs_error"])),
+                "curves_worst_max_abs_error": float(curves["max_abs_error"].max()),
+            })
+            print(f"{len(curves['coefficients'])} degradation curves logged to MLflow.")
+
     print(f"--- Training run for {model_name} complete. ---")
 
 # Example of how to run this script (for local testing)
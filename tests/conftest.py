@@ -0,0 +1,138 @@
+import os
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+import pytest
+
+# The API modules use flat imports, the stub models are built with the training code and
+# the scripts are imported as modules.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src", "api"), os.path.join(ROOT, "src"), os.path.join(ROOT, "scripts")]
+
+# Keep the API's module-level singletons away from the user's cache and any registry.
+os.environ.setdefault("ARTIFACT_CACHE_DIR", tempfile.mkdtemp(prefix="f1-test-artifacts-"))
+os.environ.setdefault("MODEL_POLL_INTERVAL_SECONDS", "0")
+
+CATEGORICAL = ["compound", "track", "year", "driver"]
+NUMERICAL = ["tyrelife", "lapnumber", "airtemp", "tracktemp"]
+TRACKS = ["Bahrain", "Monza", "Silverstone", "Suzuka"]
+DRIVERS = ["VER", "HAM", "LEC", "NOR"]
+COMPOUNDS = ["soft", "medium", "hard"]
+STUB_MODEL_PARAMS = {
+    "ridge": {},
+    "random_forest": {"n_estimators": 10, "max_depth": 6},
+    "xgboost": {"n_estimators": 30, "early_stopping_rounds": None},
+}
+
+def make_laps(n: int, seed: int = 0) -> tuple:
+    """
+    Synthetic training laps and their lap times, with a plausible degradation shape.
+    """
+    rng = np.random.default_rng(seed)
+    laps = pd.DataFrame({
+        "compound": rng.choice(COMPOUNDS, n),
+        "track": rng.choice(TRACKS, n),
+        "year": rng.choice([2023, 2024, 2025], n),
+        "driver": rng.choice(DRIVERS, n),
+        "tyrelife": rng.integers(1, 40, n).astype(float),
+        "lapnumber": rng.integers(1, 60, n).astype(float),
+        "airtemp": rng.uniform(10, 40, n).round(1),
+        "tracktemp": rng.uniform(15, 55, n).round(1),
+    })
+    lap_times = (90 + laps["compound"].map({"soft": 0.0, "medium": 0.4, "hard": 0.8})
+                 + laps["compound"].map({"soft": 0.08, "medium": 0.05, "hard": 0.03}) * laps["tyrelife"]
+                 - 0.03 * laps["lapnumber"] + 0.02 * laps["tracktemp"] + rng.normal(0, 0.2, n))
+    return laps, lap_times
+
+def fit_stub_model(model_name: str, laps: pd.DataFrame, lap_times: pd.Series):
+    """
+    Fits the training pipeline's preprocessor and a small model of the given type.
+    """
+    from model.models import MODEL_GETTERS
+    from model.preprocessing import create_preprocessor
+
+    preprocessor = create_preprocessor(laps, CATEGORICAL, NUMERICAL).fit(laps)
+    model = MODEL_GETTERS[model_name](STUB_MODEL_PARAMS[model_name])
+    model.fit(preprocessor.transform(laps), lap_times)
+    return preprocessor, model
+
+@pytest.fixture(scope="session")
+def training_laps():
+    return make_laps(3000)
+
+@pytest.fixture(scope="session", params=sorted(STUB_MODEL_PARAMS))
+def stub_model(request, training_laps):
+    """
+    (model name, fitted preprocessor, fitted model) for Ridge, random forest and XGBoost.
+    """
+    preprocessor, model = fit_stub_model(request.param, *training_laps)
+    return request.param, preprocessor, model
+
+class StubMlflowClient:
+    """
+    Serves run artifacts from local directories (artifact_root/<run_id>/...) like
+    MlflowClient, and counts the calls made to it.
+    """
+    def __init__(self, artifact_root: str, versions: dict):
+        self.artifact_root = artifact_root
+        self.versions = versions # alias or version number -> (version, run_id)
+        self.calls = []
+
+    def _model_version(self, key: str):
+        from types import SimpleNamespace
+        version, run_id = self.versions[key]
+        return SimpleNamespace(version=version, run_id=run_id)
+
+    def get_model_version_by_alias(self, name: str, alias: str):
+        self.calls.append(("get_model_version_by_alias", alias))
+        return self._model_version(alias)
+
+    def get_model_version(self, name: str, version: str):
+        self.calls.append(("get_model_version", version))
+        return self._model_version(version)
+
+    def list_artifacts(self, run_id: str, path: str = None) -> list:
+        from types import SimpleNamespace
+        self.calls.append(("list_artifacts", path))
+        directory = os.path.join(self.artifact_root, run_id, path or "")
+        if not os.path.isdir(directory):
+            return []
+        return [SimpleNamespace(path=f"{path}/{name}" if path else name) for name in sorted(os.listdir(directory))]
+
+    def download_artifacts(self, run_id: str, path: str, dst_path: str) -> str:
+        import shutil
+        self.calls.append(("download_artifacts", path))
+        source = os.path.join(self.artifact_root, run_id, path)
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"No artifact '{path}' in run {run_id}.")
+        destination = os.path.join(dst_path, path)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(source, destination)
+        return destination
+
+def unreachable_registry():
+    raise ConnectionError("The MLflow registry is unreachable.")
+
+# Importing app starts the API, whose loader would otherwise import mlflow and call the
+# configured registry. Tests that need one install a StubMlflowClient (stub_registry).
+import model_loader
+model_loader._mlflow_client = unreachable_registry
+
+@pytest.fixture
+def stub_registry(tmp_path, training_laps, monkeypatch):
+    """
+    A registry with one Ridge run as version 1 under the 'production' alias, served by a
+    StubMlflowClient that model_loader creates in place of mlflow's.
+    """
+    import joblib
+    import model_loader
+
+    preprocessor, model = fit_stub_model("ridge", *training_laps)
+    run_dir = tmp_path / "registry" / "run-1"
+    run_dir.mkdir(parents=True)
+    joblib.dump(preprocessor, run_dir / model_loader.PREPROCESSOR_ARTIFACT_NAME)
+    joblib.dump(model, run_dir / model_loader.MODEL_ARTIFACT_NAME)
+    client = StubMlflowClient(str(tmp_path / "registry"), {"production": ("1", "run-1"), "1": ("1", "run-1")})
+    monkeypatch.setattr(model_loader, "_mlflow_client", lambda: client)
+    return client
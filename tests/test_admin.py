@@ -0,0 +1,24 @@
+import pytest
+import app as api
+
+@pytest.fixture
+def client():
+    return api.app.test_client()
+
+def test_app_starts_without_reaching_a_registry():
+    from model_loader import model_loader
+    assert api.startup.finished
+    assert model_loader.model is None and not api.startup.ready
+
+@pytest.mark.parametrize("path", ["/admin/reload", "/admin/rollback"])
+def test_admin_is_disabled_without_a_token(client, monkeypatch, path):
+    monkeypatch.setattr(api, "ADMIN_TOKEN", None)
+    assert client.post(path).status_code == 403
+    assert client.post(path, headers={"X-Admin-Token": ""}).status_code == 403
+
+@pytest.mark.parametrize("path", ["/admin/reload", "/admin/rollback"])
+def test_admin_needs_the_configured_token(client, monkeypatch, path):
+    monkeypatch.setattr(api, "ADMIN_TOKEN", "secret")
+    assert client.post(path).status_code == 403
+    assert client.post(path, headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.post(path, headers={"X-Admin-Token": "secret"}).status_code != 403
@@ -0,0 +1,169 @@
+import os
+import model_loader
+from artifact_cache import ArtifactCache, file_sha256
+from conftest import make_laps, unreachable_registry
+from model_loader import MODEL_ARTIFACT_NAME, PREPROCESSOR_ARTIFACT_NAME, ModelLoader
+
+def _artifact(directory, name: str, size: int, fill: bytes = b"x") -> str:
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(fill * size)
+    return path
+
+def test_put_and_get_run(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    source = _artifact(tmp_path, "model.joblib", 100)
+    paths = cache.put_run("run-1", "1", {"model.joblib": source})
+    assert os.path.basename(paths["model.joblib"]) == file_sha256(source)
+    assert cache.get_run("run-1") == paths
+    assert cache.get_run("run-2") is None
+
+def test_corrupt_blob_fails_integrity_check(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    paths = cache.put_run("run-1", "1", {"model.joblib": _artifact(tmp_path, "model.joblib", 100)})
+    with open(paths["model.joblib"], "r+b") as f:
+        f.write(b"y") # Same size, different content
+
+    assert cache.get_run("run-1") is None
+    assert not os.path.exists(paths["model.joblib"]) # The corrupt run is dropped
+    assert cache.get_run("run-1") is None
+
+def test_size_checked_reads_skip_rehashing(tmp_path, monkeypatch):
+    import artifact_cache
+
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    paths = cache.put_run("run-1.lap_table", "1", {"times.npy": _artifact(tmp_path, "times.npy", 100)})
+    hashed = []
+    monkeypatch.setattr(artifact_cache, "file_sha256", lambda path: hashed.append(path))
+    assert cache.get_run("run-1.lap_table", verify=False) == paths
+    assert hashed == []
+
+    with open(paths["times.npy"], "ab") as f:
+        f.write(b"y") # Truncated or extended blobs still fail
+    assert cache.get_run("run-1.lap_table", verify=False) is None
+    assert not os.path.exists(paths["times.npy"])
+
+def test_least_recently_used_runs_are_evicted(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"), max_bytes=250)
+    cache.put_run("run-1", "1", {"model.joblib": _artifact(tmp_path, "a", 100, b"a")})
+    cache.put_run("run-2", "2", {"model.joblib": _artifact(tmp_path, "b", 100, b"b")})
+    os.utime(cache._manifest_path("run-1"), (1, 1))
+    os.utime(cache._manifest_path("run-2"), (2, 2))
+    assert cache.get_run("run-1") is not None # Now the most recently used
+
+    cache.put_run("run-3", "3", {"model.joblib": _artifact(tmp_path, "c", 100, b"c")})
+    assert cache.get_run("run-2") is None
+    assert cache.get_run("run-1") is not None
+    assert cache.get_run("run-3") is not None
+    assert len(os.listdir(tmp_path / "cache" / "blobs")) == 2 # Unreferenced blobs are deleted
+
+def test_run_larger_than_the_cache_is_kept(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"), max_bytes=50)
+    cache.put_run("run-1", "1", {"model.joblib": _artifact(tmp_path, "a", 100)})
+    assert cache.get_run("run-1") is not None
+
+def test_aliases_resolve_to_the_last_known_run(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    assert cache.resolve_alias("model", "production") is None
+    cache.set_alias("model", "production", "run-1", "1")
+    assert cache.resolve_alias("model", "production") == {"run_id": "run-1", "model_version": "1"}
+
+def test_startup_from_cache_with_the_registry_unreachable(tmp_path, stub_registry, monkeypatch):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    first = ModelLoader(cache=cache)
+    first.load()
+    assert first.source == "registry" and first.model_version == "1"
+    assert ("download_artifacts", MODEL_ARTIFACT_NAME) in stub_registry.calls
+
+    monkeypatch.setattr(model_loader, "_mlflow_client", unreachable_registry)
+    second = ModelLoader(cache=cache)
+    second._load_from_cache()
+    assert second.source == "cache"
+    assert second.run_id == "run-1" and second.model_version == "1"
+    assert second.preprocessor_sha256 == first.preprocessor_sha256
+    assert len(second.model.predict(second.preprocessor.transform(make_laps(5)[0]))) == 5
+    second._refresh_from_registry() # Logs a warning and keeps serving the cached model
+    assert second.source == "cache"
+
+def test_startup_without_cache_or_registry_loads_nothing(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_loader, "_mlflow_client", unreachable_registry)
+    loader = ModelLoader(cache=ArtifactCache(str(tmp_path / "cache")))
+    loader.load()
+    assert loader.model is None and loader.source is None
+
+def test_corrupt_cache_falls_back_to_the_registry(tmp_path, stub_registry):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    ModelLoader(cache=cache).load()
+    blob = cache.get_run("run-1")[PREPROCESSOR_ARTIFACT_NAME]
+    with open(blob, "r+b") as f:
+        f.write(b"\0")
+
+    loader = ModelLoader(cache=cache)
+    assert not loader._load_from_cache()
+    loader.load()
+    assert loader.source == "registry"
+    assert cache.get_run("run-1") is not None
+
+def test_missing_runs_are_remembered(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    assert not cache.is_missing("run-1.shards")
+    cache.put_missing("run-1.shards", "1")
+    assert cache.is_missing("run-1.shards")
+    assert cache.get_run("run-1.shards") is None
+    cache.forget("run-1.shards")
+    assert not cache.is_missing("run-1.shards")
+
+def _counting_unreachable_registry(monkeypatch) -> list:
+    calls = []
+    def client():
+        calls.append("_mlflow_client")
+        unreachable_registry()
+    monkeypatch.setattr(model_loader, "_mlflow_client", client)
+    return calls
+
+def test_cached_start_does_not_ask_the_registry_for_missing_artifacts(tmp_path, stub_registry, monkeypatch):
+    from degradation_curves import load_degradation_curves
+    from lap_table import load_lap_table
+    from track_shards import load_track_shards
+
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    online = ModelLoader(cache=cache)
+    online.load()
+    assert load_track_shards(online, online.run_id, online.model_version) is None
+    assert load_degradation_curves(online, online.run_id, online.model_version) is None
+    assert load_lap_table(online, online.run_id, online.model_version) is None
+    assert all(cache.is_missing(f"run-1.{kind}") for kind in ("shards", "curves", "lap_table"))
+
+    calls = _counting_unreachable_registry(monkeypatch)
+    offline = ModelLoader(cache=cache)
+    assert offline._load_from_cache()
+    assert load_track_shards(offline, offline.run_id, offline.model_version) is None
+    assert load_degradation_curves(offline, offline.run_id, offline.model_version) is None
+    assert load_lap_table(offline, offline.run_id, offline.model_version) is None
+    assert calls == []
+
+def test_unreachable_registry_is_not_cached_as_missing(tmp_path, stub_registry, monkeypatch):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    loader = ModelLoader(cache=cache)
+    loader.load()
+    calls = _counting_unreachable_registry(monkeypatch)
+    assert loader.fetch_shard_manifest(loader.run_id, loader.model_version) is None
+    assert calls == ["_mlflow_client"]
+    assert not cache.is_missing("run-1.shards")
+
+def test_registry_check_picks_up_artifacts_added_later(tmp_path, stub_registry):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    loader = ModelLoader(cache=cache)
+    loader.load()
+    assert loader.fetch_shard_manifest(loader.run_id, loader.model_version) is None
+
+    shards_dir = tmp_path / "registry" / "run-1" / "shards"
+    shards_dir.mkdir()
+    (shards_dir / "manifest.json").write_text('{"shards": {}, "tracks": {}}')
+    cached = ModelLoader(cache=cache)
+    assert cached._load_from_cache()
+    cached._refresh_from_registry()
+    assert not cache.is_missing("run-1.shards")
+    stub_registry.calls.clear()
+    assert cached.fetch_shard_manifest(cached.run_id, cached.model_version) == {"shards": {}, "tracks": {}}
+    assert stub_registry.calls == []
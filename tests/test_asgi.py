@@ -0,0 +1,171 @@
+import threading
+import time
+import pytest
+from starlette.testclient import TestClient
+import app as flask_api
+import asgi_app
+import metrics
+from conftest import fit_stub_model
+from micro_batcher import InferenceTimeout
+from simulator import ModelBundle, simulator
+
+STRATEGY = {"track": "Bahrain", "driver": "VER", "stints": [{"compound": "soft", "laps": 18}, {"compound": "hard", "laps": 39}]}
+RACE = {"track": "Monza", "driver": "HAM", "total_laps": 30, "max_stops": 2}
+
+@pytest.fixture(scope="module")
+def served(training_laps):
+    """
+    A stub model made the active one for the module, as a loaded API would have it.
+    """
+    preprocessor, model = fit_stub_model("ridge", *training_laps)
+    active, previous = simulator.active, simulator.previous
+    simulator.swap(ModelBundle(model, preprocessor, "test-asgi"))
+    yield simulator.active
+    simulator.swap(active)
+    simulator.previous = previous
+
+@pytest.fixture
+def client(served):
+    # Not entered as a context manager: the lifespan would start the API and shut down its pool.
+    return TestClient(asgi_app.app)
+
+@pytest.fixture
+def flask_client(served):
+    return flask_api.app.test_client()
+
+@pytest.mark.parametrize("path, payload, headers", [
+    ("/simulate", STRATEGY, {}),
+    ("/simulate", STRATEGY, {"Accept": "application/vnd.f1-strategy.columnar+json"}),
+    ("/simulate", STRATEGY, {"Accept": "application/msgpack"}),
+    ("/simulate", {"track": "Bahrain"}, {}),
+    ("/simulate/batch", {"strategies": [STRATEGY, {"track": "Bahrain"}]}, {}),
+    ("/simulate/batch", {"strategies": [STRATEGY]}, {"Accept": "application/x-ndjson"}),
+    ("/simulate/monte-carlo", {**STRATEGY, "n_samples": 20, "seed": 3}, {}),
+    ("/optimize", RACE, {}),
+    ("/solve", RACE, {"Accept": "application/vnd.f1-strategy.columnar+json"}),
+    ("/pit-window", RACE, {}),
+    ("/optimize", {"track": "Monza"}, {}),
+    ("/solve?format=xml", RACE, {}),
+])
+def test_responses_match_flask(client, flask_client, path, payload, headers):
+    expected = flask_client.post(path, json=payload, headers=headers)
+    actual = client.post(path, json=payload, headers=headers)
+    assert actual.status_code == expected.status_code
+    assert actual.headers["content-type"] == expected.headers["Content-Type"]
+    assert actual.headers["x-model-version"] == expected.headers["X-Model-Version"]
+    assert actual.content == expected.get_data()
+
+def test_unknown_model_is_a_404_on_both(client, flask_client):
+    assert client.post("/optimize?model=nope", json=RACE).status_code == 404
+    assert flask_client.post("/optimize?model=nope", json=RACE).status_code == 404
+
+def test_full_queue_is_turned_away_with_429(client, monkeypatch):
+    slots = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(asgi_app, "pending_slots", slots)
+    slots.acquire() # Another request holds the only slot
+    try:
+        response = client.post("/optimize", json=RACE)
+    finally:
+        slots.release()
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == str(asgi_app.ASYNC_RETRY_AFTER_SECONDS)
+    assert client.post("/optimize", json=RACE).status_code == 200
+
+def test_slow_requests_time_out_with_504(client, monkeypatch):
+    finished = threading.Event()
+    def slow(*args):
+        time.sleep(0.3)
+        finished.set()
+        return {}
+    monkeypatch.setattr(asgi_app, "ASYNC_REQUEST_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(simulator, "run_simulation", slow)
+
+    response = client.post("/simulate", json={**STRATEGY, "driver": "LEC"})
+    assert response.status_code == 504
+    assert "timed out" in response.json()["error"]
+    assert finished.wait(2) # The running job finishes in the background; its slot is then freed
+
+def test_stuck_inference_queue_is_a_503(client, monkeypatch):
+    def stuck(*args):
+        raise InferenceTimeout("Inference did not finish within 30 seconds.")
+    monkeypatch.setattr(simulator, "run_simulation", stuck)
+    response = client.post("/simulate", json={**STRATEGY, "driver": "NOR"})
+    assert response.status_code == 503
+
+def test_streams_run_on_the_pool_and_hold_a_pending_slot(client, monkeypatch):
+    slots = threading.BoundedSemaphore(2)
+    monkeypatch.setattr(asgi_app, "pending_slots", slots)
+    steps = []
+    def stream(strategy):
+        def lines():
+            for lap in range(3):
+                steps.append((threading.current_thread().name, slots._value))
+                yield {"lap": lap}
+        return lines()
+    monkeypatch.setattr(simulator, "stream_simulation", stream)
+
+    response = client.post("/simulate?stream=1", json=STRATEGY)
+    assert response.status_code == 200
+    assert [line for line in response.text.splitlines()] == ['{"lap":0}', '{"lap":1}', '{"lap":2}']
+    assert all(thread.startswith("inference") and free == 1 for thread, free in steps)
+    deadline = time.monotonic() + 2
+    while slots._value != 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert slots._value == 2 # Released once the stream ended
+
+    slots.acquire(), slots.acquire()
+    try:
+        assert client.post("/simulate?stream=1", json=STRATEGY).status_code == 429
+    finally:
+        slots.release(), slots.release()
+
+def test_slow_stream_chunks_end_the_stream_with_an_error(client, monkeypatch):
+    def stream(strategy):
+        def lines():
+            yield {"lap": 0}
+            time.sleep(0.3)
+            yield {"lap": 1}
+        return lines()
+    monkeypatch.setattr(asgi_app, "ASYNC_REQUEST_TIMEOUT_SECONDS", 0.1)
+    monkeypatch.setattr(simulator, "stream_simulation", stream)
+
+    lines = client.post("/simulate?stream=1", json=STRATEGY).text.splitlines()
+    assert lines[0] == '{"lap":0}'
+    assert lines[-1] == '{"error":"Request timed out after 0.1 seconds."}'
+
+@pytest.mark.parametrize("use_flask", [False, True])
+def test_cached_simulations_vary_on_accept(client, flask_client, use_flask):
+    post = flask_client.post if use_flask else client.post
+    strategy = {**STRATEGY, "driver": "RUS"}
+    msgpack = {"Accept": "application/msgpack"}
+    records = post("/simulate", json=strategy)
+    packed = post("/simulate", json=strategy, headers=msgpack)
+    assert records.headers["Vary"] == packed.headers["Vary"] == "Accept"
+    assert records.headers["ETag"] != packed.headers["ETag"]
+
+    # A records ETag must not revalidate the msgpack body, and vice versa.
+    stale = post("/simulate", json=strategy, headers={**msgpack, "If-None-Match": records.headers["ETag"]})
+    assert stale.status_code == 200 and stale.headers["X-Cache"] == "HIT"
+    assert stale.headers["Content-Type"] == "application/msgpack"
+    fresh = post("/simulate", json=strategy, headers={**msgpack, "If-None-Match": packed.headers["ETag"]})
+    assert fresh.status_code == 304 and fresh.headers["Vary"] == "Accept"
+
+def _requests_total(client, endpoint: str, status: int) -> float:
+    """
+    f1_api_requests_total for one endpoint and status, as scraped from /metrics.
+    """
+    prefix = f'f1_api_requests_total{{endpoint="{endpoint}",status="{status}"}} '
+    lines = [line for line in client.get("/metrics").text.splitlines() if line.startswith(prefix)]
+    return float(lines[0][len(prefix):]) if lines else 0.0
+
+def test_requests_are_counted_and_timed(client, monkeypatch):
+    before = _requests_total(client, "/optimize", 200), _requests_total(client, "/optimize", 404)
+    assert client.post("/optimize", json=RACE).status_code == 200
+    assert client.post("/optimize?model=nope", json=RACE).status_code == 404
+    assert (_requests_total(client, "/optimize", 200), _requests_total(client, "/optimize", 404)) == (before[0] + 1, before[1] + 1)
+    assert 'f1_api_request_duration_seconds_count{endpoint="/optimize"}' in client.get("/metrics").text
+
+    monkeypatch.setattr(metrics, "SERVER_TIMING_ENABLED", True)
+    timing = client.post("/simulate", json={**STRATEGY, "driver": "ALO"}).headers["server-timing"]
+    # Stages timed on the inference pool are reported, like Flask's.
+    assert "inference;dur=" in timing and timing.split(", ")[-1].startswith("total;dur=")
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+from encoder import compile_preprocessor
+from conftest import DRIVERS, NUMERICAL, TRACKS
+from model.preprocessing import create_preprocessor
+
+CATEGORICAL = ["compound", "track", "year", "driver"]
+UNKNOWN = {"compound": "wet", "track": "Atlantis", "year": 1999, "driver": "XXX"}
+
+def _categories(preprocessor) -> dict:
+    """
+    The fitted categories of each column as plain Python values, the dropped one first.
+    """
+    one_hot = preprocessor.named_transformers_["cat"]
+    return {column: values.tolist() for column, values in zip(CATEGORICAL, one_hot.categories_)}
+
+def _laps(preprocessor) -> list:
+    """
+    Laps covering every category (the dropped first ones included), unknown categories in
+    each column, and passthrough values including zeros and negatives.
+    """
+    categories = _categories(preprocessor)
+    laps = []
+    for row in range(max(len(values) for values in categories.values())):
+        laps.append({
+            **{column: values[row % len(values)] for column, values in categories.items()},
+            "tyrelife": float(row), "lapnumber": float(row * 3), "airtemp": -5.5 + row, "tracktemp": 0.0,
+        })
+    for column, unknown in UNKNOWN.items():
+        laps.append({**laps[0], column: unknown})
+    return laps
+
+@pytest.mark.filterwarnings("ignore:Found unknown categories")
+def test_compiled_encoder_matches_column_transformer(stub_model):
+    _, preprocessor, _ = stub_model
+    laps = _laps(preprocessor)
+    encoder = compile_preprocessor(preprocessor)
+    assert encoder is not None
+
+    expected = preprocessor.transform(pd.DataFrame(laps))
+    actual = encoder.transform(laps)
+    assert sparse.issparse(expected) == sparse.issparse(actual)
+    assert expected.shape == actual.shape
+    expected = expected.toarray() if sparse.issparse(expected) else expected
+    actual = actual.toarray() if sparse.issparse(actual) else actual
+    np.testing.assert_array_equal(actual, expected)
+
+@pytest.mark.filterwarnings("ignore:Found unknown categories")
+def test_compiled_encoder_matches_sparse_output(training_laps):
+    # The full training data (every track and driver) is sparse; the stub data is not, so force it.
+    laps, _ = training_laps
+    preprocessor = create_preprocessor(laps, CATEGORICAL, NUMERICAL).set_params(sparse_threshold=1.0).fit(laps)
+    rows = _laps(preprocessor)
+    expected = preprocessor.transform(pd.DataFrame(rows))
+    actual = compile_preprocessor(preprocessor).transform(rows)
+    assert sparse.issparse(expected) and sparse.issparse(actual)
+    np.testing.assert_array_equal(actual.toarray(), expected.toarray())
+
+def test_dropped_and_unknown_categories_encode_as_zeros(stub_model):
+    _, preprocessor, _ = stub_model
+    encoder = compile_preprocessor(preprocessor)
+    n_categorical = preprocessor.output_indices_["cat"].stop
+    dropped = {column: values[0] for column, values in _categories(preprocessor).items()}
+    numbers = {"tyrelife": 3.0, "lapnumber": 10.0, "airtemp": 25.0, "tracktemp": 35.0}
+    for categories in (dropped, UNKNOWN):
+        row = encoder.transform([{**categories, **numbers}])
+        row = row.toarray() if sparse.issparse(row) else row
+        assert not row[0, :n_categorical].any()
+        np.testing.assert_array_equal(row[0, n_categorical:], [3.0, 10.0, 25.0, 35.0])
+
+def test_models_predict_the_same_from_either_encoding(stub_model):
+    _, preprocessor, model = stub_model
+    laps = [
+        {"compound": compound, "track": track, "year": 2025, "driver": driver,
+         "tyrelife": float(tyre), "lapnumber": float(tyre + 5), "airtemp": 25.0, "tracktemp": 35.0}
+        for compound in ("soft", "medium", "hard") for track in TRACKS[:2] for driver in DRIVERS[:2] for tyre in (1, 20)
+    ]
+    encoder = compile_preprocessor(preprocessor)
+    np.testing.assert_array_equal(
+        model.predict(encoder.transform(laps)), model.predict(preprocessor.transform(pd.DataFrame(laps)))
+    )
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from conftest import fit_stub_model
+from degradation_curves import DegradationCurves, load_degradation_curves
+from model.distill import distill_degradation_curves, save_curves
+from optimizer import optimizer
+from pit_window import pit_window_analyzer
+from simulator import ModelBundle, simulator
+from solver import solver
+
+RACE = {"track": "Bahrain", "driver": "VER", "total_laps": 40, "air_temp": 25.0, "track_temp": 35.0}
+
+@pytest.fixture(scope="module")
+def distilled(training_laps):
+    """
+    A stub model, its preprocessor and the curves distilled from it.
+    """
+    laps, lap_times = training_laps
+    preprocessor, model = fit_stub_model("ridge", laps, lap_times)
+    curves = distill_degradation_curves(
+        lambda frame: model.predict(preprocessor.transform(frame)), laps, {"samples_per_curve": 200, "year": 2025}
+    )
+    return model, preprocessor, curves
+
+@pytest.fixture(scope="module")
+def bundle(distilled):
+    model, preprocessor, curves = distilled
+    return ModelBundle(model, preprocessor, "test-fast-path", curves=DegradationCurves(curves, max_error=5.0))
+
+@pytest.fixture
+def pinned(bundle):
+    token = simulator.pin(bundle)
+    yield bundle
+    simulator.unpin(token)
+
+def test_responses_report_approximated_lap_times(pinned):
+    for results in (optimizer.optimize(RACE), solver.solve(RACE), pit_window_analyzer.build_heatmap(RACE)):
+        assert results["lap_time_source"].get("degradation_curves", 0) > 0
+
+    monte_carlo = simulator.run_monte_carlo({**RACE, "stints": [{"compound": "soft", "laps": 15}, {"compound": "hard", "laps": 25}],
+                                             "n_samples": 10})
+    assert monte_carlo["lap_time_source"]["degradation_curves"] > 0
+
+def test_exact_responses_use_only_the_model(pinned):
+    race = {**RACE, "exact": True}
+    for results in (optimizer.optimize(race), solver.solve(race), pit_window_analyzer.build_heatmap(race)):
+        assert list(results["lap_time_source"]) == ["model"]
+
+def test_solver_trace_matches_run_simulation_with_approximations(pinned):
+    results = solver.solve(RACE)
+    assert results["lap_time_source"]["degradation_curves"] > 0
+    simulated = simulator.run_simulation({**RACE, "stints": results["plan"]["stints"]})
+    assert results["lap_records"] == simulated["lap_records"]
+    assert results["summary"] == simulated["summary"]
+
+def test_approximated_grid_is_close_to_the_model(pinned):
+    base_params = simulator._get_base_params(RACE)
+    sources = {}
+    fast = simulator.predict_lap_time_grid(base_params, ["soft", "hard"], 40, 30, sources=sources)
+    exact = simulator.predict_lap_time_grid(base_params, ["soft", "hard"], 40, 30, exact=True)
+    reachable = np.isfinite(exact)
+    assert np.array_equal(np.isfinite(fast), reachable)
+    assert sum(sources.values()) == reachable.sum()
+    assert np.abs(fast[reachable] - exact[reachable]).max() < 0.5
+
+class CurvesLoader:
+    def __init__(self, curves):
+        self.curves = curves
+
+    def fetch_curves(self, run_id, model_version):
+        return self.curves
+
+def test_curves_are_loaded_only_on_the_basis_they_were_fitted_on(distilled, tmp_path):
+    _, _, curves = distilled
+    with np.load(save_curves(curves, str(tmp_path / "curves.npz")), allow_pickle=False) as saved:
+        logged = {name: saved[name] for name in saved.files} # As ModelLoader.fetch_curves returns them
+    assert isinstance(load_degradation_curves(CurvesLoader(logged), "run-1", "1"), DegradationCurves)
+
+    older = {name: value for name, value in logged.items() if name not in ("basis_terms", "basis_probe", "basis_probe_design")}
+    reordered = {**logged, "basis_terms": logged["basis_terms"][[0, 2, 1, *range(3, len(logged["basis_terms"]))]]}
+    moved_knots = {**logged, "knots": logged["knots"] + 1.0}
+    other_scaling = {**logged, "basis_probe_design": logged["basis_probe_design"] * 1.01}
+    for curves_on_another_basis in (older, reordered, moved_knots, other_scaling):
+        assert load_degradation_curves(CurvesLoader(curves_on_another_basis), "run-1", "1") is None
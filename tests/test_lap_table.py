@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+import numpy as np
+import pytest
+import artifact_cache
+import lap_table
+import model_loader
+from artifact_cache import ArtifactCache
+from build_lap_table import build_table, check_accuracy
+from conftest import unreachable_registry
+from lap_table import LapTimeTable, attach_lap_table, load_lap_table
+from model_loader import LAP_TABLE_DIR, ModelLoader
+from simulator import ModelBundle, simulator
+
+SPEC = {
+    "year": 2025,
+    "drivers": ["VER", "HAM"],
+    "compounds": ["soft", "hard"],
+    "air_temps": [10.0, 20.0, 30.0, 40.0],
+    "track_temps": [15.0, 25.0, 35.0, 45.0, 55.0],
+    "max_tyrelife": 20,
+    "max_lapnumbers": {"Bahrain": 25, "Monza": 30},
+}
+
+@pytest.fixture(scope="module")
+def built(stub_model, tmp_path_factory):
+    """
+    A stub model's bundle and the small table built for it: (bundle, index, table directory).
+    """
+    model_name, preprocessor, model = stub_model
+    bundle = ModelBundle(model, preprocessor, f"test-lap-table-{model_name}", run_id="run-1")
+    output_dir = str(tmp_path_factory.mktemp(f"lap_table_{model_name}"))
+    index = build_table(bundle, SPEC, output_dir)
+    with open(f"{output_dir}/index.json", "w") as f:
+        json.dump(index, f)
+    return bundle, index, output_dir
+
+def _table(index: dict, output_dir: str) -> LapTimeTable:
+    return LapTimeTable(index, np.load(f"{output_dir}/times.npy", mmap_mode="r"))
+
+def test_table_matches_the_model_on_its_grid(built):
+    bundle, index, output_dir = built
+    table = _table(index, output_dir)
+    rng = np.random.default_rng(0)
+    laps, looked_up = [], []
+    for _ in range(300):
+        track, driver, compound = list(table.slabs)[int(rng.integers(len(table.slabs)))]
+        lap_number = int(rng.integers(1, table.max_lapnumbers[track] + 1))
+        lap = {
+            "track": track, "driver": driver, "year": table.year, "compound": compound,
+            "tyrelife": float(rng.integers(1, min(lap_number, table.max_tyrelife) + 1)), "lapnumber": float(lap_number),
+            "airtemp": float(rng.choice(table.air_temps)), "tracktemp": float(rng.choice(table.track_temps)),
+        }
+        slab = table.find(lap, compound)
+        looked_up.append(table.evaluate(slab, [lap["tyrelife"]], [lap["lapnumber"]], lap["airtemp"], lap["tracktemp"])[0])
+        laps.append(lap)
+    np.testing.assert_allclose(looked_up, simulator._predict_rows(bundle, laps), atol=1e-3)
+
+def test_table_error_between_grid_points(built):
+    bundle, index, output_dir = built
+    accuracy = check_accuracy(bundle, index, output_dir, samples=2000, seed=0)
+    assert accuracy["p99_abs_error"] < 0.5
+    assert abs(accuracy["mean_error"]) < 0.1
+
+def test_simulator_answers_from_the_table(built):
+    bundle, index, output_dir = built
+    tabled = ModelBundle(bundle.model, bundle.preprocessor, bundle.model_version, encoder=bundle.encoder,
+                         lap_table=_table(index, output_dir))
+    base_params = {"track": "Bahrain", "driver": "VER", "year": 2025, "airtemp": 23.4, "tracktemp": 38.9}
+    token = simulator.pin(tabled)
+    try:
+        sources = {}
+        fast = simulator.predict_lap_time_grid(base_params, ["soft", "hard"], 25, 20, sources=sources)
+        exact = simulator.predict_lap_time_grid(base_params, ["soft", "hard"], 25, 20, exact=True)
+    finally:
+        simulator.unpin(token)
+    reachable = np.isfinite(exact)
+    assert sources == {"lap_table": reachable.sum()}
+    assert np.abs(fast[reachable] - exact[reachable]).max() < 0.5
+
+def test_table_is_attached_in_the_background(built):
+    bundle, index, output_dir = built
+    released = threading.Event()
+
+    class SlowLoader:
+        def fetch_lap_table(self, run_id, model_version):
+            released.wait(5)
+            return {"index": index, "times": np.load(f"{output_dir}/times.npy", mmap_mode="r")}
+
+    attached = ModelBundle(bundle.model, bundle.preprocessor, bundle.model_version, run_id="run-1", encoder=bundle.encoder)
+    attach_lap_table(attached, SlowLoader(), background=True)
+    assert attached.lap_table is None # Served by the model meanwhile
+    released.set()
+    deadline = time.monotonic() + 5
+    while attached.lap_table is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert isinstance(attached.lap_table, LapTimeTable)
+
+@pytest.fixture
+def logged(built, stub_registry, tmp_path):
+    """
+    The built table logged into the stub registry's run, as scripts/build_lap_table.py does.
+    """
+    _, _, output_dir = built
+    run_dir = tmp_path / "registry" / "run-1" / LAP_TABLE_DIR
+    run_dir.mkdir()
+    for name in model_loader.LAP_TABLE_ARTIFACT_NAMES:
+        (run_dir / name).write_bytes(open(f"{output_dir}/{name}", "rb").read())
+    return stub_registry
+
+def test_cached_table_loads_offline_without_rehashing(logged, tmp_path, monkeypatch):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    online = ModelLoader(cache=cache)
+    online.load()
+    assert load_lap_table(online, online.run_id, online.model_version) is not None
+
+    monkeypatch.setattr(model_loader, "_mlflow_client", unreachable_registry)
+    hashed = []
+    original_sha256 = artifact_cache.file_sha256
+    monkeypatch.setattr(artifact_cache, "file_sha256", lambda path: hashed.append(path) or original_sha256(path))
+    offline = ModelLoader(cache=cache)
+    assert offline._load_from_cache()
+    table = load_lap_table(offline, offline.run_id, offline.model_version)
+    assert table is not None and len(table.slabs) == 8
+    assert hashed and table.times.filename not in hashed # The model artifacts are still hashed
+
+def test_background_attachment_is_off_when_configured(built, monkeypatch):
+    bundle, _, _ = built
+    loads = []
+
+    class CountingLoader:
+        def fetch_lap_table(self, run_id, model_version):
+            loads.append(threading.current_thread().name)
+            return None
+
+    monkeypatch.setattr(lap_table, "LAP_TABLE_IN_BACKGROUND", False)
+    attach_lap_table(ModelBundle(bundle.model, bundle.preprocessor, run_id="run-1", encoder=bundle.encoder), CountingLoader())
+    assert loads == [threading.current_thread().name]
@@ -0,0 +1,95 @@
+import threading
+import time
+import numpy as np
+import pytest
+from micro_batcher import InferenceTimeout, MicroBatcher
+
+def _echo(bundle, laps):
+    return np.asarray([lap["value"] for lap in laps], dtype=float)
+
+def test_lone_request_does_not_wait_for_the_window():
+    batcher = MicroBatcher(_echo, window_ms=500.0)
+    started = time.perf_counter()
+    np.testing.assert_array_equal(batcher.predict("bundle", [{"value": 1.0}, {"value": 2.0}]), [1.0, 2.0])
+    assert time.perf_counter() - started < 0.25
+
+def test_requests_queued_behind_a_running_batch_share_the_next_one():
+    release = threading.Event()
+    calls = []
+
+    def predict_rows(bundle, laps):
+        calls.append(len(laps))
+        if len(calls) == 1:
+            release.wait(5)
+        return _echo(bundle, laps)
+
+    batcher = MicroBatcher(predict_rows, window_ms=50.0)
+    results = {}
+
+    def request(value):
+        results[value] = batcher.predict("bundle", [{"value": value}])
+
+    first = threading.Thread(target=request, args=(0.0,))
+    first.start()
+    while not calls:
+        time.sleep(0.001)
+    others = [threading.Thread(target=request, args=(float(value),)) for value in range(1, 5)]
+    for thread in others:
+        thread.start()
+    while batcher._queue.qsize() < len(others):
+        time.sleep(0.001)
+    release.set()
+    for thread in [first, *others]:
+        thread.join(5)
+
+    assert calls == [1, 4]
+    assert {value: float(result[0]) for value, result in results.items()} == {float(v): float(v) for v in range(5)}
+
+def test_stuck_batch_times_out_and_skips_abandoned_requests():
+    release = threading.Event()
+    calls = []
+
+    def predict_rows(bundle, laps):
+        calls.append(len(laps))
+        release.wait(5)
+        return _echo(bundle, laps)
+
+    batcher = MicroBatcher(predict_rows, window_ms=1.0, timeout_seconds=0.05)
+    stuck = threading.Thread(target=lambda: pytest.raises(InferenceTimeout, batcher.predict, "bundle", [{"value": 1.0}]))
+    stuck.start()
+    while not calls:
+        time.sleep(0.001)
+    with pytest.raises(InferenceTimeout):
+        batcher.predict("bundle", [{"value": 2.0}]) # Queued behind the stuck batch
+    release.set()
+    stuck.join(5)
+
+    np.testing.assert_array_equal(batcher.predict("bundle", [{"value": 3.0}]), [3.0])
+    assert calls == [1, 1] # The abandoned request was never predicted
+    assert batcher.stats()["timeouts"] == 2
+
+def test_track_shards_load_outside_the_batcher_thread(training_laps):
+    from conftest import fit_stub_model, make_laps
+    from simulator import ModelBundle, simulator
+    from track_shards import TrackShards
+
+    preprocessor, model = fit_stub_model("ridge", *training_laps)
+    loading_threads = []
+
+    class Loader:
+        def fetch_shard(self, run_id, model_version, shard_path):
+            loading_threads.append(threading.current_thread().name)
+            return {"preprocessor": preprocessor, "model": model, "preprocessor_sha256": None}
+
+    manifest = {"tracks": {"Bahrain": "bahrain"}, "shards": {"bahrain": {"path": "shards/bahrain"}}}
+    bundle = ModelBundle(model, preprocessor, "test-prefetch", run_id="run-1",
+                         shards=TrackShards(Loader(), "run-1", "test-prefetch", manifest))
+    laps = make_laps(20, seed=2)[0].to_dict("records")
+    token = simulator.pin(bundle)
+    try:
+        predictions = simulator._predict_lap_times(laps)
+    finally:
+        simulator.unpin(token)
+
+    assert len(predictions) == 20 and np.all(np.isfinite(predictions))
+    assert loading_threads == [threading.current_thread().name]
@@ -0,0 +1,69 @@
+import itertools
+import numpy as np
+import pytest
+from conftest import fit_stub_model
+from optimizer import count_dry_compounds, optimizer, parse_search_options
+from simulator import ModelBundle, simulator
+from solver import solver
+
+RACE = {"track": "Bahrain", "driver": "VER", "total_laps": 14, "max_stops": 2, "min_stint_laps": 3,
+        "pit_loss": 2.0, "top_k": 5}
+
+@pytest.fixture(scope="module")
+def bundle(training_laps):
+    preprocessor, model = fit_stub_model("ridge", *training_laps)
+    return ModelBundle(model, preprocessor, "test-optimizer")
+
+@pytest.fixture
+def pinned(bundle):
+    token = simulator.pin(bundle)
+    yield bundle
+    simulator.unpin(token)
+
+def _brute_force(race: dict) -> list:
+    """
+    Every legal stint plan of the race, scored from the model's lap time grid, fastest first.
+    """
+    options = parse_search_options(race)
+    compounds = list(dict.fromkeys(options["compounds"]))
+    total_laps = options["total_laps"]
+    grid = simulator.predict_lap_time_grid(simulator._get_base_params(race), compounds, total_laps, total_laps, exact=True)
+    plans = []
+    for stops in range(options["max_stops"] + 1):
+        for pit_laps in itertools.combinations(range(1, total_laps), stops):
+            boundaries = [0, *pit_laps, total_laps]
+            lengths = np.diff(boundaries)
+            if lengths.min() < options["min_stint_laps"] or lengths.max() > options["max_stint_laps"]:
+                continue
+            for sequence in itertools.product(range(len(compounds)), repeat=stops + 1):
+                if count_dry_compounds(compounds[c] for c in sequence) < options["min_compounds"]:
+                    continue
+                total = stops * options["pit_loss"] + sum(
+                    grid[compound, np.arange(1, length + 1), np.arange(start + 1, start + length + 1)].sum()
+                    for compound, start, length in zip(sequence, boundaries, lengths)
+                )
+                plans.append((float(total), [compounds[c] for c in sequence], list(pit_laps)))
+    return sorted(plans, key=lambda plan: plan[0])
+
+@pytest.mark.parametrize("compounds", [["soft", "medium", "hard"], ["soft", "hard", "intermediate"]])
+def test_optimizer_and_solver_agree_with_brute_force(pinned, compounds):
+    race = {**RACE, "compounds": compounds}
+    expected = _brute_force(race)
+    strategies = optimizer.optimize(race)["strategies"]
+    assert [s["total_race_time"] for s in strategies] == pytest.approx([round(p[0], 3) for p in expected[:5]], abs=1e-6)
+    assert strategies[0]["pit_laps"] == expected[0][2]
+    assert [stint["compound"] for stint in strategies[0]["stints"]] == expected[0][1]
+
+    plan = solver.solve(race)["plan"]
+    assert plan["total_race_time"] == pytest.approx(round(expected[0][0], 3), abs=1e-6)
+
+def test_wet_compounds_do_not_count_towards_min_compounds(pinned):
+    race = {**RACE, "compounds": ["soft", "intermediate", "wet"]}
+    with pytest.raises(ValueError, match="dry compounds"):
+        optimizer.optimize(race)
+
+    # One dry compound plus an intermediate stint is legal only without the two-compound rule.
+    for strategy in optimizer.optimize({**race, "min_compounds": 1})["strategies"]:
+        assert count_dry_compounds(stint["compound"] for stint in strategy["stints"]) >= 1
+    for strategy in optimizer.optimize({**RACE, "compounds": ["soft", "medium", "intermediate"]})["strategies"]:
+        assert count_dry_compounds(stint["compound"] for stint in strategy["stints"]) >= 2
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from scipy import sparse
+from conftest import CATEGORICAL, NUMERICAL, fit_stub_model, make_laps
+from predictors import BoosterPredictor, build_predictor
+from tree_ensemble import compile_tree_ensemble
+
+@pytest.fixture(scope="module", params=["random_forest", "xgboost"])
+def tree_model(request, training_laps):
+    """
+    (fitted model, features of laps it was not trained on) for each compilable model type.
+    """
+    preprocessor, model = fit_stub_model(request.param, *training_laps)
+    laps, _ = make_laps(2000, seed=1)
+    return model, preprocessor.transform(laps)
+
+def test_compiled_ensemble_matches_predict_exactly(tree_model):
+    model, features = tree_model
+    ensemble = compile_tree_ensemble(model)
+    assert ensemble is not None
+    np.testing.assert_array_equal(ensemble.predict(features), np.asarray(model.predict(features), dtype=float))
+
+def test_predictions_do_not_depend_on_the_batch(tree_model):
+    model, features = tree_model
+    for backend in ("auto", "compiled", "native"):
+        predictor = build_predictor(model, sample_features=features[:60], backend=backend)
+        batched = predictor.predict(features)
+        one_by_one = np.concatenate([predictor.predict(features[row:row + 1]) for row in range(0, 300)])
+        np.testing.assert_array_equal(batched[:300], one_by_one)
+        np.testing.assert_array_equal(batched, np.asarray(model.predict(features), dtype=float))
+
+@pytest.mark.parametrize("early_stopping_rounds", [None, 5])
+def test_booster_inplace_predict_matches_xgbregressor_on_csr_features(training_laps, early_stopping_rounds):
+    from model.models import get_xgboost_model
+    from model.preprocessing import create_preprocessor
+
+    laps, lap_times = training_laps
+    # The full training data encodes to CSR (the stub data does not), so force it.
+    preprocessor = create_preprocessor(laps, CATEGORICAL, NUMERICAL).set_params(sparse_threshold=1.0).fit(laps)
+    features = preprocessor.transform(laps)
+    assert sparse.isspmatrix_csr(features)
+    model = get_xgboost_model({"n_estimators": 200, "early_stopping_rounds": early_stopping_rounds})
+    model.fit(features[:2500], lap_times[:2500], eval_set=[(features[2500:], lap_times[2500:])], verbose=False)
+    if early_stopping_rounds:
+        assert model.best_iteration < 199 # predict stops at the best round; so must the Booster
+
+    unseen = preprocessor.transform(make_laps(1000, seed=2)[0])
+    np.testing.assert_array_equal(BoosterPredictor(model).predict(unseen), np.asarray(model.predict(unseen), dtype=float))
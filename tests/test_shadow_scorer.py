@@ -0,0 +1,34 @@
+from conftest import fit_stub_model
+from metrics import INFERENCE_BATCH_ROWS, STAGE_SECONDS
+from shadow_scorer import SHADOW_PREDICT_SECONDS, ShadowScorer
+from simulator import ModelBundle, simulator
+
+STRATEGY = {"track": "Monza", "driver": "VER", "stints": [{"compound": "medium", "laps": 25}, {"compound": "hard", "laps": 28}]}
+
+class CandidateModels:
+    def __init__(self, candidate):
+        self.candidate = candidate
+
+    def get(self, name=None):
+        return self.candidate
+
+def _counts(histogram) -> dict:
+    """
+    Observations per label combination so far.
+    """
+    return {labels: sum(series[:-1]) for labels, series in histogram._series.items()}
+
+def test_shadow_scoring_stays_out_of_the_serving_metrics(training_laps):
+    preprocessor, model = fit_stub_model("ridge", *training_laps)
+    production = ModelBundle(model, preprocessor, "test-shadow-production")
+    preprocessor, model = fit_stub_model("xgboost", *training_laps)
+    candidate = ModelBundle(model, preprocessor, "test-shadow-candidate")
+    scorer = ShadowScorer(simulator, CandidateModels(candidate), candidate="candidate")
+    serving_before = _counts(INFERENCE_BATCH_ROWS), _counts(STAGE_SECONDS)
+    shadow_before = _counts(SHADOW_PREDICT_SECONDS)
+
+    scorer._score(STRATEGY, production)
+    assert scorer.scored == 1 and scorer.errors == 0
+    assert (_counts(INFERENCE_BATCH_ROWS), _counts(STAGE_SECONDS)) == serving_before
+    for role in ("production", "candidate"):
+        assert _counts(SHADOW_PREDICT_SECONDS)[(role,)] == shadow_before.get((role,), 0) + 1
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+from predictors import build_predictor
+from simulator import ModelBundle, simulator
+from tree_ensemble import compile_tree_ensemble
+
+STRATEGY = {
+    "track": "Bahrain", "driver": "VER",
+    "stints": [{"compound": "soft", "laps": 18}, {"compound": "hard", "laps": 22}, {"compound": "medium", "laps": 17}],
+}
+OTHER = {"track": "Bahrain", "driver": "HAM", "stints": [{"compound": "medium", "laps": 30}, {"compound": "hard", "laps": 27}]}
+
+def _predictor_backends(model) -> list:
+    """
+    The backends build_predictor can select for a model: its native path, and the compiled
+    tree ensemble when the model has one.
+    """
+    return ["native", "compiled"] if compile_tree_ensemble(model) is not None else ["native"]
+
+def _per_lap(preprocessor, model, laps: list) -> list:
+    """
+    The lap times of a race predicted one lap at a time with the model itself, rounded like the responses.
+    """
+    return [round(float(model.predict(preprocessor.transform(pd.DataFrame([lap])))[0]), 3) for lap in laps]
+
+def test_batched_simulation_matches_per_lap_prediction(stub_model):
+    model_name, preprocessor, model = stub_model
+    for backend in _predictor_backends(model):
+        # A version of its own, so no prediction is answered from another test's cache entries.
+        bundle = ModelBundle(model, preprocessor, f"test-exact-{model_name}-{backend}")
+        bundle.predictor = build_predictor(model, sample_features=bundle.sample_features, backend=backend)
+        token = simulator.pin(bundle)
+        try:
+            results = simulator.run_simulation(STRATEGY)
+            batch = simulator.run_batch([OTHER, STRATEGY])
+        finally:
+            simulator.unpin(token)
+
+        laps = simulator._build_lap_features(STRATEGY["stints"], simulator._get_base_params(STRATEGY))
+        expected = _per_lap(preprocessor, model, laps)
+        assert [record["LapTimeInSeconds"] for record in results["lap_records"]] == expected, bundle.predictor.name
+        assert batch["results"][1]["lap_records"] == results["lap_records"]
+        assert results["summary"]["average_lap_time"] == float(np.round(np.mean(expected), 3))
+
+def test_requests_for_another_version_hit_the_prediction_cache(stub_model):
+    model_name, preprocessor, model = stub_model
+    other = ModelBundle(model, preprocessor, f"test-other-version-{model_name}")
+    assert other is not simulator.active
+
+    def simulate_on(bundle) -> tuple:
+        token = simulator.pin(bundle)
+        try:
+            before = simulator.cache.stats()
+            results = simulator.run_simulation(OTHER)
+        finally:
+            simulator.unpin(token)
+        after = simulator.cache.stats()
+        return results, after["hits"] - before["hits"], after["misses"] - before["misses"]
+
+    first, _, misses = simulate_on(other)
+    again, hits, no_misses = simulate_on(other)
+    assert misses == hits == 57 and no_misses == 0
+    assert again == first
+    # Entries are per version: a different version never gets the first one's predictions.
+    _, hits, misses = simulate_on(ModelBundle(model, preprocessor, f"test-third-version-{model_name}"))
+    assert (hits, misses) == (0, 57)
@@ -0,0 +1,71 @@
+import pytest
+from conftest import fit_stub_model
+from simulator import STREAM_BATCH_CHUNK, ModelBundle, simulator
+
+STRATEGY = {"track": "Bahrain", "driver": "VER", "stints": [{"compound": "soft", "laps": 18}, {"compound": "hard", "laps": 39}]}
+
+@pytest.fixture(scope="module")
+def bundle(training_laps):
+    preprocessor, model = fit_stub_model("ridge", *training_laps)
+    return ModelBundle(model, preprocessor, "test-streaming")
+
+def _pinned(bundle, fn, *args):
+    token = simulator.pin(bundle)
+    try:
+        return fn(*args)
+    finally:
+        simulator.unpin(token)
+
+def test_streamed_simulation_matches_run_simulation(bundle):
+    expected = _pinned(bundle, simulator.run_simulation, STRATEGY)
+    lines = list(_pinned(bundle, simulator.stream_simulation, STRATEGY)) # Iterated after the request unpinned
+    assert [line["lap_record"] for line in lines[:-1]] == expected["lap_records"]
+    assert lines[-1] == {"summary": expected["summary"]}
+
+def test_streamed_simulation_predicts_one_stint_at_a_time(bundle, monkeypatch):
+    calls = []
+    predict = simulator._predict_lap_times
+    monkeypatch.setattr(simulator, "_predict_lap_times", lambda laps: calls.append(len(laps)) or predict(laps))
+
+    lines = _pinned(bundle, simulator.stream_simulation, STRATEGY)
+    assert calls == []
+    next(lines)
+    assert calls == [18]
+    list(lines)
+    assert calls == [18, 39]
+
+def test_streamed_simulation_validates_before_streaming(bundle):
+    with pytest.raises(ValueError):
+        _pinned(bundle, simulator.stream_simulation, {**STRATEGY, "stints": []})
+
+def test_streamed_batch_matches_run_batch_in_chunks(bundle, monkeypatch):
+    strategies = [
+        {**STRATEGY, "stints": [{"compound": "medium", "laps": 10 + index}, {"compound": "hard", "laps": 40}]}
+        for index in range(STREAM_BATCH_CHUNK + 5)
+    ]
+    strategies[3] = {"track": "Bahrain"} # Reported on its own line
+    expected = _pinned(bundle, simulator.run_batch, strategies)
+
+    chunks = []
+    predict_batch = simulator._predict_batch
+    monkeypatch.setattr(simulator, "_predict_batch", lambda chunk: chunks.append(len(chunk)) or predict_batch(chunk))
+    lines = _pinned(bundle, simulator.stream_batch, strategies)
+    assert chunks == []
+    lines = list(lines)
+    assert chunks == [STREAM_BATCH_CHUNK, 5]
+
+    for index, result in enumerate(expected["results"]):
+        streamed = [line for line in lines if line.get("strategy") == index]
+        if "error" in result:
+            assert streamed == [{"strategy": index, "error": result["error"]}]
+            continue
+        assert [line["lap_record"] for line in streamed[:-1]] == result["lap_records"]
+        assert streamed[-1]["summary"] == result["summary"]
+    assert lines[-1]["summary"]["total_laps"] == expected["total_laps"]
+
+def test_streamed_batch_reports_prediction_failures_in_the_stream(bundle, monkeypatch):
+    def fail(laps):
+        raise TimeoutError("stuck")
+    lines = _pinned(bundle, simulator.stream_batch, [STRATEGY])
+    monkeypatch.setattr(simulator, "_predict_lap_times", fail)
+    assert list(lines) == [{"error": "Prediction failed: stuck"}]
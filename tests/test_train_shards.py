@@ -0,0 +1,28 @@
+import json
+import os
+import pytest
+from conftest import CATEGORICAL, NUMERICAL, STUB_MODEL_PARAMS, fit_stub_model, make_laps
+
+pytest.importorskip("mlflow") # model.train logs to MLflow
+from model.train import train_track_shards
+
+def test_shards_of_a_previous_model_are_not_kept(tmp_path, training_laps):
+    laps, lap_times = training_laps
+    preprocessor, model = fit_stub_model("ridge", laps, lap_times)
+    test_laps, test_times = make_laps(800, seed=3)
+    stale = tmp_path / "shards" / "Old_Track"
+    stale.mkdir(parents=True)
+    (stale / "model.joblib").write_text("from an earlier model")
+
+    params = {
+        "features": {"categorical": CATEGORICAL, "numerical": NUMERICAL},
+        "sharding": {"min_rows": 500, "require_improvement": False},
+    }
+    manifest = train_track_shards(
+        laps, test_laps, lap_times, test_times, "ridge", STUB_MODEL_PARAMS["ridge"], params,
+        model, preprocessor, output_dir=str(tmp_path / "shards")
+    )
+
+    assert sorted(os.listdir(tmp_path / "shards")) == sorted([*manifest["shards"], "manifest.json"])
+    with open(tmp_path / "shards" / "manifest.json") as f:
+        assert json.load(f)["shards"].keys() == manifest["shards"].keys()